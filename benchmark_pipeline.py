@@ -0,0 +1,258 @@
+# benchmark_pipeline.py
+"""End-to-end pipeline benchmark on one machine.
+
+Starts the same services docker-compose runs, as local processes with
+LLM_PROVIDER=fake and TTS_ENGINE=fake, then drives simulated phone sessions
+over the WebSocket and reports end-to-end latency and throughput. Needs a reachable Redis
+(REDIS_URL, default redis://localhost:6379).
+
+    python benchmark_pipeline.py --sessions 20 --windows 10
+    python benchmark_pipeline.py --no-services   # against a running stack
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import zlib
+from datetime import datetime
+
+import websockets
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# (name, working directory, entry point) - mirrors docker-compose.yml
+SERVICES = [
+    ("websocket-server", "services/websocket-server", "websocket_server.py"),
+    ("audio-processor", "services/stt", "stt_engine.py"),
+    ("trigger-llm", "services/trigger-llm", "trigger_llm_handler.py"),
+    ("tts-service", "services/tts-service", "tts_service.py"),
+    ("document-generator", "services/document-generator", "document_generator.py"),
+    ("audio-archiver", "services/audio-archiver", "audio_archiver.py"),
+    ("rag-engine", "services/rag-engine", "rag_engine.py"),
+    ("interrupt-classifier", "services/interrupt-classifier", "interrupt_classifier.py"),
+    ("thought-parser", "services/thought-parser", "thought_parser.py"),
+    ("emotional-analyzer", "services/emotional-analyzer", "emotional_analyzer.py"),
+    ("llm-inference", "services/llm-inference", "llm_service.py"),
+]
+
+SAMPLE_RATE = 16000
+CHUNK_MS = 100
+CHUNK_BYTES = SAMPLE_RATE * 2 * CHUNK_MS // 1000  # 16-bit mono PCM
+CHUNKS_PER_WINDOW = 20  # Matches the audio processor's transcription window
+
+
+def start_services(redis_url: str, log_dir: str):
+    """Launch each service as a subprocess using the fake provider"""
+    os.makedirs(log_dir, exist_ok=True)
+    env = {
+        **os.environ,
+        "LLM_PROVIDER": "fake",
+        "TTS_ENGINE": "fake",
+        "TTS_CACHE_DIR": os.path.join(log_dir, "tts_cache"),
+        "ARCHIVE_DIR": os.path.join(log_dir, "archive", "segments"),
+        "ARCHIVE_LOCAL_ROOT": os.path.join(log_dir, "archive", "uploaded"),
+        "CONVERSATION_INDEX_PATH": os.path.join(log_dir, "conversations.db"),
+        # Knowledge base without a model download, from an empty vault
+        "RAG_EMBEDDER": "hashing",
+        "RAG_DATA_DIR": os.path.join(log_dir, "rag"),
+        "VAULT_DIR": os.path.join(log_dir, "vault"),
+        "REDIS_URL": redis_url,
+        "PYTHONPATH": os.path.join(ROOT, "services"),
+    }
+
+    processes = []
+    for name, workdir, entry in SERVICES:
+        log = open(os.path.join(log_dir, f"{name}.log"), "w")
+        process = subprocess.Popen(
+            [sys.executable, entry],
+            cwd=os.path.join(ROOT, workdir),
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT
+        )
+        processes.append((name, process, log))
+    return processes
+
+
+def stop_services(processes):
+    for name, process, log in processes:
+        process.terminate()
+    for name, process, log in processes:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+
+
+async def wait_for_server(uri: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with websockets.connect(uri):
+                return
+        except OSError:
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"WebSocket server at {uri} did not come up")
+
+
+class Results:
+    def __init__(self):
+        self.response_latencies = []
+        self.first_audio_latencies = []
+        self.document_latencies = []
+        self.chunks_sent = 0
+        self.responses = 0
+        self.documents = 0
+        self.errors = 0
+
+
+async def receive(websocket, window_times, stopped_at, results: Results, done: asyncio.Event):
+    """Match responses to the most recent completed STT window"""
+    # Audio is paced to playback, so a response can still be arriving after the document
+    playing = False
+    document_received = False
+    document_chunks = {}
+
+    async for message in websocket:
+        data = json.loads(message)
+        now = time.perf_counter()
+
+        if data.get("type") == "audio_response":
+            playing = not data.get("is_final")
+            if data.get("sequence") == 0 and data.get("audio") and window_times:
+                results.first_audio_latencies.append(now - window_times[-1])
+        if data.get("type") == "audio_response" and data.get("is_final"):
+            results.responses += 1
+            if window_times:
+                results.response_latencies.append(now - window_times[-1])
+        elif data.get("type") == "conversation_document_chunk":
+            document_chunks[data["index"]] = base64.b64decode(data["data"])
+            received = 0
+            while received in document_chunks:
+                received += 1
+            await websocket.send(json.dumps({
+                "type": "conversation_document_ack", "blob_id": data["blob_id"], "received": received
+            }))
+        elif data.get("type") == "conversation_document_complete":
+            content = zlib.decompress(b"".join(document_chunks[i] for i in sorted(document_chunks)))
+            if hashlib.sha256(content).hexdigest() != data["blob_id"]:
+                results.errors += 1
+            results.documents += 1
+            document_received = True
+            if stopped_at:
+                results.document_latencies.append(now - stopped_at[0])
+
+        if document_received and not playing:
+            done.set()
+
+
+async def run_session(uri: str, index: int, args, results: Results):
+    rng = random.Random(f"{args.seed}:{index}")
+    done = asyncio.Event()
+    window_times = []
+    stopped_at = []
+
+    try:
+        async with websockets.connect(uri, max_size=None) as websocket:
+            json.loads(await websocket.recv())  # session_started
+            await websocket.send(json.dumps({"type": "recording_status", "status": "started"}))
+
+            receiver = asyncio.create_task(receive(websocket, window_times, stopped_at, results, done))
+
+            for sequence in range(args.windows * CHUNKS_PER_WINDOW):
+                # Seeded noise: the fake STT maps each distinct window to a canned transcript
+                chunk = rng.randbytes(CHUNK_BYTES)
+                await websocket.send(json.dumps({
+                    "type": "audio_chunk",
+                    "audio": base64.b64encode(chunk).decode(),
+                    "sequence": sequence,
+                    "timestamp": datetime.utcnow().isoformat()
+                }))
+                results.chunks_sent += 1
+
+                if (sequence + 1) % CHUNKS_PER_WINDOW == 0:
+                    window_times.append(time.perf_counter())
+                if args.chunk_interval:
+                    await asyncio.sleep(args.chunk_interval / 1000)
+
+            await websocket.send(json.dumps({"type": "recording_status", "status": "stopped"}))
+            stopped_at.append(time.perf_counter())
+
+            try:
+                await asyncio.wait_for(done.wait(), timeout=args.drain)
+            except asyncio.TimeoutError:
+                pass
+            receiver.cancel()
+    except Exception as e:
+        results.errors += 1
+        print(f"Session {index} failed: {type(e).__name__}: {e}")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(label: str, values):
+    if not values:
+        print(f"{label}: no samples")
+        return
+    ms = [v * 1000 for v in values]
+    print(
+        f"{label}: n={len(ms)} mean={statistics.mean(ms):.1f}ms "
+        f"p50={percentile(ms, 50):.1f}ms p95={percentile(ms, 95):.1f}ms "
+        f"p99={percentile(ms, 99):.1f}ms max={max(ms):.1f}ms"
+    )
+
+
+async def run_benchmark(args):
+    uri = f"ws://{args.host}:{args.port}"
+    await wait_for_server(uri)
+
+    results = Results()
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(uri, i, args, results) for i in range(args.sessions)))
+    elapsed = time.perf_counter() - started
+
+    print(f"\nSessions: {args.sessions}  windows/session: {args.windows}  elapsed: {elapsed:.1f}s")
+    print(f"Audio chunks: {results.chunks_sent} ({results.chunks_sent / elapsed:.1f}/s)")
+    print(f"Responses: {results.responses} ({results.responses / elapsed:.2f}/s)")
+    print(f"Documents: {results.documents}  session errors: {results.errors}")
+    summarize("Window -> first audio", results.first_audio_latencies)
+    summarize("Window -> audio response", results.response_latencies)
+    summarize("Stop -> document", results.document_latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extended Cognition pipeline benchmark")
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--windows", type=int, default=10, help="STT windows streamed per session")
+    parser.add_argument("--chunk-interval", type=float, default=CHUNK_MS,
+                        help="ms between audio chunks (100 = real time, 0 = as fast as possible)")
+    parser.add_argument("--drain", type=float, default=15, help="seconds to wait for the document after stopping")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"))
+    parser.add_argument("--log-dir", default=os.path.join(ROOT, "benchmark_logs"))
+    parser.add_argument("--no-services", action="store_true", help="use already running services")
+    args = parser.parse_args()
+
+    processes = [] if args.no_services else start_services(args.redis_url, args.log_dir)
+    try:
+        asyncio.run(run_benchmark(args))
+    finally:
+        stop_services(processes)
+
+
+if __name__ == "__main__":
+    main()
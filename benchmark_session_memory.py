@@ -0,0 +1,120 @@
+# benchmark_session_memory.py
+"""Memory per session in the LLM service's session state store.
+
+Seeds Redis with conversation history and moods for many sessions, then
+loads every session into a fresh SessionStateStore the way queries do and
+measures the store's footprint with tracemalloc. Needs a reachable Redis
+(REDIS_URL, default redis://localhost:6379); keys are written under a
+benchmark prefix and removed afterwards.
+
+    python benchmark_session_memory.py --sessions 1000 --history 10
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(ROOT, "services"), os.path.join(ROOT, "services", "llm-inference")]
+
+import redis.asyncio as redis
+
+from common.context_assembler import get_token_counter
+from llm_service import ExtendedCognitionLLM
+from session_state import SessionStateStore
+
+MOODS = ["curious", "excited", "concerned", "calm", "neutral", "thoughtful"]
+WORDS = "the idea memory note project meeting plan why how maybe later draft question".split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_store(client, args) -> SessionStateStore:
+    return SessionStateStore(
+        client,
+        get_token_counter(),
+        ExtendedCognitionLLM.format_memory_entry,
+        max_sessions=args.sessions,
+        max_bytes=1 << 40,
+        load_limit=args.history,
+        key_prefix="benchmark_conversation",
+        state_key_prefix="benchmark_cognitive_state",
+        user_emotion_key_prefix="benchmark_user_emotion"
+    )
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    client = redis.Redis(connection_pool=redis.BlockingConnectionPool.from_url(args.redis_url, max_connections=8))
+    session_ids = [f"bench-{i}" for i in range(args.sessions)]
+
+    # Seed Redis through a store so the data is exactly what the service writes
+    seeder = make_store(client, args)
+    for session_id in session_ids:
+        for _ in range(args.history):
+            seeder.add_history(session_id, {
+                "session_id": session_id,
+                "query": sentence(rng, args.words),
+                "internal_thought": sentence(rng, args.words),
+                "emotional_state": rng.choice(MOODS),
+                "confidence": 0.5,
+                "response": sentence(rng, args.words)
+            })
+        seeder.set_mood(session_id, rng.choice(MOODS))
+        if len(seeder.pending) >= 1000:
+            await seeder.flush()
+    await seeder.flush()
+
+    try:
+        store = make_store(client, args)
+        await store.get("warm-up")  # First-use allocations in redis-py and the tokenizer aren't per session
+        # The token-count memo is shared and bounded; once full, new entries replace old ones
+        counter = store.token_counter
+        for i in range(counter.count.cache_info().maxsize):
+            counter.count(f"warm up {i}")
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+
+        for session_id in session_ids:
+            await store.get(session_id)
+
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        history_chars = sum(
+            len(segment.text) for state in store.sessions.values() for segment in state.context.history
+        )
+
+        per_session = allocated / args.sessions
+        print(f"{args.sessions} sessions, {args.history} history entries each")
+        print(f"  measured:       {allocated / 1024:.0f} KiB total, {per_session:.0f} bytes per session")
+        print(f"  history text:   {history_chars / args.sessions:.0f} chars per session")
+        print(f"  overhead:       {per_session - history_chars / args.sessions:.0f} bytes per session")
+        print(f"  store estimate: {store.bytes / args.sessions:.0f} bytes per session (what LLM_MEMORY_CACHE_MB bounds)")
+    finally:
+        keys = [f"{prefix}:{session_id}" for session_id in session_ids + ["warm-up"]
+                for prefix in ("benchmark_conversation", "benchmark_cognitive_state")]
+        for i in range(0, len(keys), 1000):
+            await client.delete(*keys[i:i + 1000])
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM service session state memory benchmark")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--history", type=int, default=10, help="history entries loaded per session")
+    parser.add_argument("--words", type=int, default=12, help="words per query, thought and response")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"))
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
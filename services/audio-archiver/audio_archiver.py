@@ -0,0 +1,259 @@
+# audio_archiver.py
+import asyncio
+import redis.asyncio as redis
+import base64
+import json
+import os
+import logging
+import time
+import wave
+from datetime import datetime
+from typing import Dict
+from storage_backends import create_backend
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AudioArchiver:
+    def __init__(self):
+        self.redis_client = None
+        self.backend = create_backend()
+
+        # Stream names
+        self.audio_stream = "audio_stream"
+        self.recording_command_stream = "recording_command_stream"
+
+        # Segments are 16kHz mono 16-bit PCM, like the audio processor assumes
+        self.archive_dir = os.getenv("ARCHIVE_DIR", "/archive/segments")
+        self.sample_rate = 16000
+        self.sample_width = 2
+        self.segment_bytes = int(os.getenv("ARCHIVE_SEGMENT_SECONDS", "300")) * self.sample_rate * self.sample_width
+        self.idle_seconds = int(os.getenv("ARCHIVE_IDLE_SECONDS", "60"))
+        self.archive_ttl = 30 * 24 * 3600
+
+        # Uploads run in the background, several segments at a time
+        self.upload_workers = int(os.getenv("ARCHIVE_UPLOAD_WORKERS", "3"))
+        self.upload_chunk_size = int(os.getenv("ARCHIVE_UPLOAD_CHUNK_MB", "8")) * 1024 * 1024
+        self.upload_retry_seconds = 30
+        self.upload_queue: asyncio.Queue = asyncio.Queue()
+
+        # session_id -> open segment being written
+        self.open_segments: Dict[str, dict] = {}
+
+    async def init_redis(self):
+        """Initialize Redis connection"""
+        redis_host = os.getenv('REDIS_URL', 'redis://localhost:6379').replace('redis://', '').split(':')[0]
+        self.redis_client = redis.Redis(
+            host=redis_host,
+            port=6379,
+            db=0,
+            decode_responses=False
+        )
+
+    async def _latest_id(self, stream: str):
+        """ID of the newest entry in a stream; "$" would skip entries added between reads"""
+        latest = await self.redis_client.xrevrange(stream, count=1)
+        return latest[0][0] if latest else "0-0"
+
+    def _archive_key(self, session_id: str) -> str:
+        return f"audio_archive:{session_id}"
+
+    async def process_streams(self):
+        """Write incoming audio to segments and close them when recording stops"""
+        last_ids = {}
+        for stream in (self.audio_stream, self.recording_command_stream):
+            last_ids[stream] = await self._latest_id(stream)
+
+        while True:
+            try:
+                messages = await self.redis_client.xread(last_ids, block=1000)
+
+                for stream, msgs in messages:
+                    stream = stream.decode()
+                    for msg_id, fields in msgs:
+                        last_ids[stream] = msg_id
+                        session_id = fields.get(b"session_id", b"").decode()
+                        if stream == self.audio_stream:
+                            await self.write_chunk(session_id, fields.get(b"chunk", b"").decode())
+                        elif fields.get(b"command", b"").decode() in ("recording_stopped", "session_ended"):
+                            await self.close_segment(session_id)
+
+            except Exception as e:
+                logger.error(f"Error archiving audio: {e}")
+                await asyncio.sleep(1)
+
+    def _session_dir(self, session_id: str) -> str:
+        return os.path.join(self.archive_dir, session_id)
+
+    def open_segment(self, session_id: str, index: int) -> dict:
+        session_dir = self._session_dir(session_id)
+        os.makedirs(session_dir, exist_ok=True)
+        path = os.path.join(session_dir, f"segment-{index:05d}.wav")
+
+        # Written as .part so a crash never leaves a truncated segment looking complete
+        writer = wave.open(f"{path}.part", "wb")
+        writer.setnchannels(1)
+        writer.setsampwidth(self.sample_width)
+        writer.setframerate(self.sample_rate)
+        return {"path": path, "writer": writer, "bytes": 0, "last_write": time.monotonic()}
+
+    async def write_chunk(self, session_id: str, audio_base64: str):
+        if not audio_base64:
+            return
+
+        if session_id not in self.open_segments:
+            # Numbered in Redis so names stay unique after uploaded segments are deleted locally
+            index = await self.redis_client.hincrby(self._archive_key(session_id), "opened", 1)
+            if index == 1:
+                # First audio for this session: its archive location can go into documents right away
+                asyncio.create_task(self.publish_location(session_id))
+            self.open_segments[session_id] = self.open_segment(session_id, index)
+
+        segment = self.open_segments[session_id]
+        audio = base64.b64decode(audio_base64)
+        segment["writer"].writeframesraw(audio)
+        segment["bytes"] += len(audio)
+        segment["last_write"] = time.monotonic()
+
+        if segment["bytes"] >= self.segment_bytes:
+            await self.close_segment(session_id)
+
+    async def close_segment(self, session_id: str):
+        """Finish the session's open segment and queue it for upload"""
+        segment = self.open_segments.pop(session_id, None)
+        if segment is None:
+            return
+
+        segment["writer"].close()  # Rewrites the WAV header with the final length
+        os.replace(f"{segment['path']}.part", segment["path"])
+
+        await self.redis_client.hincrby(self._archive_key(session_id), "segments", 1)
+        await self.upload_queue.put((session_id, segment["path"]))
+        logger.info(f"Segment complete: {segment['path']} ({segment['bytes'] / 1e6:.1f} MB)")
+
+    async def publish_location(self, session_id: str):
+        """Record where the session's archive lives before any upload finishes"""
+        try:
+            url = await asyncio.to_thread(self.backend.session_location, session_id)
+            key = self._archive_key(session_id)
+            await self.redis_client.hset(key, mapping={
+                "url": url,
+                "started": datetime.utcnow().isoformat()
+            })
+            await self.redis_client.expire(key, self.archive_ttl)
+        except Exception as e:
+            logger.error(f"Error creating archive location for session {session_id}: {e}")
+
+    def _state_path(self, path: str) -> str:
+        return f"{path}.upload.json"
+
+    def _load_state(self, path: str) -> dict:
+        try:
+            with open(self._state_path(path)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self, path: str, state: dict):
+        tmp_path = f"{self._state_path(path)}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._state_path(path))
+
+    async def upload_segment(self, session_id: str, path: str):
+        """Upload one completed segment, resuming from its saved progress"""
+        state = self._load_state(path)
+        if state:
+            logger.info(f"Resuming upload of {path} at byte {state.get('offset', 0)}")
+
+        url = await asyncio.to_thread(
+            self.backend.upload,
+            path,
+            session_id,
+            state,
+            self.upload_chunk_size,
+            lambda progress: self._save_state(path, progress)
+        )
+
+        key = self._archive_key(session_id)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hset(key, f"segment:{os.path.basename(path)}", url)
+        pipe.hincrby(key, "uploaded", 1)
+        pipe.expire(key, self.archive_ttl)
+        await pipe.execute()
+
+        os.unlink(path)
+        if os.path.exists(self._state_path(path)):
+            os.unlink(self._state_path(path))
+        logger.info(f"Uploaded {path} -> {url}")
+
+    async def upload_worker(self):
+        """Upload queued segments, retrying failures later"""
+        loop = asyncio.get_running_loop()
+        while True:
+            session_id, path = await self.upload_queue.get()
+            try:
+                await self.upload_segment(session_id, path)
+            except Exception as e:
+                logger.error(f"Upload of {path} failed, retrying in {self.upload_retry_seconds}s: {e}")
+                loop.call_later(self.upload_retry_seconds, self.upload_queue.put_nowait, (session_id, path))
+            finally:
+                self.upload_queue.task_done()
+
+    def repair_segment(self, part_path: str) -> str:
+        """Turn a segment interrupted by a crash into a valid WAV file"""
+        with open(part_path, "rb") as f:
+            audio = f.read()[44:]  # Header sizes were never written
+        path = part_path[:-len(".part")]
+        with wave.open(path, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(self.sample_width)
+            writer.setframerate(self.sample_rate)
+            writer.writeframes(audio)
+        os.unlink(part_path)
+        return path
+
+    async def recover_segments(self):
+        """Queue segments left over from a previous run"""
+        if not os.path.isdir(self.archive_dir):
+            return
+        for session_id in os.listdir(self.archive_dir):
+            session_dir = self._session_dir(session_id)
+            for name in sorted(os.listdir(session_dir)):
+                path = os.path.join(session_dir, name)
+                if name.endswith(".wav.part"):
+                    path = self.repair_segment(path)
+                elif not name.endswith(".wav"):
+                    continue
+                await self.upload_queue.put((session_id, path))
+                logger.info(f"Recovered segment {path}")
+
+    async def close_idle_segments(self):
+        """Close segments for sessions that stopped sending audio without a stop command"""
+        while True:
+            await asyncio.sleep(self.idle_seconds / 2)
+            now = time.monotonic()
+            for session_id, segment in list(self.open_segments.items()):
+                if now - segment["last_write"] > self.idle_seconds:
+                    await self.close_segment(session_id)
+
+    async def start(self):
+        """Start the audio archiver"""
+        await self.init_redis()
+        os.makedirs(self.archive_dir, exist_ok=True)
+        await self.recover_segments()
+
+        # Start background tasks
+        for _ in range(self.upload_workers):
+            asyncio.create_task(self.upload_worker())
+        asyncio.create_task(self.close_idle_segments())
+
+        logger.info("Starting audio archiver...")
+        await self.process_streams()
+
+async def main():
+    archiver = AudioArchiver()
+    await archiver.start()
+
+if __name__ == "__main__":
+    asyncio.run(main())
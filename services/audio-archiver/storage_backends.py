@@ -0,0 +1,152 @@
+# storage_backends.py
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Uploads report progress through this so they can resume after a restart
+ProgressCallback = Callable[[Dict], None]
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+
+class StorageBackend(ABC):
+    """Where archived audio segments end up"""
+
+    @abstractmethod
+    def session_location(self, session_id: str) -> str:
+        """URL for a session's archive, known before any upload finishes"""
+
+    @abstractmethod
+    def upload(self, path: str, session_id: str, state: Dict, chunk_size: int, on_progress: ProgressCallback) -> str:
+        """Upload a file in chunks, continuing from state, and return its URL"""
+
+
+class LocalBackend(StorageBackend):
+    """Copies segments into a directory tree, for testing and single-machine deployments"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def session_location(self, session_id: str) -> str:
+        directory = os.path.join(self.root, session_id)
+        os.makedirs(directory, exist_ok=True)
+        return f"file://{os.path.abspath(directory)}"
+
+    def upload(self, path: str, session_id: str, state: Dict, chunk_size: int, on_progress: ProgressCallback) -> str:
+        destination = os.path.join(self.root, session_id, os.path.basename(path))
+        partial = f"{destination}.part"
+        offset = state.get("offset", 0)
+        if not os.path.exists(partial):
+            offset = 0
+
+        with open(path, "rb") as source, open(partial, "r+b" if offset else "wb") as target:
+            source.seek(offset)
+            target.seek(offset)
+            target.truncate()
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                target.write(chunk)
+                offset += len(chunk)
+                on_progress({"offset": offset})
+
+        os.replace(partial, destination)
+        return f"file://{os.path.abspath(destination)}"
+
+
+class GoogleDriveBackend(StorageBackend):
+    """Resumable uploads into a Drive folder per session.
+
+    Uploads run on several threads at once. The service object is shared,
+    but its Http connection isn't thread-safe, so every request is executed
+    on an authorized Http belonging to the calling thread.
+    """
+
+    def __init__(self, credentials_path: str, parent_folder_id: str = None):
+        from google.oauth2 import service_account
+        from googleapiclient.discovery import build
+
+        self.credentials = service_account.Credentials.from_service_account_file(
+            credentials_path,
+            scopes=["https://www.googleapis.com/auth/drive.file"]
+        )
+        self.drive_service = build("drive", "v3", credentials=self.credentials, cache_discovery=False)
+        self.parent_folder_id = parent_folder_id
+        self.session_folders: Dict[str, Dict] = {}
+        self.folder_lock = threading.Lock()
+        self.local = threading.local()
+
+    def _http(self):
+        """This thread's authorized Http"""
+        if not hasattr(self.local, "http"):
+            import google_auth_httplib2
+            import httplib2
+
+            self.local.http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return self.local.http
+
+    def _session_folder(self, session_id: str) -> Dict:
+        """The session's folder, shared by every thread and kept across restarts"""
+        with self.folder_lock:
+            if session_id not in self.session_folders:
+                self.session_folders[session_id] = self._find_folder(session_id) or self._create_folder(session_id)
+            return self.session_folders[session_id]
+
+    def _find_folder(self, session_id: str) -> Optional[Dict]:
+        """A folder made for the session before a restart, which its document already links to"""
+        query = f"name = 'audio-{session_id}' and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false"
+        if self.parent_folder_id:
+            query += f" and '{self.parent_folder_id}' in parents"
+        found = self.drive_service.files().list(
+            q=query, spaces="drive", fields="files(id,webViewLink)", orderBy="createdTime"
+        ).execute(http=self._http())
+        folders = found.get("files", [])
+        return folders[0] if folders else None
+
+    def _create_folder(self, session_id: str) -> Dict:
+        body = {"name": f"audio-{session_id}", "mimeType": FOLDER_MIME_TYPE}
+        if self.parent_folder_id:
+            body["parents"] = [self.parent_folder_id]
+        return self.drive_service.files().create(body=body, fields="id,webViewLink").execute(http=self._http())
+
+    def session_location(self, session_id: str) -> str:
+        return self._session_folder(session_id)["webViewLink"]
+
+    def upload(self, path: str, session_id: str, state: Dict, chunk_size: int, on_progress: ProgressCallback) -> str:
+        from googleapiclient.http import MediaFileUpload
+
+        media = MediaFileUpload(path, mimetype="audio/wav", chunksize=chunk_size, resumable=True)
+        request = self.drive_service.files().create(
+            body={"name": os.path.basename(path), "parents": [self._session_folder(session_id)["id"]]},
+            media_body=media,
+            fields="id,webViewLink"
+        )
+        if state.get("resumable_uri"):
+            # Continue the upload session Drive already has
+            request.resumable_uri = state["resumable_uri"]
+            request.resumable_progress = state.get("offset", 0)
+
+        response = None
+        while response is None:
+            status, response = request.next_chunk(http=self._http(), num_retries=3)
+            if status is not None:
+                on_progress({"resumable_uri": request.resumable_uri, "offset": status.resumable_progress})
+        return response["webViewLink"]
+
+
+def create_backend() -> StorageBackend:
+    """Backend selected by ARCHIVE_BACKEND: local (default) or gdrive"""
+    backend = os.getenv("ARCHIVE_BACKEND", "local").lower()
+    if backend == "gdrive":
+        return GoogleDriveBackend(
+            os.getenv("GOOGLE_SERVICE_ACCOUNT_KEY", "service-account-key.json"),
+            os.getenv("GOOGLE_DRIVE_AUDIO_FOLDER_ID")
+        )
+    if backend == "local":
+        return LocalBackend(os.getenv("ARCHIVE_LOCAL_ROOT", "/archive/uploaded"))
+    raise ValueError(f"Unknown archive backend: {backend}")
@@ -0,0 +1,35 @@
+# blob_store.py
+import hashlib
+import os
+import zlib
+from typing import Optional
+
+BLOB_TTL = int(os.getenv("BLOB_TTL", str(7 * 24 * 3600)))
+
+
+class BlobStore:
+    """Content-addressed, zlib-compressed blobs in Redis (blob:{sha256})"""
+
+    def __init__(self, redis_client, ttl: int = BLOB_TTL, prefix: str = "blob"):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, blob_id: str) -> str:
+        return f"{self.prefix}:{blob_id}"
+
+    async def put(self, data: bytes) -> str:
+        """Store data once and return its id; storing the same content again only refreshes the TTL"""
+        blob_id = hashlib.sha256(data).hexdigest()
+        key = self._key(blob_id)
+        if not await self.redis_client.set(key, zlib.compress(data, 6), ex=self.ttl, nx=True):
+            await self.redis_client.expire(key, self.ttl)
+        return blob_id
+
+    async def get_compressed(self, blob_id: str) -> Optional[bytes]:
+        """The stored zlib stream, for transferring without recompressing"""
+        return await self.redis_client.get(self._key(blob_id))
+
+    async def get(self, blob_id: str) -> Optional[bytes]:
+        compressed = await self.get_compressed(blob_id)
+        return zlib.decompress(compressed) if compressed is not None else None
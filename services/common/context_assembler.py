@@ -0,0 +1,231 @@
+# context_assembler.py
+import logging
+import os
+import re
+from collections import deque
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Token budget for assembled context per model. These are deliberately far
+# below the models' context windows: every extra token adds prompt latency.
+MODEL_TOKEN_BUDGETS = {
+    "llama-3.1-70b-versatile": 6000,
+    "llama-3.1-8b-instant": 4000,
+}
+DEFAULT_TOKEN_BUDGET = 3000
+
+_APPROX_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class TokenCounter:
+    """Token counter with a memoized count per text segment"""
+
+    def __init__(self, encoding_name: str = "cl100k_base", cache_size: int = 8192):
+        self.encoding = None
+        try:
+            import tiktoken
+            self.encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable ({e}) - using approximate token counts")
+
+        self.count = lru_cache(maxsize=cache_size)(self._count)
+
+    def _count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        # Roughly one token per word piece or punctuation mark
+        return len(_APPROX_TOKEN_RE.findall(text))
+
+    def truncate_tail(self, text: str, max_tokens: int) -> str:
+        """Keep the end of text within max_tokens without splitting words"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+
+        words = text.split()
+        # Binary search for the earliest word we can start from
+        lo, hi = 0, len(words)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._count(" ".join(words[mid:])) <= max_tokens:
+                hi = mid
+            else:
+                lo = mid + 1
+        return " ".join(words[lo:])
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(encoding_name: str = "cl100k_base") -> TokenCounter:
+    """Shared tokenizer instance, loaded once per process"""
+    return TokenCounter(encoding_name)
+
+
+def token_budget_for(model: str) -> int:
+    """Context token budget for a model, overridable with CONTEXT_TOKEN_BUDGET"""
+    override = os.getenv("CONTEXT_TOKEN_BUDGET")
+    if override:
+        return int(override)
+    return MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET)
+
+
+class ContextSegment:
+    __slots__ = ("text", "tokens")
+
+    def __init__(self, text: str, tokens: int):
+        self.text = text
+        self.tokens = tokens
+
+
+class AssembledContext:
+    """Context selected for one prompt, grouped by section"""
+
+    def __init__(self):
+        self.recent_speech: List[str] = []
+        self.saved_thoughts: List[str] = []
+        self.knowledge: List[str] = []
+        self.older_speech: List[str] = []
+        self.history: List[str] = []
+        self.tokens = 0
+
+    def render(self) -> str:
+        """Render as plain prompt text, oldest material first"""
+        recent = " ".join(self.recent_speech)
+        if not (self.saved_thoughts or self.knowledge or self.older_speech or self.history):
+            return recent
+
+        parts = []
+        if self.saved_thoughts:
+            parts.append("Saved thoughts:\n" + "\n".join(f"- {t}" for t in self.saved_thoughts))
+        if self.knowledge:
+            parts.append("Relevant notes:\n" + "\n".join(f"- {k}" for k in self.knowledge))
+        if self.older_speech or self.history:
+            earlier = " ".join(self.older_speech)
+            lines = ([earlier] if earlier else []) + self.history
+            parts.append("Earlier in the conversation:\n" + "\n".join(lines))
+        if recent:
+            parts.append("Recent speech:\n" + recent)
+        return "\n\n".join(parts)
+
+
+class SessionContext:
+    """Per-session context kept incrementally, with token counts computed once per segment.
+
+    Each kind of segment gets its deque on first use, so services that keep
+    only some kinds for many sessions don't pay for the others.
+    """
+
+    __slots__ = (
+        "counter", "max_speech_tokens", "max_saved_thoughts", "max_history",
+        "speech", "speech_tokens", "saved_thoughts", "history"
+    )
+
+    def __init__(
+        self,
+        counter: Optional[TokenCounter] = None,
+        max_speech_tokens: int = 32000,
+        max_saved_thoughts: int = 50,
+        max_history: int = 50
+    ):
+        self.counter = counter or get_token_counter()
+        self.max_speech_tokens = max_speech_tokens
+        self.max_saved_thoughts = max_saved_thoughts
+        self.max_history = max_history
+
+        self.speech: Sequence[ContextSegment] = ()
+        self.speech_tokens = 0
+        self.saved_thoughts: Sequence[ContextSegment] = ()
+        self.history: Sequence[ContextSegment] = ()
+
+    def _segment(self, text: str) -> ContextSegment:
+        text = text.strip()
+        return ContextSegment(text, self.counter.count(text))
+
+    def add_speech(self, text: str):
+        """Append a transcript segment"""
+        segment = self._segment(text)
+        if not segment.text:
+            return
+        if not self.speech:
+            self.speech = deque()
+        self.speech.append(segment)
+        self.speech_tokens += segment.tokens
+
+        # Speech beyond any budget we would ever assemble is dropped
+        while self.speech_tokens > self.max_speech_tokens and len(self.speech) > 1:
+            self.speech_tokens -= self.speech.popleft().tokens
+
+    def add_saved_thought(self, text: str):
+        segment = self._segment(text)
+        if segment.text:
+            if not self.saved_thoughts:
+                self.saved_thoughts = deque(maxlen=self.max_saved_thoughts)
+            self.saved_thoughts.append(segment)
+
+    def add_history(self, text: str):
+        segment = self._segment(text)
+        if segment.text:
+            if not self.history:
+                self.history = deque(maxlen=self.max_history)
+            self.history.append(segment)
+
+    def assemble(self, budget: int, knowledge: Optional[List[str]] = None, recent_share: float = 0.5) -> AssembledContext:
+        """Fill the token budget by priority: recent speech, saved thoughts,
+        knowledge chunks, then older speech and history"""
+        result = AssembledContext()
+        remaining = budget
+
+        # 1. Recent speech, newest first, up to recent_share of the budget
+        recent_budget = int(budget * recent_share) if (self.saved_thoughts or self.history or knowledge) else budget
+        recent: List[str] = []
+        index = len(self.speech) - 1
+        used = 0
+        while index >= 0:
+            segment = self.speech[index]
+            if used + segment.tokens > recent_budget:
+                if not recent:
+                    # Always keep the tail of the newest segment
+                    text = self.counter.truncate_tail(segment.text, recent_budget)
+                    if text:
+                        recent.append(text)
+                        used += self.counter.count(text)
+                    index -= 1
+                break
+            recent.append(segment.text)
+            used += segment.tokens
+            index -= 1
+        result.recent_speech = recent[::-1]
+        remaining -= used
+
+        # 2. Saved thoughts, newest first
+        result.saved_thoughts, remaining = self._fill(reversed(self.saved_thoughts), remaining)
+
+        # 3. Knowledge chunks in retrieval order
+        if knowledge:
+            chunks = (self._segment(chunk) for chunk in knowledge)
+            selected, remaining = self._fill(chunks, remaining, newest_first=False)
+            result.knowledge = selected
+
+        # 4. Older speech, then earlier exchanges
+        older = (self.speech[i] for i in range(index, -1, -1))
+        result.older_speech, remaining = self._fill(older, remaining)
+        result.history, remaining = self._fill(reversed(self.history), remaining)
+
+        result.tokens = budget - remaining
+        return result
+
+    @staticmethod
+    def _fill(segments, remaining: int, newest_first: bool = True):
+        selected = []
+        for segment in segments:
+            if segment.tokens > remaining:
+                break
+            selected.append(segment.text)
+            remaining -= segment.tokens
+        if newest_first:
+            selected.reverse()
+        return selected, remaining
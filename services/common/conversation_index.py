@@ -0,0 +1,254 @@
+# conversation_index.py
+"""Searchable store of past conversations.
+
+SQLite with an FTS5 inverted index over everything said and saved, plus
+time indexes, so recall stays fast across years of history. Methods are
+synchronous; async services call them through asyncio.to_thread.
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    session_id TEXT PRIMARY KEY,
+    filename TEXT,
+    started_at REAL,
+    ended_at REAL,
+    word_count INTEGER,
+    audio_url TEXT,
+    blob_id TEXT,
+    indexed_at REAL
+);
+CREATE INDEX IF NOT EXISTS conversations_started ON conversations(started_at);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,  -- transcript, interaction or thought
+    trigger TEXT,
+    ts REAL NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS events_session ON events(session_id, ts);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+    text, content='events', content_rowid='id', tokenize='porter unicode61'
+);
+"""
+
+SAVED_THOUGHT = "save that thought"
+
+
+def to_epoch(value: datetime) -> float:
+    """Stream timestamps are naive UTC"""
+    return value.replace(tzinfo=timezone.utc).timestamp() if value.tzinfo is None else value.timestamp()
+
+
+def from_epoch(value: Optional[float]) -> Optional[str]:
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def fts_query(text: str) -> str:
+    """Match every word literally, so user input can't break FTS syntax"""
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+
+class ConversationIndex:
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # One writer; readers get their own connection per thread (WAL lets them run concurrently)
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        with self._write_lock:
+            self._writer = self._connect()
+            self._writer.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _reader(self) -> sqlite3.Connection:
+        if not hasattr(self._local, "connection"):
+            self._local.connection = self._connect()
+        return self._local.connection
+
+    def index_conversation(
+        self,
+        session_id: str,
+        transcripts: List[Dict],
+        interactions: List[Dict],
+        filename: str = None,
+        audio_url: str = None,
+        blob_id: str = None
+    ):
+        """Add or replace one conversation in a single transaction"""
+        rows = [(session_id, "transcript", None, to_epoch(t["timestamp"]), t["text"]) for t in transcripts]
+        rows += [
+            (
+                session_id,
+                "thought" if i["trigger"] == SAVED_THOUGHT else "interaction",
+                i["trigger"],
+                to_epoch(i["timestamp"]),
+                i["ai_response"]
+            )
+            for i in interactions
+        ]
+        started_at = min((r[3] for r in rows), default=None)
+        ended_at = max((r[3] for r in rows), default=None)
+        word_count = sum(len(t["text"].split()) for t in transcripts)
+
+        with self._write_lock, self._writer:
+            # Re-indexing a session replaces its rows
+            self._writer.execute(
+                "INSERT INTO events_fts(events_fts, rowid, text) "
+                "SELECT 'delete', id, text FROM events WHERE session_id = ?",
+                (session_id,)
+            )
+            self._writer.execute("DELETE FROM events WHERE session_id = ?", (session_id,))
+
+            for row in rows:
+                cursor = self._writer.execute(
+                    "INSERT INTO events(session_id, kind, trigger, ts, text) VALUES (?, ?, ?, ?, ?)", row
+                )
+                self._writer.execute(
+                    "INSERT INTO events_fts(rowid, text) VALUES (?, ?)", (cursor.lastrowid, row[4])
+                )
+
+            self._writer.execute(
+                """INSERT INTO conversations
+                   (session_id, filename, started_at, ended_at, word_count, audio_url, blob_id, indexed_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(session_id) DO UPDATE SET
+                       filename = excluded.filename, started_at = excluded.started_at,
+                       ended_at = excluded.ended_at, word_count = excluded.word_count,
+                       audio_url = excluded.audio_url, blob_id = excluded.blob_id,
+                       indexed_at = excluded.indexed_at""",
+                (session_id, filename, started_at, ended_at, word_count, audio_url, blob_id, time.time())
+            )
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        kind: Optional[str] = None
+    ) -> List[Dict]:
+        """Best-matching events, optionally within a time range or of one kind"""
+        match = fts_query(query)
+        if not match:
+            return []
+
+        sql = """SELECT e.session_id, e.kind, e.trigger, e.ts,
+                        snippet(events_fts, 0, '[', ']', '…', 12) AS snippet,
+                        bm25(events_fts) AS rank
+                 FROM events_fts JOIN events e ON e.id = events_fts.rowid
+                 WHERE events_fts MATCH ?"""
+        params: list = [match]
+        if since is not None:
+            sql += " AND e.ts >= ?"
+            params.append(to_epoch(since))
+        if until is not None:
+            sql += " AND e.ts < ?"
+            params.append(to_epoch(until))
+        if kind:
+            sql += " AND e.kind = ?"
+            params.append(kind)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        return [
+            {
+                "session_id": row["session_id"],
+                "kind": row["kind"],
+                "trigger": row["trigger"],
+                "timestamp": from_epoch(row["ts"]),
+                "snippet": row["snippet"],
+                "rank": round(row["rank"], 3)
+            }
+            for row in self._reader().execute(sql, params)
+        ]
+
+    def conversations(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[Dict]:
+        """Conversations by start time, newest first"""
+        sql = "SELECT * FROM conversations WHERE 1 = 1"
+        params: list = []
+        if since is not None:
+            sql += " AND started_at >= ?"
+            params.append(to_epoch(since))
+        if until is not None:
+            sql += " AND started_at < ?"
+            params.append(to_epoch(until))
+        sql += " ORDER BY started_at DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        return [self._conversation(row) for row in self._reader().execute(sql, params)]
+
+    def _conversation(self, row: sqlite3.Row) -> Dict:
+        return {
+            "session_id": row["session_id"],
+            "filename": row["filename"],
+            "started_at": from_epoch(row["started_at"]),
+            "ended_at": from_epoch(row["ended_at"]),
+            "word_count": row["word_count"],
+            "audio_url": row["audio_url"],
+            "blob_id": row["blob_id"]
+        }
+
+    def get_conversation(self, session_id: str) -> Optional[Dict]:
+        """A conversation with its transcripts and interactions in time order"""
+        reader = self._reader()
+        row = reader.execute("SELECT * FROM conversations WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+
+        conversation = self._conversation(row)
+        conversation["transcripts"] = []
+        conversation["interactions"] = []
+        events = reader.execute(
+            "SELECT kind, trigger, ts, text FROM events WHERE session_id = ? ORDER BY ts, id", (session_id,)
+        )
+        for event in events:
+            timestamp = datetime.fromisoformat(from_epoch(event["ts"]))
+            if event["kind"] == "transcript":
+                conversation["transcripts"].append({"text": event["text"], "timestamp": timestamp})
+            else:
+                conversation["interactions"].append({
+                    "trigger": event["trigger"],
+                    "user_text": "",
+                    "ai_response": event["text"],
+                    "timestamp": timestamp
+                })
+        return conversation
+
+    def session_ids(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[str]:
+        """Indexed sessions, oldest first, optionally started within a time range"""
+        sql = "SELECT session_id FROM conversations WHERE 1 = 1"
+        params: list = []
+        if since is not None:
+            sql += " AND started_at >= ?"
+            params.append(to_epoch(since))
+        if until is not None:
+            sql += " AND started_at < ?"
+            params.append(to_epoch(until))
+        sql += " ORDER BY started_at"
+        return [row[0] for row in self._reader().execute(sql, params)]
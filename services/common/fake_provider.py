@@ -0,0 +1,204 @@
+# fake_provider.py
+"""Offline stand-in for the Groq client used in benchmarks and local runs.
+
+Mirrors the subset of the AsyncGroq API the services call:
+chat.completions.create (streaming and non-streaming) and
+audio.transcriptions.create. Output is deterministic for a given seed and
+input, so pipeline runs are reproducible.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+from types import SimpleNamespace
+from typing import List, Optional
+
+DEFAULT_TRANSCRIPTS = [
+    "I've been thinking about how the pipeline should handle long pauses.",
+    "Maybe the thought parser could use punctuation as well as timing.",
+    "What do you think?",
+    "Redis streams give us replay and backpressure for free.",
+    "That's interesting, the latency budget is mostly the LLM call.",
+    "Summarize that.",
+    "Save that thought about using Redis streams.",
+    "Okay, let's keep going with the document format.",
+]
+
+DEFAULT_COMPLETION = (
+    "That's a useful direction. The key tradeoff is latency against context: "
+    "more context makes the answer better but slower. Start small and measure."
+)
+
+COGNITIVE_COMPLETION = """INTERNAL_THOUGHT: They are weighing latency against context quality.
+EMOTIONAL_STATE: curious
+CONFIDENCE: 0.8
+SHOULD_INTERRUPT: False
+RESPONSE: It might help to measure where the time actually goes before optimizing."""
+
+_TOKEN_RE = re.compile(r"\s*\S+")
+
+
+class FakeProviderError(Exception):
+    """Injected provider failure"""
+
+
+class LatencyModel:
+    """Latency distribution parsed from a spec like 'lognormal:120,0.4' (milliseconds)"""
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in params.split(",") if p.strip()]
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        """Sample a latency in seconds"""
+        p = self.params
+        if self.kind == "fixed":
+            ms = p[0] if p else 0.0
+        elif self.kind == "uniform":
+            ms = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            ms = rng.gauss(p[0], p[1])
+        else:
+            # Median and sigma of the underlying normal
+            ms = p[0] * math.exp(rng.gauss(0.0, p[1] if len(p) > 1 else 0.5))
+        return max(ms, 0.0) / 1000
+
+
+class _CompletionStream:
+    def __init__(self, tokens: List[str], token_latency: LatencyModel, rng: random.Random):
+        self.tokens = tokens
+        self.token_latency = token_latency
+        self.rng = rng
+
+    def __aiter__(self):
+        return self._generate()
+
+    async def _generate(self):
+        for token in self.tokens:
+            await asyncio.sleep(self.token_latency.sample(self.rng))
+            yield SimpleNamespace(choices=[SimpleNamespace(
+                delta=SimpleNamespace(content=token), finish_reason=None
+            )])
+        yield SimpleNamespace(choices=[SimpleNamespace(
+            delta=SimpleNamespace(content=None), finish_reason="stop"
+        )])
+
+
+class _Completions:
+    def __init__(self, provider: "FakeAsyncGroq"):
+        self.provider = provider
+
+    async def create(self, model: str, messages: list, stream: bool = False, **kwargs):
+        provider = self.provider
+        rng = provider.rng_for("chat", json.dumps(messages, sort_keys=True))
+
+        await asyncio.sleep(provider.completion_latency.sample(rng))
+        provider.maybe_fail(rng)
+
+        content = provider.pick_completion(messages)
+        tokens = _TOKEN_RE.findall(content)
+        if stream:
+            return _CompletionStream(tokens, provider.token_latency, rng)
+
+        # Non-streaming calls wait for the whole generation
+        await asyncio.sleep(sum(provider.token_latency.sample(rng) for _ in tokens))
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(
+                message=SimpleNamespace(role="assistant", content=content),
+                finish_reason="stop"
+            )],
+            usage=SimpleNamespace(completion_tokens=len(tokens))
+        )
+
+
+class _Transcriptions:
+    def __init__(self, provider: "FakeAsyncGroq"):
+        self.provider = provider
+
+    async def create(self, file, model: str, **kwargs):
+        provider = self.provider
+        audio = file[1] if isinstance(file, tuple) else file
+        if hasattr(audio, "read"):
+            audio = audio.read()
+
+        # The transcript is a function of the audio, so identical input
+        # always yields the same text regardless of call order
+        digest = hashlib.sha256(audio).digest()
+        rng = provider.rng_for("stt", digest.hex())
+
+        await asyncio.sleep(provider.transcription_latency.sample(rng))
+        provider.maybe_fail(rng)
+
+        index = int.from_bytes(digest[:4], "big") % len(provider.transcripts)
+        return SimpleNamespace(text=provider.transcripts[index])
+
+
+class FakeAsyncGroq:
+    """Deterministic fake with configurable latency, streaming and error injection"""
+
+    def __init__(
+        self,
+        seed: int = 0,
+        completion_latency: str = "lognormal:300,0.3",
+        token_latency: str = "fixed:5",
+        transcription_latency: str = "lognormal:80,0.3",
+        error_rate: float = 0.0,
+        transcripts: Optional[List[str]] = None,
+        completions: Optional[List[dict]] = None,
+        default_completion: Optional[str] = None
+    ):
+        self.seed = seed
+        self.completion_latency = LatencyModel(completion_latency)
+        self.token_latency = LatencyModel(token_latency)
+        self.transcription_latency = LatencyModel(transcription_latency)
+        self.error_rate = error_rate
+        self.transcripts = transcripts or DEFAULT_TRANSCRIPTS
+        # Each entry: {"match": substring of the prompt, "content": completion}
+        self.completions = completions or []
+        self.default_completion = default_completion or DEFAULT_COMPLETION
+
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self.audio = SimpleNamespace(transcriptions=_Transcriptions(self))
+
+    @classmethod
+    def from_env(cls) -> "FakeAsyncGroq":
+        """Configure from FAKE_PROVIDER_* environment variables"""
+        fixtures = {}
+        fixtures_path = os.getenv("FAKE_PROVIDER_FIXTURES")
+        if fixtures_path:
+            with open(fixtures_path) as f:
+                fixtures = json.load(f)
+
+        return cls(
+            seed=int(os.getenv("FAKE_PROVIDER_SEED", "0")),
+            completion_latency=os.getenv("FAKE_PROVIDER_LATENCY", "lognormal:300,0.3"),
+            token_latency=os.getenv("FAKE_PROVIDER_TOKEN_LATENCY", "fixed:5"),
+            transcription_latency=os.getenv("FAKE_PROVIDER_STT_LATENCY", "lognormal:80,0.3"),
+            error_rate=float(os.getenv("FAKE_PROVIDER_ERROR_RATE", "0")),
+            transcripts=fixtures.get("transcripts"),
+            completions=fixtures.get("completions"),
+            default_completion=fixtures.get("default_completion")
+        )
+
+    def rng_for(self, kind: str, key: str) -> random.Random:
+        return random.Random(f"{self.seed}:{kind}:{key}")
+
+    def maybe_fail(self, rng: random.Random):
+        if self.error_rate and rng.random() < self.error_rate:
+            raise FakeProviderError("Injected provider error")
+
+    def pick_completion(self, messages: list) -> str:
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        for entry in self.completions:
+            if entry.get("match", "") in prompt:
+                return entry["content"]
+        if "SHOULD_INTERRUPT" in prompt:
+            return COGNITIVE_COMPLETION
+        return self.default_completion
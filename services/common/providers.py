@@ -0,0 +1,17 @@
+# providers.py
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def create_groq_client():
+    """Groq client, or the offline fake when LLM_PROVIDER=fake"""
+    provider = os.getenv("LLM_PROVIDER", "groq").lower()
+    if provider == "fake":
+        from common.fake_provider import FakeAsyncGroq
+        logger.info("Using fake LLM provider")
+        return FakeAsyncGroq.from_env()
+
+    from groq import AsyncGroq
+    return AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
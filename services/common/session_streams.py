@@ -0,0 +1,56 @@
+# session_streams.py
+import os
+
+# Per-session copies expire once a conversation is long finished
+SESSION_STREAM_TTL = int(os.getenv("SESSION_STREAM_TTL", str(7 * 24 * 3600)))
+
+
+# ID of the first entry written with a per-session copy; older sessions only exist in the shared streams
+SESSION_STREAMS_SINCE_KEY = "session_streams:since"
+
+
+def session_marker(session_id: str) -> str:
+    """Key present for sessions recorded with per-session streams, even ones with nothing in a given stream"""
+    return f"session_streams:session:{session_id}"
+
+
+def session_stream(stream: str, session_id: str) -> str:
+    """Name of the per-session copy of a shared stream, e.g. transcript_stream:{session_id}"""
+    return f"{stream}:{session_id}"
+
+
+# Adds the shared entry, then its per-session copy under the same stream ID, so
+# an entry read from the shared stream can be located in the session's copy.
+# KEYS: shared stream, per-session stream, session marker, SESSION_STREAMS_SINCE_KEY
+# ARGV: maxlen (0 for none), ttl, then field, value, ...
+_PUBLISH_SCRIPT = """
+local fields = {}
+for i = 3, #ARGV do fields[#fields + 1] = ARGV[i] end
+local id
+if ARGV[1] == '0' then
+    id = redis.call('XADD', KEYS[1], '*', unpack(fields))
+else
+    id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', unpack(fields))
+end
+-- A copy written before IDs were shared can be ahead of the shared stream; append after it
+if type(redis.pcall('XADD', KEYS[2], id, unpack(fields))) == 'table' then
+    redis.call('XADD', KEYS[2], '*', unpack(fields))
+end
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('SET', KEYS[3], 1, 'EX', ARGV[2])
+redis.call('SET', KEYS[4], id, 'NX')
+return id
+"""
+
+
+async def publish_session_event(redis_client, stream: str, session_id: str, fields: dict,
+                                maxlen: int = None, ttl: int = SESSION_STREAM_TTL):
+    """Add an entry to a shared stream and to its per-session copy, with the same ID, in one round trip"""
+    publish = redis_client.register_script(_PUBLISH_SCRIPT)
+    args = [maxlen or 0, ttl]
+    for field, value in fields.items():
+        args += [field, value]
+    return await publish(
+        keys=[stream, session_stream(stream, session_id), session_marker(session_id), SESSION_STREAMS_SINCE_KEY],
+        args=args
+    )
@@ -0,0 +1,152 @@
+# stream_rpc.py
+"""Request/response calls over Redis streams.
+
+Each request carries a correlation ID, the caller's reply stream and an
+absolute deadline. Every client process has one reply stream and one listener
+that resolves the matching pending future, so concurrent calls neither
+serialize nor receive each other's replies. Servers skip requests that are
+past their deadline or that the caller cancelled.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+REPLY_TTL = 60  # Reply streams of processes that died without closing expire
+CANCEL_PREFIX = "rpc_cancel"
+
+Handler = Callable[[Dict[bytes, bytes]], Awaitable[Dict]]
+
+
+class RpcError(Exception):
+    """The server failed to handle the request"""
+
+
+class StreamRpcClient:
+    def __init__(self, redis_client, name: str = "rpc"):
+        self.redis_client = redis_client
+        self.reply_stream = f"{name}_reply:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.listener: Optional[asyncio.Task] = None
+        self.closing = False
+
+    async def start(self):
+        self.listener = asyncio.create_task(self.listen())
+
+    async def close(self):
+        if self.listener:
+            # Stopped between reads rather than cancelled: cancelling a task that is
+            # waiting on a BlockingConnectionPool can stall it for the pool timeout
+            self.closing = True
+            await asyncio.gather(self.listener, return_exceptions=True)
+        for future in self.pending.values():
+            future.cancel()
+        await self.redis_client.delete(self.reply_stream)
+
+    async def listen(self):
+        """Resolve pending calls from the reply stream"""
+        last_id = "0-0"  # The stream is unique to this client, so every entry is ours
+        while not self.closing:
+            try:
+                messages = await self.redis_client.xread({self.reply_stream: last_id}, block=1000)
+                for stream, msgs in messages:
+                    for msg_id, fields in msgs:
+                        last_id = msg_id
+                        future = self.pending.get(fields.pop(b"correlation_id", b"").decode())
+                        if future is None or future.done():
+                            continue  # Timed out or cancelled already
+                        error = fields.pop(b"error", None)
+                        if error is not None:
+                            future.set_exception(RpcError(error.decode()))
+                        else:
+                            future.set_result(fields)
+                    if msgs:
+                        await self.redis_client.xtrim(self.reply_stream, minid=last_id, approximate=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reading {self.reply_stream}: {e}")
+                await asyncio.sleep(1)
+
+    async def call(self, request_stream: str, fields: Dict, timeout: float = 2.0, maxlen: int = 10000) -> Dict[bytes, bytes]:
+        """Send a request and wait for its reply; raises asyncio.TimeoutError past the deadline"""
+        correlation_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.pending[correlation_id] = future
+        try:
+            await self.redis_client.xadd(request_stream, {
+                **fields,
+                "correlation_id": correlation_id,
+                "reply_to": self.reply_stream,
+                "deadline": f"{time.time() + timeout:.3f}"
+            }, maxlen=maxlen, approximate=True)
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.CancelledError:
+            # Tell the server not to bother; the marker outlives the deadline
+            await asyncio.shield(self.redis_client.set(
+                f"{CANCEL_PREFIX}:{correlation_id}", 1, ex=max(int(timeout) + 1, 1)
+            ))
+            raise
+        finally:
+            self.pending.pop(correlation_id, None)
+
+
+class StreamRpcServer:
+    def __init__(self, redis_client, request_stream: str, handler: Handler, max_concurrency: int = 16):
+        self.redis_client = redis_client
+        self.request_stream = request_stream
+        self.handler = handler
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.tasks = set()
+
+    async def serve(self):
+        """Handle requests as they arrive, several at a time"""
+        latest = await self.redis_client.xrevrange(self.request_stream, count=1)
+        last_id = latest[0][0] if latest else "0-0"
+        while True:
+            try:
+                messages = await self.redis_client.xread({self.request_stream: last_id}, block=1000)
+                for stream, msgs in messages:
+                    for msg_id, fields in msgs:
+                        last_id = msg_id
+                        await self.slots.acquire()
+                        task = asyncio.create_task(self.handle(fields))
+                        self.tasks.add(task)
+                        task.add_done_callback(self._finished)
+            except Exception as e:
+                logger.error(f"Error reading {self.request_stream}: {e}")
+                await asyncio.sleep(1)
+
+    def _finished(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        self.slots.release()
+
+    async def handle(self, fields: Dict[bytes, bytes]):
+        correlation_id = fields.get(b"correlation_id", b"").decode()
+        reply_to = fields.get(b"reply_to", b"").decode()
+        deadline = float(fields.get(b"deadline", b"0").decode() or 0)
+
+        if deadline and time.time() > deadline:
+            logger.debug(f"Skipping expired request {correlation_id}")
+            return
+        if correlation_id and await self.redis_client.exists(f"{CANCEL_PREFIX}:{correlation_id}"):
+            logger.debug(f"Skipping cancelled request {correlation_id}")
+            return
+
+        try:
+            reply = await self.handler(fields)
+        except Exception as e:
+            logger.error(f"Error handling {self.request_stream} request: {e}")
+            reply = {"error": str(e)}
+
+        if not reply_to:
+            return  # Fire-and-forget request
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.xadd(reply_to, {**reply, "correlation_id": correlation_id}, maxlen=1000, approximate=True)
+        pipe.expire(reply_to, REPLY_TTL)
+        await pipe.execute()
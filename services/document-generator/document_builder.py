@@ -0,0 +1,113 @@
+# document_builder.py
+import heapq
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+
+def format_offset(offset: timedelta) -> str:
+    seconds = int(offset.total_seconds())
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+def render_header(start_time: datetime, end_time: datetime, audio_url: str) -> str:
+    duration = int((end_time - start_time).total_seconds())
+    return f"""# Conversation - {start_time.strftime('%Y-%m-%d %H:%M:%S')}
+
+**Duration:** {duration // 60}:{duration % 60:02d}  
+**Audio:** [Audio archive]({audio_url})
+
+## Transcript
+
+"""
+
+
+def render_transcript(event: Dict, start_time: datetime) -> str:
+    return f"[{format_offset(event['timestamp'] - start_time)}] {event['text']}\n\n"
+
+
+def render_interaction(event: Dict) -> str:
+    # Format based on trigger type
+    if event["trigger"] == "save that thought":
+        return f"### 💡 Saved Thought\n\"{event['ai_response']}\"\n\n"
+    if event["trigger"] == "summarize that":
+        return f"### Summary\n{event['ai_response']}\n\n"
+    return f"### AI Response\n{event['ai_response']}\n\n"
+
+
+def document_filename(start_time: Optional[datetime]) -> str:
+    start_time = start_time or datetime.utcnow()
+    return f"conversation-{start_time.strftime('%Y-%m-%d-%H%M%S')}.md"
+
+
+EMPTY_DOCUMENT = "# Empty Conversation\n\nNo transcripts found."
+AUDIO_UNAVAILABLE = "[audio archive unavailable]"
+
+
+class LiveDocument:
+    """A conversation's Markdown, rendered incrementally as events arrive"""
+
+    def __init__(self, session_id: str, lateness: timedelta = timedelta(seconds=10)):
+        self.session_id = session_id
+        # Interactions are published after the speech that triggered them;
+        # events are only rendered once nothing earlier can still arrive
+        self.lateness = lateness
+
+        self.pending_transcripts: List[Dict] = []
+        self.pending_interactions: List[Dict] = []
+        self.chunks: List[str] = []
+
+        self.start_time: Optional[datetime] = None
+        self.end_time: Optional[datetime] = None
+        self.word_count = 0
+        self.last_activity = datetime.utcnow()
+        # Created after the conversation began, so missing its start; rebuilt from the streams when finished
+        self.partial = False
+
+    def add_transcript(self, text: str, timestamp: datetime):
+        self.pending_transcripts.append({"text": text, "timestamp": timestamp})
+        self.last_activity = datetime.utcnow()
+
+    def add_interaction(self, trigger: str, user_text: str, ai_response: str, timestamp: datetime):
+        self.pending_interactions.append({
+            "trigger": trigger,
+            "user_text": user_text,
+            "ai_response": ai_response,
+            "timestamp": timestamp
+        })
+        self.last_activity = datetime.utcnow()
+
+    def _take(self, pending: List[Dict], watermark: Optional[datetime]) -> List[Dict]:
+        # Each stream arrives in order, so everything up to the watermark is a prefix
+        count = len(pending)
+        if watermark is not None:
+            count = next((i for i, e in enumerate(pending) if e["timestamp"] > watermark), count)
+        taken = pending[:count]
+        del pending[:count]
+        return taken
+
+    def advance(self, now: Optional[datetime] = None):
+        """Render every event that is older than the lateness window"""
+        watermark = (now or datetime.utcnow()) - self.lateness
+        self._render(self._take(self.pending_transcripts, watermark),
+                     self._take(self.pending_interactions, watermark))
+
+    def _render(self, transcripts: List[Dict], interactions: List[Dict]):
+        # Both inputs are already ordered; merge instead of sorting
+        tagged_transcripts = ((e["timestamp"], 0, e) for e in transcripts)
+        tagged_interactions = ((e["timestamp"], 1, e) for e in interactions)
+        for timestamp, kind, event in heapq.merge(tagged_transcripts, tagged_interactions, key=lambda t: t[:2]):
+            if kind == 0:
+                if self.start_time is None:
+                    self.start_time = timestamp
+                self.end_time = timestamp
+                self.word_count += len(event["text"].split())
+                self.chunks.append(render_transcript(event, self.start_time))
+            else:
+                self.chunks.append(render_interaction(event))
+
+    def finalize(self, audio_url: str) -> str:
+        """The complete document; only events still inside the lateness window are rendered here"""
+        self._render(self._take(self.pending_transcripts, None), self._take(self.pending_interactions, None))
+        if self.start_time is None:
+            return EMPTY_DOCUMENT
+        return render_header(self.start_time, self.end_time, audio_url) + "".join(self.chunks)
@@ -2,14 +2,16 @@
 import asyncio
 import redis.asyncio as redis
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, List
 import logging
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaInMemoryUpload
 import os
 import re
+from common.session_streams import SESSION_STREAMS_SINCE_KEY, session_marker, session_stream
+from common.blob_store import BlobStore
+from common.conversation_index import ConversationIndex
+from document_builder import AUDIO_UNAVAILABLE, LiveDocument, document_filename
+from index_api import start_index_api
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,7 +19,7 @@ logger = logging.getLogger(__name__)
 class ConversationDocumentGenerator:
     def __init__(self):
         self.redis_client = None
-        self.drive_service = None
+        self.blob_store = None
         
         # Stream names
         self.generate_stream = "generate_document_stream"
@@ -25,8 +27,17 @@ class ConversationDocumentGenerator:
         self.llm_interaction_stream = "llm_interaction_stream"
         self.conversation_complete_stream = "conversation_complete_stream"
         
-        # Google Drive folder for audio backups
-        self.audio_folder_id = os.getenv("GOOGLE_DRIVE_AUDIO_FOLDER_ID")
+        # Documents built live as each conversation happens
+        self.live_documents: Dict[str, LiveDocument] = {}
+        self.live_lateness = timedelta(seconds=int(os.getenv("DOCUMENT_LATENESS_SECONDS", "10")))
+        # session_id -> when its document was generated; stragglers after that aren't tracked live
+        self.finished_sessions: Dict[str, datetime] = {}
+        
+        # Searchable history of every generated conversation
+        self.index = ConversationIndex(os.getenv("CONVERSATION_INDEX_PATH", "/data/conversations.db"))
+        # No authentication; keep it off public interfaces
+        self.index_api_host = os.getenv("INDEX_API_HOST", "127.0.0.1")
+        self.index_api_port = int(os.getenv("INDEX_API_PORT", "8780"))
         
     async def init_redis(self):
         """Initialize Redis connection"""
@@ -37,38 +48,61 @@ class ConversationDocumentGenerator:
             db=0,
             decode_responses=False
         )
+        self.blob_store = BlobStore(self.redis_client)
     
-    def init_google_drive(self):
-        """Initialize Google Drive API"""
-        try:
-            # Use service account credentials
-            if os.path.exists('service-account-key.json'):
-                creds = service_account.Credentials.from_service_account_file(
-                    'service-account-key.json',
-                    scopes=['https://www.googleapis.com/auth/drive.file']
-                )
-                self.drive_service = build('drive', 'v3', credentials=creds)
-                logger.info("Google Drive API initialized successfully")
-            else:
-                logger.warning("No service-account-key.json found - Google Drive uploads disabled")
-                logger.warning("Run setup_google_drive.sh to enable Google Drive integration")
-                self.drive_service = None
-        except Exception as e:
-            logger.error(f"Failed to initialize Google Drive: {e}")
-            self.drive_service = None
+    async def _latest_id(self, stream: str):
+        """ID of the newest entry in a stream; "$" would skip entries added between reads"""
+        latest = await self.redis_client.xrevrange(stream, count=1)
+        return latest[0][0] if latest else "0-0"
+    
+    async def _live_document(self, session_id: str, msg_id) -> LiveDocument:
+        """The session's live document, created on the first entry this process sees for it"""
+        document = self.live_documents.get(session_id)
+        if document is None:
+            # Earlier entries went by with no document to add them to, e.g. before a restart;
+            # per-session copies share their shared-stream IDs, so this entry's own copy is excluded
+            pipe = self.redis_client.pipeline(transaction=False)
+            for stream in (self.transcript_stream, self.llm_interaction_stream):
+                pipe.xrange(session_stream(stream, session_id), "-", f"({msg_id.decode()}", count=1)
+            earlier = await pipe.execute()
+            document = self.live_documents[session_id] = LiveDocument(session_id, self.live_lateness)
+            document.partial = any(earlier)
+        return document
     
     async def process_generation_requests(self):
-        """Process requests to generate conversation documents"""
+        """Build documents live, and finish them when generation is requested"""
+        # Transcripts and interactions are read alongside requests, so a
+        # request always sees everything published before it
+        last_ids = {}
+        for stream in (self.transcript_stream, self.llm_interaction_stream, self.generate_stream):
+            last_ids[stream] = await self._latest_id(stream)
+        order = list(last_ids)
+        
         while True:
             try:
-                messages = await self.redis_client.xread(
-                    {self.generate_stream: "$"},
-                    block=1000
-                )
+                messages = await self.redis_client.xread(last_ids, block=1000)
+                
+                # Apply conversation events before requests in the same batch
+                messages.sort(key=lambda item: order.index(item[0].decode()))
                 
                 for stream, msgs in messages:
+                    stream = stream.decode()
                     for msg_id, fields in msgs:
-                        await self.generate_document(fields)
+                        last_ids[stream] = msg_id
+                        if stream == self.generate_stream:
+                            await self.generate_document(fields)
+                            continue
+                        session_id = fields.get(b"session_id", b"").decode()
+                        if session_id in self.finished_sessions:
+                            continue  # Already in the streams if the session asks for another document
+                        document = await self._live_document(session_id, msg_id)
+                        if stream == self.transcript_stream:
+                            document.add_transcript(*self.parse_transcript(fields))
+                        else:
+                            document.add_interaction(*self.parse_interaction(fields))
+                
+                for document in self.live_documents.values():
+                    document.advance()
                         
             except Exception as e:
                 logger.error(f"Error processing generation request: {e}")
@@ -82,55 +116,111 @@ class ConversationDocumentGenerator:
         logger.info(f"Generating document for session {session_id}")
         
         try:
-            # Gather all data for this session
-            transcript_data = await self.get_session_transcripts(session_id)
-            llm_interactions = await self.get_llm_interactions(session_id)
             audio_url = await self.get_audio_backup_url(session_id)
             
-            # Build the markdown document
-            document = self.build_markdown_document(
-                session_id, 
-                transcript_data, 
-                llm_interactions,
-                audio_url
-            )
+            live_document = self.live_documents.pop(session_id, None)
+            self.finished_sessions[session_id] = datetime.utcnow()
+            if live_document is None or live_document.partial:
+                # Started before this process did; build from the session's streams
+                live_document = self.load_document(
+                    session_id,
+                    await self.get_session_transcripts(session_id),
+                    await self.get_llm_interactions(session_id)
+                )
             
-            # Generate filename
-            start_time = transcript_data[0]["timestamp"] if transcript_data else datetime.utcnow()
-            filename = f"conversation-{start_time.strftime('%Y-%m-%d-%H%M%S')}.md"
+            # Everything but the last few seconds is already rendered
+            document = live_document.finalize(audio_url)
             
-            # Send to client via WebSocket
+            filename = document_filename(live_document.start_time)
+            
+            # Stored once; the stream carries a reference the WebSocket server delivers from
+            content = document.encode()
+            blob_id = await self.blob_store.put(content)
             await self.redis_client.xadd(
                 self.conversation_complete_stream,
                 {
                     "session_id": session_id,
                     "filename": filename,
-                    "content": document,
+                    "blob_id": blob_id,
+                    "size": len(content),
                     "timestamp": datetime.utcnow().isoformat()
                 }
             )
             
             logger.info(f"Document generated for session {session_id}")
             
+            # Indexing happens after delivery so it never delays the document
+            asyncio.create_task(self.index_conversation(session_id, filename, audio_url, blob_id))
+            
         except Exception as e:
             logger.error(f"Error generating document for session {session_id}: {e}")
     
+    async def index_conversation(self, session_id: str, filename: str, audio_url: str, blob_id: str):
+        """Add a finished conversation to the searchable index"""
+        try:
+            transcripts = await self.get_session_transcripts(session_id)
+            interactions = await self.get_llm_interactions(session_id)
+            await asyncio.to_thread(
+                self.index.index_conversation,
+                session_id,
+                transcripts,
+                interactions,
+                filename=filename,
+                audio_url=audio_url,
+                blob_id=blob_id
+            )
+        except Exception as e:
+            logger.error(f"Error indexing session {session_id}: {e}")
+    
+    def parse_transcript(self, fields: dict):
+        return (
+            fields.get(b"text", b"").decode(),
+            datetime.fromisoformat(fields.get(b"timestamp", b"").decode())
+        )
+    
+    def parse_interaction(self, fields: dict):
+        return (
+            fields.get(b"trigger", b"").decode(),
+            fields.get(b"user_text", b"").decode(),
+            fields.get(b"ai_response", b"").decode(),
+            datetime.fromisoformat(fields.get(b"timestamp", b"").decode())
+        )
+    
+    async def read_session_entries(self, stream: str, session_id: str) -> List:
+        """A session's entries from its per-session stream, O(entries in the session)"""
+        messages = await self.redis_client.xrange(session_stream(stream, session_id))
+        if messages:
+            return messages
+        
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.exists(session_marker(session_id))
+        pipe.get(SESSION_STREAMS_SINCE_KEY)
+        recorded_with_session_streams, since = await pipe.execute()
+        if recorded_with_session_streams:
+            return []
+        
+        # Sessions recorded before per-session streams existed; their entries all predate the cutoff
+        end = f"({since.decode()}" if since else "+"
+        logger.info(f"No {session_stream(stream, session_id)}, scanning {stream} up to {end}")
+        return [
+            (msg_id, fields)
+            for msg_id, fields in await self.redis_client.xrange(stream, "-", end)
+            if fields.get(b"session_id", b"").decode() == session_id
+        ]
+    
     async def get_session_transcripts(self, session_id: str) -> List[Dict]:
         """Get all transcripts for a session"""
         transcripts = []
         
-        # Read entire transcript stream and filter by session
-        # In production, you'd use a more efficient approach
-        messages = await self.redis_client.xrange(self.transcript_stream)
+        messages = await self.read_session_entries(self.transcript_stream, session_id)
         
         for msg_id, fields in messages:
-            if fields.get(b"session_id", b"").decode() == session_id:
-                transcripts.append({
-                    "text": fields.get(b"text", b"").decode(),
-                    "timestamp": datetime.fromisoformat(
-                        fields.get(b"timestamp", b"").decode()
-                    )
-                })
+            transcripts.append({
+                "text": fields.get(b"text", b"").decode(),
+                "timestamp": datetime.fromisoformat(
+                    fields.get(b"timestamp", b"").decode()
+                )
+            })
         
         return sorted(transcripts, key=lambda x: x["timestamp"])
     
@@ -138,29 +228,36 @@ class ConversationDocumentGenerator:
         """Get all LLM interactions for a session"""
         interactions = []
         
-        messages = await self.redis_client.xrange(self.llm_interaction_stream)
+        messages = await self.read_session_entries(self.llm_interaction_stream, session_id)
         
         for msg_id, fields in messages:
-            if fields.get(b"session_id", b"").decode() == session_id:
-                interactions.append({
-                    "trigger": fields.get(b"trigger", b"").decode(),
-                    "user_text": fields.get(b"user_text", b"").decode(),
-                    "ai_response": fields.get(b"ai_response", b"").decode(),
-                    "timestamp": datetime.fromisoformat(
-                        fields.get(b"timestamp", b"").decode()
-                    )
-                })
+            interactions.append({
+                "trigger": fields.get(b"trigger", b"").decode(),
+                "user_text": fields.get(b"user_text", b"").decode(),
+                "ai_response": fields.get(b"ai_response", b"").decode(),
+                "timestamp": datetime.fromisoformat(
+                    fields.get(b"timestamp", b"").decode()
+                )
+            })
         
         return sorted(interactions, key=lambda x: x["timestamp"])
     
     async def get_audio_backup_url(self, session_id: str) -> str:
-        """Get Google Drive URL for audio backup"""
-        if self.drive_service is None:
-            return "[Google Drive not configured - audio backup unavailable]"
-        
-        # In Phase 1, return placeholder
-        # TODO: Implement actual audio upload here
-        return f"https://drive.google.com/file/d/placeholder_{session_id}"
+        """Get the archive URL for the session's audio"""
+        # Published by the audio archiver when recording starts, so uploads still in progress don't block the document
+        url = await self.redis_client.hget(f"audio_archive:{session_id}", "url")
+        if url is None:
+            return AUDIO_UNAVAILABLE
+        return url.decode()
+    
+    def load_document(self, session_id: str, transcripts: List[Dict], llm_interactions: List[Dict]) -> LiveDocument:
+        """A document for a session's complete history"""
+        document = LiveDocument(session_id, self.live_lateness)
+        for t in transcripts:
+            document.add_transcript(t["text"], t["timestamp"])
+        for i in llm_interactions:
+            document.add_interaction(i["trigger"], i["user_text"], i["ai_response"], i["timestamp"])
+        return document
     
     def build_markdown_document(
         self, 
@@ -170,88 +267,26 @@ class ConversationDocumentGenerator:
         audio_url: str
     ) -> str:
         """Build the markdown document"""
-        if not transcripts:
-            return "# Empty Conversation\n\nNo transcripts found."
-        
-        # Calculate duration
-        start_time = transcripts[0]["timestamp"]
-        end_time = transcripts[-1]["timestamp"]
-        duration = end_time - start_time
-        duration_str = f"{duration.seconds // 60}:{duration.seconds % 60:02d}"
-        
-        # Calculate word count
-        total_words = sum(len(t["text"].split()) for t in transcripts)
-        
-        # Build document
-        doc = f"""# Conversation - {start_time.strftime('%Y-%m-%d %H:%M:%S')}
-
-**Duration:** {duration_str}  
-**Audio:** [Google Drive Link]({audio_url})
-
-## Transcript
-
-"""
-        
-        # Merge transcripts and interactions chronologically
-        all_events = []
-        
-        # Add transcripts
-        for t in transcripts:
-            all_events.append({
-                "type": "transcript",
-                "timestamp": t["timestamp"],
-                "content": t["text"]
-            })
-        
-        # Add LLM interactions
-        for i in llm_interactions:
-            all_events.append({
-                "type": "interaction",
-                "timestamp": i["timestamp"],
-                "trigger": i["trigger"],
-                "user_text": i["user_text"],
-                "ai_response": i["ai_response"]
-            })
-        
-        # Sort by timestamp
-        all_events.sort(key=lambda x: x["timestamp"])
-        
-        # Build the transcript section
-        current_text = ""
-        for event in all_events:
-            if event["type"] == "transcript":
-                # Calculate time offset
-                offset = event["timestamp"] - start_time
-                time_str = f"[{offset.seconds // 60:02d}:{offset.seconds % 60:02d}]"
-                
-                current_text += f"{time_str} {event['content']}\n\n"
-                doc += current_text
-                current_text = ""
-                
-            elif event["type"] == "interaction":
-                # Add any pending text first
-                if current_text:
-                    doc += current_text + "\n"
-                    current_text = ""
-                
-                # Format based on trigger type
-                if event["trigger"] == "save that thought":
-                    doc += f"### 💡 Saved Thought\n\"{event['ai_response']}\"\n\n"
-                elif event["trigger"] == "summarize that":
-                    doc += f"### Summary\n{event['ai_response']}\n\n"
-                else:
-                    doc += f"### AI Response\n{event['ai_response']}\n\n"
-        
-        # Add any remaining text
-        if current_text:
-            doc += current_text
-        
-        return doc
+        return self.load_document(session_id, transcripts, llm_interactions).finalize(audio_url)
+    
+    async def cleanup_inactive_documents(self):
+        """Drop live documents for sessions that never requested generation, and forget finished ones"""
+        while True:
+            await asyncio.sleep(300)
+            cutoff = datetime.utcnow() - timedelta(hours=1)
+            for session_id in [sid for sid, doc in self.live_documents.items() if doc.last_activity < cutoff]:
+                logger.info(f"Dropping inactive live document: {session_id}")
+                del self.live_documents[session_id]
+            for session_id in [sid for sid, finished in self.finished_sessions.items() if finished < cutoff]:
+                del self.finished_sessions[session_id]
     
     async def start(self):
         """Start the document generator"""
         await self.init_redis()
-        self.init_google_drive()
+        
+        asyncio.create_task(self.cleanup_inactive_documents())
+        await start_index_api(self.index, host=self.index_api_host, port=self.index_api_port)
+        logger.info(f"Conversation index API listening on {self.index_api_host}:{self.index_api_port}")
         
         logger.info("Starting conversation document generator...")
         await self.process_generation_requests()
@@ -0,0 +1,83 @@
+# index_api.py
+import asyncio
+import time
+from datetime import datetime
+from typing import Optional
+
+from aiohttp import web
+
+from common.conversation_index import ConversationIndex
+
+
+def _time_param(request: web.Request, name: str) -> Optional[datetime]:
+    value = request.query.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be an ISO 8601 timestamp")
+
+
+def _int_param(request: web.Request, name: str, default: int, maximum: int) -> int:
+    try:
+        return max(0, min(int(request.query.get(name, default)), maximum))
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be an integer")
+
+
+def create_app(index: ConversationIndex) -> web.Application:
+    """HTTP query API over the conversation index"""
+
+    async def search(request: web.Request) -> web.Response:
+        query = request.query.get("q", "").strip()
+        if not query:
+            raise web.HTTPBadRequest(text="q is required")
+
+        started = time.perf_counter()
+        results = await asyncio.to_thread(
+            index.search,
+            query,
+            limit=_int_param(request, "limit", 20, 200),
+            since=_time_param(request, "since"),
+            until=_time_param(request, "until"),
+            kind=request.query.get("kind")
+        )
+        return web.json_response({
+            "query": query,
+            "results": results,
+            "took_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+
+    async def conversations(request: web.Request) -> web.Response:
+        results = await asyncio.to_thread(
+            index.conversations,
+            since=_time_param(request, "since"),
+            until=_time_param(request, "until"),
+            limit=_int_param(request, "limit", 50, 500),
+            offset=_int_param(request, "offset", 0, 10 ** 9)
+        )
+        return web.json_response({"conversations": results})
+
+    async def conversation(request: web.Request) -> web.Response:
+        result = await asyncio.to_thread(index.get_conversation, request.match_info["session_id"])
+        if result is None:
+            raise web.HTTPNotFound(text="Unknown session")
+
+        for key in ("transcripts", "interactions"):
+            for event in result[key]:
+                event["timestamp"] = event["timestamp"].isoformat()
+        return web.json_response(result)
+
+    app = web.Application()
+    app.router.add_get("/search", search)
+    app.router.add_get("/conversations", conversations)
+    app.router.add_get("/conversations/{session_id}", conversation)
+    return app
+
+
+async def start_index_api(index: ConversationIndex, host: str = "127.0.0.1", port: int = 8780) -> web.AppRunner:
+    runner = web.AppRunner(create_app(index))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
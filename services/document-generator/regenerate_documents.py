@@ -0,0 +1,248 @@
+# regenerate_documents.py
+"""Re-render stored conversations with the current document format.
+
+Sessions come from the conversation index or from their per-session Redis
+streams and are rendered across a process pool. Each finished session is
+appended to a checkpoint file, so an interrupted run resumes where it stopped.
+
+    python regenerate_documents.py --source index --index /data/conversations.db --output /documents
+    python regenerate_documents.py --source streams --redis-url redis://redis:6379 --output /documents
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+from common.conversation_index import ConversationIndex
+from common.session_streams import session_stream
+from document_builder import AUDIO_UNAVAILABLE, LiveDocument, document_filename
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_STREAM = "transcript_stream"
+LLM_INTERACTION_STREAM = "llm_interaction_stream"
+
+
+class IndexSource:
+    """Sessions from the SQLite conversation index"""
+
+    def __init__(self, path: str):
+        self.index = ConversationIndex(path)
+
+    def session_ids(self, since: Optional[datetime], until: Optional[datetime]) -> List[str]:
+        return self.index.session_ids(since=since, until=until)
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        return self.index.get_conversation(session_id)
+
+
+class StreamSource:
+    """Sessions from their per-session Redis streams"""
+
+    def __init__(self, redis_url: str):
+        self.redis_client = redis.Redis.from_url(redis_url, decode_responses=False)
+
+    def session_ids(self, since: Optional[datetime], until: Optional[datetime]) -> List[str]:
+        prefix = session_stream(TRANSCRIPT_STREAM, "")
+        session_ids = sorted(
+            key.decode()[len(prefix):]
+            for key in self.redis_client.scan_iter(match=f"{prefix}*", count=1000)
+        )
+        if since is None and until is None:
+            return session_ids
+        # Stream IDs start with the entry's time in milliseconds
+        return [sid for sid in session_ids if self._started_within(sid, since, until)]
+
+    def _started_within(self, session_id: str, since: Optional[datetime], until: Optional[datetime]) -> bool:
+        first = self.redis_client.xrange(session_stream(TRANSCRIPT_STREAM, session_id), count=1)
+        if not first:
+            return False
+        started = datetime.utcfromtimestamp(int(first[0][0].split(b"-")[0]) / 1000)
+        return (since is None or started >= since) and (until is None or started < until)
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.xrange(session_stream(TRANSCRIPT_STREAM, session_id))
+        pipe.xrange(session_stream(LLM_INTERACTION_STREAM, session_id))
+        pipe.hget(f"audio_archive:{session_id}", "url")
+        transcript_entries, interaction_entries, audio_url = pipe.execute()
+
+        transcripts = [
+            {
+                "text": fields.get(b"text", b"").decode(),
+                "timestamp": datetime.fromisoformat(fields.get(b"timestamp", b"").decode())
+            }
+            for _, fields in transcript_entries
+        ]
+        interactions = [
+            {
+                "trigger": fields.get(b"trigger", b"").decode(),
+                "user_text": fields.get(b"user_text", b"").decode(),
+                "ai_response": fields.get(b"ai_response", b"").decode(),
+                "timestamp": datetime.fromisoformat(fields.get(b"timestamp", b"").decode())
+            }
+            for _, fields in interaction_entries
+        ]
+        return {
+            "transcripts": sorted(transcripts, key=lambda x: x["timestamp"]),
+            "interactions": sorted(interactions, key=lambda x: x["timestamp"]),
+            "audio_url": audio_url.decode() if audio_url else None,
+            "filename": None
+        }
+
+
+def open_source(source: str, location: str):
+    if source == "index":
+        return IndexSource(location)
+    if source == "streams":
+        return StreamSource(location)
+    raise ValueError(f"Unknown source: {source}")
+
+
+# Each worker process opens its own connection to the source
+_worker_source = None
+
+
+def _init_worker(source: str, location: str):
+    global _worker_source
+    _worker_source = open_source(source, location)
+
+
+def render_session(session_id: str, conversation: Dict, output_dir: str, by_session: bool) -> Tuple[str, int]:
+    """Render one conversation and write it atomically; returns the filename and size"""
+    document = LiveDocument(session_id)
+    for t in conversation["transcripts"]:
+        document.add_transcript(t["text"], t["timestamp"])
+    for i in conversation["interactions"]:
+        document.add_interaction(i["trigger"], i["user_text"], i["ai_response"], i["timestamp"])
+    content = document.finalize(conversation.get("audio_url") or AUDIO_UNAVAILABLE).encode()
+
+    # Keep the name the document was delivered under, when the source knows it
+    filename = conversation.get("filename") or document_filename(document.start_time)
+    if by_session:
+        output_dir = os.path.join(output_dir, session_id)
+        os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, filename)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return filename, len(content)
+
+
+def render_batch(session_ids: List[str], output_dir: str, by_session: bool) -> List[Tuple[str, Optional[str], int, Optional[str]]]:
+    """Load and render a batch of sessions in a worker; errors are reported per session"""
+    results = []
+    for session_id in session_ids:
+        try:
+            conversation = _worker_source.load(session_id)
+            if conversation is None:
+                results.append((session_id, None, 0, "not found"))
+                continue
+            filename, size = render_session(session_id, conversation, output_dir, by_session)
+            results.append((session_id, filename, size, None))
+        except Exception as e:
+            results.append((session_id, None, 0, str(e)))
+    return results
+
+
+def load_checkpoint(path: str) -> set:
+    try:
+        with open(path) as f:
+            return {line.strip() for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def regenerate(args) -> int:
+    os.makedirs(args.output, exist_ok=True)
+    location = args.index if args.source == "index" else args.redis_url
+    checkpoint_path = args.checkpoint or os.path.join(args.output, ".regenerate_checkpoint")
+
+    if args.restart and os.path.exists(checkpoint_path):
+        os.unlink(checkpoint_path)
+    done = load_checkpoint(checkpoint_path)
+
+    session_ids = args.session or open_source(args.source, location).session_ids(args.since, args.until)
+    pending = [sid for sid in session_ids if sid not in done]
+    logger.info(f"{len(session_ids)} sessions, {len(session_ids) - len(pending)} already done, {len(pending)} to render")
+    if not pending:
+        return 0
+
+    batches = [pending[i:i + args.batch_size] for i in range(0, len(pending), args.batch_size)]
+    completed = failed = total_bytes = 0
+    written: Dict[str, str] = {}
+    started = last_report = time.monotonic()
+
+    with open(checkpoint_path, "a") as checkpoint, ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(args.source, location)
+    ) as executor:
+        # Bounded in flight so a huge backfill doesn't queue every batch up front
+        in_flight = set()
+        next_batch = 0
+        while next_batch < len(batches) or in_flight:
+            while next_batch < len(batches) and len(in_flight) < args.workers * 2:
+                in_flight.add(executor.submit(render_batch, batches[next_batch], args.output, args.by_session))
+                next_batch += 1
+
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                for session_id, filename, size, error in future.result():
+                    if error:
+                        failed += 1
+                        logger.error(f"Session {session_id} failed: {error}")
+                        continue
+                    completed += 1
+                    total_bytes += size
+                    if not args.by_session:
+                        if filename in written:
+                            # Names come from the start second, like live delivery
+                            logger.warning(f"{filename} written for both {written[filename]} and {session_id}; use --by-session")
+                        written[filename] = session_id
+                    checkpoint.write(f"{session_id}\n")
+                checkpoint.flush()
+
+            now = time.monotonic()
+            if now - last_report >= args.progress_interval or not in_flight:
+                last_report = now
+                processed = completed + failed
+                rate = processed / max(now - started, 1e-6)
+                eta = (len(pending) - processed) / rate if rate else 0
+                logger.info(
+                    f"{processed}/{len(pending)} sessions ({failed} failed), "
+                    f"{rate:.1f}/s, {total_bytes / 1e6:.1f} MB written, ETA {eta:.0f}s"
+                )
+
+    logger.info(f"Regenerated {completed} documents in {time.monotonic() - started:.1f}s")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-render stored conversation documents")
+    parser.add_argument("--source", choices=("index", "streams"), default="index")
+    parser.add_argument("--index", default=os.getenv("CONVERSATION_INDEX_PATH", "/data/conversations.db"))
+    parser.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://localhost:6379"))
+    parser.add_argument("--output", required=True, help="directory the documents are written to")
+    parser.add_argument("--by-session", action="store_true", help="write each document under OUTPUT/<session_id>/")
+    parser.add_argument("--session", action="append", help="only this session (repeatable)")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="sessions started at or after (UTC)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="sessions started before (UTC)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=16, help="sessions per worker task")
+    parser.add_argument("--checkpoint", help="defaults to OUTPUT/.regenerate_checkpoint")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and render everything")
+    parser.add_argument("--progress-interval", type=float, default=2.0, help="seconds between progress lines")
+    sys.exit(regenerate(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# emotional_analyzer.py
+import asyncio
+import redis.asyncio as redis
+import base64
+import os
+import logging
+import time
+from datetime import datetime
+from typing import Dict
+from prosody import ProsodyTracker
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class EmotionalAnalyzer:
+    def __init__(self):
+        self.redis_client = None
+
+        # Stream names
+        self.audio_stream = "audio_stream"
+        self.recording_command_stream = "recording_command_stream"
+        self.user_emotion_stream = "user_emotion_stream"
+        # Latest estimate per session, for whoever assembles a prompt next
+        self.user_emotion_key_prefix = "user_emotion"
+        self.user_emotion_ttl = 24 * 3600
+
+        self.vad_rms = float(os.getenv("VAD_RMS_THRESHOLD", "500"))
+        self.window_seconds = float(os.getenv("EMOTION_WINDOW_SECONDS", "8"))
+        self.baseline_seconds = float(os.getenv("EMOTION_BASELINE_SECONDS", "180"))
+        self.publish_interval = float(os.getenv("EMOTION_PUBLISH_INTERVAL_MS", "1000")) / 1000
+        self.idle_seconds = 3600
+
+        # session_id -> rolling prosody; sessions with audio since their last estimate
+        self.trackers: Dict[str, ProsodyTracker] = {}
+        self.dirty = set()
+
+        self.stats = {"chunks": 0, "frames": 0, "estimates": 0, "analysis_ms": 0.0, "max_analysis_ms": 0.0}
+
+    async def init_redis(self):
+        """Initialize the pooled Redis connection, from REDIS_URL as given"""
+        pool = redis.BlockingConnectionPool.from_url(
+            os.getenv("REDIS_URL", "redis://localhost:6379"),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+        )
+        self.redis_client = redis.Redis(connection_pool=pool)
+
+    async def _latest_id(self, stream: str):
+        """ID of the newest entry in a stream; "$" would skip entries added between reads"""
+        latest = await self.redis_client.xrevrange(stream, count=1)
+        return latest[0][0] if latest else "0-0"
+
+    async def process_streams(self):
+        """Fold incoming audio into each session's prosody"""
+        last_ids = {}
+        for stream in (self.audio_stream, self.recording_command_stream):
+            last_ids[stream] = await self._latest_id(stream)
+
+        while True:
+            try:
+                messages = await self.redis_client.xread(last_ids, count=500, block=1000)
+
+                for stream, msgs in messages:
+                    stream = stream.decode()
+                    for msg_id, fields in msgs:
+                        last_ids[stream] = msg_id
+                        session_id = fields.get(b"session_id", b"").decode()
+                        if stream == self.audio_stream:
+                            self.analyze_chunk(session_id, fields.get(b"chunk", b""))
+                        elif fields.get(b"command", b"").decode() == "session_ended":
+                            self.trackers.pop(session_id, None)
+                            self.dirty.discard(session_id)
+
+            except Exception as e:
+                logger.error(f"Error analyzing audio: {e}")
+                await asyncio.sleep(1)
+
+    def analyze_chunk(self, session_id: str, chunk: bytes):
+        """Update a session's features from one chunk, touching only that chunk's samples"""
+        started = time.perf_counter()
+        pcm = base64.b64decode(chunk)
+        if pcm.startswith(b'RIFF'):
+            pcm = pcm[44:]
+
+        tracker = self.trackers.get(session_id)
+        if tracker is None:
+            tracker = self.trackers[session_id] = ProsodyTracker(self.vad_rms, self.window_seconds, self.baseline_seconds)
+        self.stats["frames"] += tracker.add(pcm)
+        tracker.last_active = time.monotonic()
+        self.dirty.add(session_id)
+
+        took_ms = (time.perf_counter() - started) * 1000
+        self.stats["chunks"] += 1
+        self.stats["analysis_ms"] += took_ms
+        self.stats["max_analysis_ms"] = max(self.stats["max_analysis_ms"], took_ms)
+
+    async def publish_estimates(self):
+        """Publish each active session's rolling emotion estimate, at most once per interval"""
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                sessions, self.dirty = self.dirty, set()
+                pipe = self.redis_client.pipeline(transaction=False)
+                for session_id in sessions:
+                    tracker = self.trackers.get(session_id)
+                    estimate = tracker.estimate() if tracker else None
+                    if estimate is None:
+                        continue  # No speech yet
+                    fields = {
+                        "session_id": session_id,
+                        "emotion": estimate["emotion"],
+                        "arousal": f"{estimate['arousal']:.3f}",
+                        "confidence": f"{estimate['confidence']:.3f}",
+                        "energy_db": f"{estimate['energy_db']:.1f}",
+                        "pitch_hz": f"{estimate['pitch_hz']:.1f}",
+                        "pitch_variability": f"{estimate['pitch_variability'] or 0.0:.2f}",
+                        "speaking_rate": f"{estimate['speaking_rate']:.2f}",
+                        "pause_ratio": f"{estimate['pause_ratio']:.3f}",
+                        "mean_pause_ms": f"{estimate['mean_pause_ms']:.0f}",
+                        "timestamp": datetime.utcnow().isoformat()
+                    }
+                    key = f"{self.user_emotion_key_prefix}:{session_id}"
+                    pipe.hset(key, mapping=fields)
+                    pipe.expire(key, self.user_emotion_ttl)
+                    pipe.xadd(self.user_emotion_stream, fields, maxlen=10000, approximate=True)
+                    self.stats["estimates"] += 1
+                if len(pipe):
+                    await pipe.execute()
+
+            except Exception as e:
+                logger.error(f"Error publishing emotion estimates: {e}")
+                await asyncio.sleep(1)
+
+    async def cleanup_inactive_sessions(self):
+        """Drop trackers for sessions idle for more than an hour"""
+        while True:
+            await asyncio.sleep(300)
+            cutoff = time.monotonic() - self.idle_seconds
+            for session_id in [s for s, tracker in self.trackers.items() if tracker.last_active < cutoff]:
+                del self.trackers[session_id]
+
+    async def report_stats(self):
+        """Log analysis stats periodically"""
+        while True:
+            await asyncio.sleep(int(os.getenv("STATS_INTERVAL", "300")))
+            chunks = self.stats["chunks"]
+            logger.info(f"Emotional analyzer stats: {self.stats}, sessions: {len(self.trackers)}, "
+                        f"mean_analysis_ms: {self.stats['analysis_ms'] / chunks if chunks else 0.0:.3f}")
+
+    async def start(self):
+        """Start the emotional analyzer"""
+        await self.init_redis()
+
+        # Start background tasks
+        asyncio.create_task(self.publish_estimates())
+        asyncio.create_task(self.cleanup_inactive_sessions())
+        asyncio.create_task(self.report_stats())
+
+        logger.info("Starting emotional analyzer...")
+        await self.process_streams()
+
+async def main():
+    analyzer = EmotionalAnalyzer()
+    await analyzer.start()
+
+if __name__ == "__main__":
+    asyncio.run(main())
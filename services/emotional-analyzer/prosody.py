@@ -0,0 +1,214 @@
+# prosody.py
+import math
+from typing import Dict, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Audio is 16kHz mono 16-bit PCM, like the audio processor assumes
+SAMPLE_RATE = 16000
+FRAME = 512                     # 32ms analysis frames
+HOP = 256                       # every 16ms
+HOP_MS = HOP * 1000 / SAMPLE_RATE
+MIN_LAG = SAMPLE_RATE // 400    # Highest pitch considered, 400Hz
+MAX_LAG = SAMPLE_RATE // 75     # Lowest, 75Hz
+FFT_SIZE = 2 * FRAME            # Zero-padded so the autocorrelation doesn't wrap
+VOICING_STRENGTH = 0.45         # Normalized autocorrelation peak that counts as pitched
+OCTAVE_TOLERANCE = 0.85         # Share of the best peak a shorter lag needs to win
+
+SMOOTH_FRAMES = 5               # Energy envelope smoothing for syllable peaks (80ms)
+PEAK_RADIUS = 4                 # A syllable peak is the loudest point within ±64ms
+PEAK_PROMINENCE_DB = 3.0        # ... and stands this far above its surroundings
+MIN_PAUSE_MS = 150              # Shorter gaps are part of articulation
+MAX_PAUSE_MS = 2000             # Longer ones mean the speaker stopped, not paused
+
+_WINDOW = np.hanning(FRAME).astype(np.float32)
+# Autocorrelation of the window itself; dividing by it undoes the taper's bias toward short lags
+_WINDOW_AC = np.fft.irfft(np.abs(np.fft.rfft(_WINDOW, FFT_SIZE)) ** 2)[:MAX_LAG + 1]
+_WINDOW_AC = (_WINDOW_AC / _WINDOW_AC[0]).astype(np.float32)
+
+# Decayed sums kept per session, in this order
+SPEECH_MS, VOICED, ENERGY, PITCHED, PITCH, PITCH_SQ, PEAKS, PAUSE_MS, PAUSES = range(9)
+_SUMS = 9
+
+# Contribution of each deviation from the speaker's baseline to arousal
+AROUSAL_WEIGHTS = {
+    "energy": 0.35,       # per 6dB louder
+    "pitch": 0.25,        # per 2 semitones higher
+    "variability": 0.15,  # per semitone more pitch movement
+    "rate": 0.2,          # per 50% faster
+    "pauses": -0.15,      # per 15 points more of speech time spent pausing
+}
+
+# Arousal cut points, highest first, named as interrupt_model.MOOD_AROUSAL does
+EMOTION_LEVELS = [(0.5, "excited"), (0.2, "interested"), (-0.2, "neutral"), (-0.5, "calm")]
+LOWEST_EMOTION = "tired"
+
+
+def frame_energy_db(frames: np.ndarray) -> np.ndarray:
+    """RMS level of each frame in dBFS"""
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(rms + 1e-6)
+
+
+def frame_pitch(frames: np.ndarray) -> np.ndarray:
+    """Pitch in Hz of each frame by normalized autocorrelation, 0 where unpitched"""
+    if not len(frames):
+        return np.zeros(0, dtype=np.float32)
+    spectrum = np.fft.rfft(frames * _WINDOW, FFT_SIZE, axis=1)
+    ac = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, axis=1)[:, :MAX_LAG + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        normalized = ac[:, MIN_LAG:] / ac[:, :1] / _WINDOW_AC[MIN_LAG:]
+    normalized = np.nan_to_num(normalized)
+    # Multiples of the period correlate almost as well; take the shortest lag that nearly matches the best
+    strongest = normalized.max(axis=1, keepdims=True)
+    local_max = np.zeros(normalized.shape, dtype=bool)
+    local_max[:, 1:-1] = (normalized[:, 1:-1] >= normalized[:, :-2]) & (normalized[:, 1:-1] >= normalized[:, 2:])
+    best = np.argmax(local_max & (normalized >= OCTAVE_TOLERANCE * strongest), axis=1)
+    strength = normalized[np.arange(len(frames)), best]
+    return np.where(strength >= VOICING_STRENGTH, SAMPLE_RATE / (best + MIN_LAG), 0.0)
+
+
+class ProsodyTracker:
+    """Rolling prosody for one speaker, updated chunk by chunk.
+
+    Each chunk is framed together with the few samples left over from the
+    previous one, so no audio is read twice. Per-frame energy, pitch,
+    syllable peaks and pauses are folded into exponentially decayed sums:
+    a short window (window_seconds of speech) that follows the current
+    state, and a long one (baseline_seconds) that serves as the speaker's
+    own baseline. Decay counts speech time only, so silence between
+    utterances leaves both unchanged.
+    """
+
+    __slots__ = ("vad_db", "tail", "envelope_tail", "smoothed_tail", "silence_frames", "sums", "taus", "last_active")
+
+    def __init__(self, vad_rms: float = 500, window_seconds: float = 8, baseline_seconds: float = 180):
+        self.vad_db = 20 * math.log10(vad_rms / 32768)
+        self.tail = np.zeros(0, dtype=np.float32)
+        # Last raw levels for smoothing, and smoothed levels whose peak test needs later frames
+        self.envelope_tail = np.full(SMOOTH_FRAMES - 1, -120.0, dtype=np.float32)
+        self.smoothed_tail = np.full(2 * PEAK_RADIUS, -120.0, dtype=np.float32)
+        self.silence_frames = 0
+        # Row 0 is the short window, row 1 the baseline
+        self.sums = np.zeros((2, _SUMS))
+        self.taus = np.array([[window_seconds * 1000], [baseline_seconds * 1000]])
+        self.last_active = 0.0
+
+    def add(self, pcm: bytes) -> int:
+        """Fold a chunk of 16-bit PCM into the running features; returns the frames analysed"""
+        samples = np.frombuffer(pcm[:len(pcm) & ~1], dtype=np.int16).astype(np.float32) / 32768
+        buffer = np.concatenate((self.tail, samples)) if len(self.tail) else samples
+        if len(buffer) < FRAME:
+            self.tail = buffer
+            return 0
+        count = (len(buffer) - FRAME) // HOP + 1
+        frames = sliding_window_view(buffer, FRAME)[::HOP][:count]
+        self.tail = buffer[count * HOP:].copy()
+
+        chunk = np.zeros(_SUMS)
+        level = frame_energy_db(frames)
+        voiced = level >= self.vad_db
+        chunk[VOICED] = voiced.sum()
+        chunk[ENERGY] = level[voiced].sum()
+
+        pitch = frame_pitch(frames[voiced])
+        semitones = 12 * np.log2(pitch[pitch > 0] / 100)
+        chunk[PITCHED] = len(semitones)
+        chunk[PITCH] = semitones.sum()
+        chunk[PITCH_SQ] = (semitones * semitones).sum()
+
+        chunk[PEAKS] = self._syllable_peaks(level)
+        pause_ms, pauses = self._pauses(voiced)
+        chunk[PAUSE_MS] = pause_ms
+        chunk[PAUSES] = pauses
+        chunk[SPEECH_MS] = chunk[VOICED] * HOP_MS + pause_ms
+
+        # Decay by the speech time this chunk adds, then add it
+        self.sums = self.sums * np.exp(-chunk[SPEECH_MS] / self.taus) + chunk
+        return count
+
+    def _syllable_peaks(self, level: np.ndarray) -> int:
+        """Count energy envelope peaks, i.e. syllable nuclei, carrying context across chunks"""
+        raw = np.concatenate((self.envelope_tail, level))
+        self.envelope_tail = raw[-(SMOOTH_FRAMES - 1):]
+        smoothed = np.concatenate((self.smoothed_tail, np.convolve(raw, np.full(SMOOTH_FRAMES, 1 / SMOOTH_FRAMES), "valid")))
+        self.smoothed_tail = smoothed[-2 * PEAK_RADIUS:]
+        if len(smoothed) <= 2 * PEAK_RADIUS:
+            return 0
+
+        windows = sliding_window_view(smoothed, 2 * PEAK_RADIUS + 1)
+        centre = windows[:, PEAK_RADIUS]
+        is_peak = (
+            (centre > windows[:, :PEAK_RADIUS].max(axis=1))
+            & (centre >= windows[:, PEAK_RADIUS + 1:].max(axis=1))
+            & (centre - windows.min(axis=1) >= PEAK_PROMINENCE_DB)
+            & (centre >= self.vad_db)
+        )
+        return int(is_peak.sum())
+
+    def _pauses(self, voiced: np.ndarray):
+        """Total ms and count of pauses that ended in this chunk"""
+        change = np.flatnonzero(voiced[1:] != voiced[:-1]) + 1
+        starts = np.concatenate(([0], change))
+        lengths = np.diff(np.concatenate((starts, [len(voiced)])))
+
+        pause_ms = 0.0
+        pauses = 0
+        for start, length in zip(starts, lengths):
+            if not voiced[start]:
+                self.silence_frames += length
+                continue
+            gap_ms = self.silence_frames * HOP_MS
+            if MIN_PAUSE_MS <= gap_ms <= MAX_PAUSE_MS:
+                pause_ms += gap_ms
+                pauses += 1
+            self.silence_frames = 0
+        return pause_ms, pauses
+
+    @staticmethod
+    def _features(sums: np.ndarray) -> Optional[Dict[str, float]]:
+        # Decayed pause and pitch counts drop below 1 while their means stay valid
+        if sums[VOICED] < 1 or sums[SPEECH_MS] <= 0:
+            return None
+        pitch = variability = None
+        if sums[PITCHED] > 0:
+            pitch = sums[PITCH] / sums[PITCHED]
+            variability = math.sqrt(max(sums[PITCH_SQ] / sums[PITCHED] - pitch * pitch, 0.0))
+        return {
+            "energy_db": sums[ENERGY] / sums[VOICED],
+            "pitch_semitones": pitch,  # Relative to 100Hz; None until something pitched is heard
+            "pitch_variability": variability,
+            "speaking_rate": sums[PEAKS] / (sums[SPEECH_MS] / 1000),
+            "pause_ratio": sums[PAUSE_MS] / sums[SPEECH_MS],
+            "mean_pause_ms": sums[PAUSE_MS] / sums[PAUSES] if sums[PAUSES] > 0 else 0.0,
+            "speech_seconds": sums[SPEECH_MS] / 1000,
+        }
+
+    def estimate(self) -> Optional[Dict[str, float]]:
+        """Current features, arousal relative to the baseline and the emotion it suggests"""
+        current = self._features(self.sums[0])
+        baseline = self._features(self.sums[1])
+        if current is None:
+            return None
+
+        pitched = current["pitch_semitones"] is not None and baseline["pitch_semitones"] is not None
+        deviation = {
+            "energy": (current["energy_db"] - baseline["energy_db"]) / 6,
+            "pitch": (current["pitch_semitones"] - baseline["pitch_semitones"]) / 2 if pitched else 0.0,
+            "variability": current["pitch_variability"] - baseline["pitch_variability"] if pitched else 0.0,
+            "rate": (current["speaking_rate"] / baseline["speaking_rate"] - 1) / 0.5 if baseline["speaking_rate"] else 0.0,
+            "pauses": (current["pause_ratio"] - baseline["pause_ratio"]) / 0.15,
+        }
+        arousal = math.tanh(sum(AROUSAL_WEIGHTS[name] * value for name, value in deviation.items()))
+        emotion = next((name for cut, name in EMOTION_LEVELS if arousal >= cut), LOWEST_EMOTION)
+
+        # Little speech, or a baseline still forming, makes for a weak estimate
+        confidence = (1 - math.exp(-current["speech_seconds"] / 3)) * (1 - math.exp(-baseline["speech_seconds"] / 30))
+        return {
+            **current,
+            "pitch_hz": 100 * 2 ** (current["pitch_semitones"] / 12) if current["pitch_semitones"] is not None else 0.0,
+            "arousal": arousal,
+            "emotion": emotion,
+            "confidence": confidence,
+        }
@@ -0,0 +1,166 @@
+# interrupt_classifier.py
+import asyncio
+import redis.asyncio as redis
+import os
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from common.stream_rpc import StreamRpcServer
+from interrupt_model import InterruptModel, MicroBatcher, ThresholdTuner, extract_features
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class InterruptClassifier:
+    def __init__(self):
+        self.redis_client = None
+
+        # Stream names
+        self.interrupt_request_stream = "interrupt_request_stream"
+        self.interrupt_feedback_stream = "interrupt_feedback_stream"
+        # What the LLM service actually did, from our votes or its own
+        self.interrupt_decision_stream = "interrupt_decision_stream"
+        self.threshold_key = "interrupt_classifier:threshold"
+
+        self.model = InterruptModel.load(os.getenv("INTERRUPT_MODEL_PATH"))
+        # Requests arriving together, from any session, are scored as one batch
+        self.batcher = MicroBatcher(self.model, window=float(os.getenv("INTERRUPT_BATCH_WINDOW_MS", "2")) / 1000)
+        self.tuner = ThresholdTuner(float(os.getenv("INTERRUPT_THRESHOLD", "0.5")))
+        self.max_concurrency = int(os.getenv("INTERRUPT_MAX_CONCURRENCY", "256"))
+
+        # session_id -> when the AI last spoke up, from the decisions acted on
+        self.last_interrupt = OrderedDict()
+        # decision_id -> probability, so feedback can refer back to a decision
+        self.decisions = OrderedDict()
+        self.max_tracked = 10000
+
+        self.stats = {"decisions": 0, "interrupts": 0, "interruptions": 0, "feedback": 0, "threshold_changes": 0}
+
+    async def init_redis(self):
+        """Initialize the pooled Redis connection; requests share it however many are in flight"""
+        pool = redis.BlockingConnectionPool.from_url(
+            os.getenv("REDIS_URL", "redis://localhost:6379"),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+        )
+        self.redis_client = redis.Redis(connection_pool=pool)
+
+    async def _latest_id(self, stream):
+        """ID of the newest entry in a stream; "$" would skip entries added between reads"""
+        latest = await self.redis_client.xrevrange(stream, count=1)
+        return latest[0][0] if latest else "0-0"
+
+    @staticmethod
+    def _remember(entries: OrderedDict, key, value, limit: int):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > limit:
+            entries.popitem(last=False)
+
+    async def handle_request(self, fields: dict) -> dict:
+        """Decide whether the AI should speak up now"""
+        started = time.perf_counter()
+        session_id = fields.get(b"session_id", b"").decode()
+        now = time.time()
+        last = self.last_interrupt.get(session_id)
+
+        features = extract_features(
+            pause_ms=float(fields.get(b"pause_ms", b"0").decode() or 0),
+            seconds_since_interrupt=None if last is None else now - last,
+            mood=fields.get(b"mood", b"neutral").decode(),
+            confidence=float(fields.get(b"confidence", b"0.5").decode() or 0.5),
+            text=fields.get(b"text", b"").decode()
+        )
+        probability = await self.batcher.predict(features)
+        threshold = self.tuner.threshold
+        should_interrupt = probability >= threshold
+
+        decision_id = uuid.uuid4().hex
+        self._remember(self.decisions, decision_id, probability, self.max_tracked)
+        if should_interrupt:
+            self.stats["interrupts"] += 1
+        self.stats["decisions"] += 1
+
+        return {
+            "should_interrupt": str(should_interrupt).lower(),
+            "probability": f"{probability:.4f}",
+            "threshold": f"{threshold:.4f}",
+            "decision_id": decision_id,
+            "took_ms": f"{(time.perf_counter() - started) * 1000:.2f}"
+        }
+
+    async def listen_for_decisions(self):
+        """Track when each session was last interrupted; a vote may be overruled or come too late to count"""
+        last_id = await self._latest_id(self.interrupt_decision_stream)
+        while True:
+            try:
+                messages = await self.redis_client.xread({self.interrupt_decision_stream: last_id}, block=1000)
+                for stream, msgs in messages:
+                    for msg_id, fields in msgs:
+                        last_id = msg_id
+                        if fields.get(b"should_interrupt", b"false") != b"true":
+                            continue
+                        # Stream IDs start with the entry's time in milliseconds
+                        spoke_at = int(msg_id.split(b"-")[0]) / 1000
+                        self._remember(self.last_interrupt, fields.get(b"session_id", b"").decode(), spoke_at, self.max_tracked)
+                        self.stats["interruptions"] += 1
+
+            except Exception as e:
+                logger.error(f"Error processing interrupt decisions: {e}")
+                await asyncio.sleep(1)
+
+    async def listen_for_feedback(self):
+        """Tune the threshold from whether past interruptions were welcome"""
+        last_id = await self._latest_id(self.interrupt_feedback_stream)
+        while True:
+            try:
+                messages = await self.redis_client.xread({self.interrupt_feedback_stream: last_id}, block=1000)
+                for stream, msgs in messages:
+                    for msg_id, fields in msgs:
+                        last_id = msg_id
+                        probability = self.decisions.get(fields.get(b"decision_id", b"").decode())
+                        if probability is None:
+                            continue  # Too old, or not one of ours
+                        self.stats["feedback"] += 1
+                        welcome = fields.get(b"welcome", b"false").decode() == "true"
+                        threshold = self.tuner.observe(probability, welcome)
+                        if threshold is not None:
+                            self.stats["threshold_changes"] += 1
+                            await self.redis_client.set(self.threshold_key, f"{threshold:.4f}")
+                            logger.info(f"Interrupt threshold tuned to {threshold:.3f}")
+
+            except Exception as e:
+                logger.error(f"Error processing interrupt feedback: {e}")
+                await asyncio.sleep(1)
+
+    async def report_stats(self):
+        """Log decision and batching stats periodically"""
+        while True:
+            await asyncio.sleep(int(os.getenv("STATS_INTERVAL", "300")))
+            logger.info(f"Interrupt classifier stats: {self.stats}, batching: {self.batcher.stats}, "
+                        f"threshold: {self.tuner.threshold:.3f}")
+
+    async def start(self):
+        """Start the interrupt classifier"""
+        await self.init_redis()
+
+        # A threshold tuned before a restart wins over the configured one
+        saved = await self.redis_client.get(self.threshold_key)
+        if saved:
+            self.tuner.threshold = float(saved)
+
+        # Start background tasks
+        asyncio.create_task(self.listen_for_decisions())
+        asyncio.create_task(self.listen_for_feedback())
+        asyncio.create_task(self.report_stats())
+
+        logger.info(f"Starting interrupt classifier (threshold {self.tuner.threshold:.3f})...")
+        server = StreamRpcServer(self.redis_client, self.interrupt_request_stream, self.handle_request, self.max_concurrency)
+        await server.serve()
+
+async def main():
+    classifier = InterruptClassifier()
+    await classifier.start()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,175 @@
+# interrupt_model.py
+import asyncio
+import json
+import logging
+import math
+import os
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FEATURES = [
+    "pause",                # Seconds the user has been quiet, capped
+    "since_interrupt",      # log1p of seconds since the AI last spoke up in this session
+    "arousal",              # How engaged the current mood is, -1 (flat) to 1 (animated)
+    "confidence",           # Confidence behind the current mood, centred on 0.5
+    "question",             # The user ended on a question
+]
+
+# Hand-set starting point until a trained model is supplied: speak up after a
+# real pause, on questions and in animated moods, and not twice in quick succession
+DEFAULT_WEIGHTS = {
+    "pause": 1.2,
+    "since_interrupt": 0.45,
+    "arousal": 0.8,
+    "confidence": 1.5,
+    "question": 1.8,
+}
+DEFAULT_BIAS = -4.0
+
+# Moods as the LLM names them (and user emotions from the emotional analyzer)
+MOOD_AROUSAL = {
+    "excited": 1.0, "enthusiastic": 1.0, "surprised": 0.9, "curious": 0.7,
+    "concerned": 0.6, "intrigued": 0.6, "frustrated": 0.5, "confused": 0.4,
+    "interested": 0.4, "happy": 0.4, "thoughtful": 0.1, "neutral": 0.0,
+    "calm": -0.3, "content": -0.3, "sad": -0.6, "tired": -0.8, "bored": -1.0,
+}
+
+MAX_PAUSE_SECONDS = 5.0
+NEVER_INTERRUPTED_SECONDS = 3600.0
+
+
+def extract_features(
+    pause_ms: float,
+    seconds_since_interrupt: Optional[float],
+    mood: str,
+    confidence: float,
+    text: str
+) -> np.ndarray:
+    since = NEVER_INTERRUPTED_SECONDS if seconds_since_interrupt is None else seconds_since_interrupt
+    return np.array([
+        min(max(pause_ms, 0.0) / 1000, MAX_PAUSE_SECONDS),
+        math.log1p(min(max(since, 0.0), NEVER_INTERRUPTED_SECONDS)),
+        MOOD_AROUSAL.get(mood.strip().lower(), 0.0),
+        min(max(confidence, 0.0), 1.0) - 0.5,
+        1.0 if text.rstrip().endswith("?") else 0.0,
+    ], dtype=np.float32)
+
+
+class InterruptModel:
+    """Logistic regression over FEATURES"""
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, bias: float = DEFAULT_BIAS):
+        weights = weights or DEFAULT_WEIGHTS
+        self.weights = np.array([weights.get(name, 0.0) for name in FEATURES], dtype=np.float32)
+        self.bias = np.float32(bias)
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> "InterruptModel":
+        """Model from a JSON file of {"weights": {feature: w}, "bias": b}, or the defaults"""
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            spec = json.load(f)
+        logger.info(f"Loaded interrupt model from {path}")
+        return cls(spec.get("weights"), spec.get("bias", DEFAULT_BIAS))
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Interrupt probability for each row of an (n, len(FEATURES)) matrix"""
+        logits = features @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-logits))
+
+
+class MicroBatcher:
+    """Collects concurrent predictions for up to window seconds and scores them as one matrix"""
+
+    def __init__(self, model: InterruptModel, window: float = 0.002, max_batch: int = 256):
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+        self.rows: List[np.ndarray] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {"batches": 0, "predictions": 0, "largest_batch": 0}
+
+    async def predict(self, features: np.ndarray) -> float:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.rows.append(features)
+        self.futures.append(future)
+        if len(self.rows) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.rows:
+            return
+        rows, futures = self.rows, self.futures
+        self.rows, self.futures = [], []
+
+        probabilities = self.model.predict(np.stack(rows))
+        for future, probability in zip(futures, probabilities):
+            if not future.done():
+                future.set_result(float(probability))
+
+        self.stats["batches"] += 1
+        self.stats["predictions"] += len(rows)
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(rows))
+
+
+class ThresholdTuner:
+    """Moves the decision threshold to fit feedback on past decisions.
+
+    Each observation is the probability the model gave and whether speaking
+    up was welcome. Once min_samples have been seen, the threshold becomes
+    the one with the best F-beta over the most recent window; beta below 1
+    favours precision, since an unwanted interruption costs more than a
+    missed one.
+    """
+
+    def __init__(self, threshold: float = 0.5, window: int = 500, min_samples: int = 50, beta: float = 0.5):
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.beta = beta
+        self.observations: Deque[Tuple[float, bool]] = deque(maxlen=window)
+
+    def observe(self, probability: float, welcome: bool) -> Optional[float]:
+        """Record feedback; returns the new threshold if it changed"""
+        self.observations.append((probability, welcome))
+        if len(self.observations) < self.min_samples:
+            return None
+
+        data = np.array(self.observations, dtype=np.float64)
+        order = np.argsort(-data[:, 0])
+        probabilities, labels = data[order, 0], data[order, 1]
+        positives = labels.sum()
+        if positives == 0:
+            return None
+
+        # Cutting after row i interrupts on rows 0..i
+        true_positives = np.cumsum(labels)
+        predicted = np.arange(1, len(labels) + 1)
+        precision = true_positives / predicted
+        recall = true_positives / positives
+        beta2 = self.beta ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = np.nan_to_num((1 + beta2) * precision * recall / (beta2 * precision + recall))
+        # Only cut between distinct probabilities
+        distinct = np.append(probabilities[:-1] > probabilities[1:], True)
+        score[~distinct] = -1
+        best = int(np.argmax(score))
+
+        below = probabilities[best + 1] if best + 1 < len(probabilities) else 0.0
+        threshold = float((probabilities[best] + below) / 2)
+        if abs(threshold - self.threshold) < 1e-3:
+            return None
+        self.threshold = threshold
+        return threshold
@@ -0,0 +1,160 @@
+# cognitive_parser.py
+import re
+from typing import List, Optional, Tuple
+
+# Labels of the structured response, in the order the prompt asks for them
+FIELD_LABELS = {
+    "INTERNAL_THOUGHT:": "internal_thought",
+    "EMOTIONAL_STATE:": "emotional_state",
+    "CONFIDENCE:": "confidence",
+    "SHOULD_INTERRUPT:": "should_interrupt",
+    "RESPONSE:": "response",
+}
+
+# Sentence ends followed by whitespace; keeps the punctuation with its sentence
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def default_cognitive_result() -> dict:
+    return {
+        "internal_thought": "",
+        "emotional_state": "neutral",
+        "confidence": 0.5,
+        "should_interrupt": False,
+        "response": ""
+    }
+
+
+class CognitiveStreamParser:
+    """Parses the structured response as it streams in.
+
+    feed() returns events as soon as they are known:
+    ("should_interrupt", bool) when that line completes, and
+    ("response", text) for each piece of RESPONSE text as it arrives.
+    Continuation lines extend the last text field, as in the full parser.
+    """
+
+    def __init__(self):
+        self.result = default_cognitive_result()
+        self.decided = False    # SHOULD_INTERRUPT has been parsed
+        self.current_field = None
+        self.line = ""
+        self.label = None       # Label the current line starts with, "" for plain text, None while unknown
+        self.streamed = 0       # Characters of the current line's response text already emitted
+
+    def feed(self, text: str) -> List[Tuple[str, object]]:
+        events = []
+        for part in re.split(r"(\n)", text):
+            if part == "\n":
+                events += self._progress()
+                events += self._end_line()
+            elif part:
+                self.line += part
+                events += self._progress()
+        return events
+
+    def close(self) -> List[Tuple[str, object]]:
+        """Events for a final line without a newline"""
+        if not self.line:
+            return []
+        return self._progress() + self._end_line()
+
+    def _classify(self):
+        for label in FIELD_LABELS:
+            if self.line.startswith(label):
+                self.label = label
+                if FIELD_LABELS[label] in ("internal_thought", "emotional_state", "response"):
+                    self.current_field = FIELD_LABELS[label]
+                    self.result[self.current_field] = ""
+                return
+        if not any(label.startswith(self.line) for label in FIELD_LABELS):
+            self.label = ""
+
+    def _response_text(self) -> str:
+        """What the current line adds to RESPONSE so far"""
+        if self.label == "RESPONSE:":
+            return self.line[len(self.label):].lstrip()
+        if self.label == "" and self.current_field == "response" and self.line.strip():
+            return " " + self.line.lstrip()
+        return ""
+
+    def _progress(self) -> List[Tuple[str, object]]:
+        if self.label is None:
+            self._classify()
+            if self.label is None:
+                return []  # Could still turn out to be a label
+
+        text = self._response_text()
+        if len(text) > self.streamed:
+            delta = text[self.streamed:]
+            self.streamed = len(text)
+            return [("response", delta)]
+        return []
+
+    def _end_line(self) -> List[Tuple[str, object]]:
+        events = []
+        if self.label is None:
+            self._classify()
+        if self.label:
+            field = FIELD_LABELS[self.label]
+            value = self.line[len(self.label):].strip()
+            if field == "confidence":
+                try:
+                    self.result["confidence"] = float(value)
+                except ValueError:
+                    self.result["confidence"] = 0.5
+            elif field == "should_interrupt":
+                self.result["should_interrupt"] = value.lower() == "true"
+                self.decided = True
+                events.append(("should_interrupt", self.result["should_interrupt"]))
+            else:
+                self.result[field] = value
+        elif self.current_field and self.line.strip():
+            self.result[self.current_field] += " " + self.line.strip()
+
+        self.line = ""
+        self.label = None
+        self.streamed = 0
+        return events
+
+
+class SentenceBuffer:
+    """Collects streamed text and releases it a complete sentence at a time"""
+
+    def __init__(self):
+        self.text = ""
+
+    def add(self, delta: str) -> List[str]:
+        self.text += delta
+        parts = _SENTENCE_END_RE.split(self.text)
+        self.text = parts.pop()
+        return [part.strip() for part in parts if part.strip()]
+
+    def flush(self) -> List[str]:
+        text, self.text = self.text.strip(), ""
+        return [text] if text else []
+
+
+class SpeechGate:
+    """Holds response sentences until the interrupt decision, then releases or drops them"""
+
+    def __init__(self):
+        self.decision: Optional[bool] = None
+        self.buffer = SentenceBuffer()
+
+    def add(self, delta: str) -> List[str]:
+        if self.decision is None:
+            self.buffer.text += delta
+            return []
+        return self.buffer.add(delta) if self.decision else []
+
+    def decide(self, should_interrupt: bool) -> List[str]:
+        """Sentences held so far, if speaking"""
+        self.decision = should_interrupt
+        if not should_interrupt:
+            self.buffer.text = ""
+            return []
+        return self.buffer.add("")
+
+    def close(self) -> List[str]:
+        return self.buffer.flush() if self.decision else []
@@ -1,45 +1,114 @@
 # llm_service.py
 import os
 import json
-import redis
+import redis.asyncio as redis
 import asyncio
-from groq import AsyncGroq
+import time
 from dotenv import load_dotenv
 from datetime import datetime
+from common.providers import create_groq_client
+from common.context_assembler import get_token_counter, token_budget_for
+from common.stream_rpc import StreamRpcClient
+from cognitive_parser import CognitiveStreamParser, SpeechGate
+from session_state import SessionStateStore
 
 load_dotenv()
 
 class ExtendedCognitionLLM:
     def __init__(self):
-        self.client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+        self.client = create_groq_client()
         self.model = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
-        self.redis_client = redis.Redis(host='localhost', port=6379, db=0)
+        self.redis_client = None
         
         # Stream names for communication
         self.query_stream = "query_stream"
+        self.thought_stream = "thought_stream"
         self.context_stream = "context_stream"
         self.response_stream = "response_stream"
         self.emotional_state_stream = "emotional_state_stream"
+        self.user_emotion_stream = "user_emotion_stream"
+        self.rag_request_stream = "rag_request_stream"
+        self.tts_request_stream = "tts_request_stream"
+        self.interrupt_decision_stream = "interrupt_decision_stream"
+        self.interrupt_request_stream = "interrupt_request_stream"
         
-        # Internal thought tracking
-        self.conversation_memory = []
-        self.emotional_state = {"mood": "neutral", "confidence": 0.5}
+        # Context lookups and interrupt decisions are RPCs with replies routed back to this process
+        self.rpc = None
+        self.context_timeout = float(os.getenv("RAG_TIMEOUT_MS", "500")) / 1000
+        self.interrupt_timeout = float(os.getenv("INTERRUPT_TIMEOUT_MS", "50")) / 1000
+        self.use_interrupt_classifier = os.getenv("INTERRUPT_CLASSIFIER", "true").lower() == "true"
+        
+        # Token-budgeted prompt context, kept incrementally per session
+        self.token_counter = get_token_counter()
+        self.context_budget = token_budget_for(self.model)
+        
+        # Each session's history and mood, loaded on first use and written to Redis behind the response
+        self.states = None
+        
+        # Queries from different sessions are processed concurrently; one session's stay in order
+        self.query_slots = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENT_QUERIES", "16")))
+        self.session_locks = {}
+        self.query_tasks = set()
+        
+    async def init_redis(self):
+        """Initialize the pooled Redis connection"""
+        pool = redis.BlockingConnectionPool.from_url(
+            os.getenv("REDIS_URL", "redis://localhost:6379"),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+        )
+        self.redis_client = redis.Redis(connection_pool=pool)
+        self.rpc = StreamRpcClient(self.redis_client, name="llm")
+        await self.rpc.start()
+        self.states = SessionStateStore(
+            self.redis_client,
+            self.token_counter,
+            self.format_memory_entry,
+            max_sessions=int(os.getenv("LLM_MEMORY_CACHE_SESSIONS", "1000")),
+            max_bytes=int(os.getenv("LLM_MEMORY_CACHE_MB", "64")) * 1024 * 1024,
+            idle_seconds=float(os.getenv("LLM_SESSION_IDLE_SECONDS", "1800"))
+        )
+        
+    async def _latest_id(self, stream):
+        """ID of the newest entry in a stream; "$" would skip entries added between reads"""
+        latest = await self.redis_client.xrevrange(stream, count=1)
+        return latest[0][0] if latest else "0-0"
         
     async def listen_for_queries(self):
         """Listen for incoming query streams and process them"""
+        # One cognition per complete user thought; direct queries are answered too
+        last_ids = {}
+        for stream in (self.thought_stream, self.query_stream):
+            last_ids[stream] = await self._latest_id(stream)
         while True:
             try:
-                # Read from query stream
-                messages = self.redis_client.xread({self.query_stream: '$'}, block=1000)
+                messages = await self.redis_client.xread(last_ids, block=1000)
                 
                 for stream, msgs in messages:
+                    stream = stream.decode() if isinstance(stream, bytes) else stream
                     for msg_id, fields in msgs:
-                        await self.process_query(fields)
+                        last_ids[stream] = msg_id
+                        task = asyncio.create_task(self.process_query_in_turn(fields))
+                        self.query_tasks.add(task)
+                        task.add_done_callback(self.query_tasks.discard)
                         
             except Exception as e:
                 print(f"Error processing query: {e}")
                 await asyncio.sleep(1)
     
+    async def process_query_in_turn(self, query_data):
+        """Process a query once a slot is free and the session's earlier queries are done"""
+        session_id = query_data.get(b'session_id', b'').decode('utf-8')
+        # session_id -> [lock, queries holding or waiting for it]
+        entry = self.session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self.query_slots:
+                await self.process_query(query_data)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.session_locks[session_id]
+    
     async def process_query(self, query_data):
         """Process incoming query with context and generate response"""
         try:
@@ -47,6 +116,13 @@ class ExtendedCognitionLLM:
             text = query_data.get(b'text', b'').decode('utf-8')
             session_id = query_data.get(b'session_id', b'').decode('utf-8')
             context_needed = query_data.get(b'context_needed', b'true').decode('utf-8') == 'true'
+            pause_ms = query_data.get(b'pause_ms', b'0').decode('utf-8')
+            thought_id = query_data.get(b'thought_id', b'').decode('utf-8')
+            
+            # Whether to speak is decided alongside context lookup and generation
+            classified = None
+            if self.use_interrupt_classifier:
+                classified = asyncio.create_task(self.classify_interrupt(text, session_id, pause_ms))
             
             # Get context from RAG engine if needed
             context = []
@@ -54,13 +130,13 @@ class ExtendedCognitionLLM:
                 context = await self.get_context(text, session_id)
             
             # Build prompt with conversation history and context
-            prompt = self.build_cognitive_prompt(text, context, session_id)
+            prompt = await self.build_cognitive_prompt(text, context, session_id)
             
             # Generate response with emotional processing
-            response = await self.generate_cognitive_response(prompt, session_id)
+            response = await self.generate_cognitive_response(prompt, session_id, classified)
             
             # Publish response to stream
-            await self.publish_response(response, session_id)
+            await self.publish_response(response, session_id, thought_id)
             
         except Exception as e:
             print(f"Error in process_query: {e}")
@@ -68,37 +144,48 @@ class ExtendedCognitionLLM:
     async def get_context(self, query, session_id):
         """Get context from RAG engine"""
         try:
-            # Wait for context from RAG engine
             context_request = {
                 'query': query,
                 'session_id': session_id,
                 'timestamp': datetime.utcnow().isoformat()
             }
             
-            self.redis_client.xadd('rag_request_stream', context_request)
+            # The reply for this request, however many are in flight
+            reply = await self.rpc.call(self.rag_request_stream, context_request, timeout=self.context_timeout)
+            return json.loads(reply.get(b'relevant_chunks', b'[]').decode())
             
-            # Listen for context response (simplified - in production use proper async)
-            context_data = self.redis_client.xread({'rag_response_stream': '$'}, block=2000)
-            
-            if context_data:
-                return json.loads(context_data[0][1][0][1][b'relevant_chunks'].decode())
+        except asyncio.TimeoutError:
+            print(f"No context within {self.context_timeout}s for session {session_id}")
             return []
-            
         except Exception as e:
             print(f"Error getting context: {e}")
             return []
     
-    def build_cognitive_prompt(self, query, context, session_id):
+    async def build_cognitive_prompt(self, query, context, session_id):
         """Build prompt including conversation history and emotional state"""
         
-        # Get recent conversation history for this session
-        recent_thoughts = self.get_conversation_history(session_id, limit=10)
+        # Fit history and knowledge chunks into what the query and the fixed template leave of the budget
+        state = await self.states.get(session_id)
+        template_tokens = self.token_counter.count(self.render_system_prompt(state, "", ""))
+        budget = max(self.context_budget - self.token_counter.count(query) - template_tokens, 0)
+        assembled = state.context.assemble(budget, knowledge=context)
         
-        # Build system prompt for continuous cognition
-        system_prompt = f"""You are an AI cognitive partner engaged in continuous thought alongside the user. 
+        recent_thoughts = chr(10).join(assembled.history)
+        knowledge = chr(10).join(assembled.knowledge)
+        
+        return [
+            {"role": "system", "content": self.render_system_prompt(state, recent_thoughts, knowledge)},
+            {"role": "user", "content": query}
+        ]
+    
+    def render_system_prompt(self, state, recent_thoughts, knowledge):
+        """System prompt for continuous cognition"""
+        return f"""You are an AI cognitive partner engaged in continuous thought alongside the user. 
 
-Current emotional state: {self.emotional_state}
-Recent conversation context: {recent_thoughts[-3:] if recent_thoughts else "None"}
+Current emotional state: {state.emotional_state()}
+User's emotional state (from their voice): {state.user_emotional_state() or "Unknown"}
+Recent conversation context:
+{recent_thoughts if recent_thoughts else "None"}
 
 Your role:
 - Think continuously about the conversation, not just respond
@@ -107,7 +194,7 @@ Your role:
 - Maintain personality continuity across conversation
 
 Context from user's knowledge base:
-{chr(10).join(context) if context else "No relevant context"}
+{knowledge if knowledge else "No relevant context"}
 
 Respond with both your thinking process and your response. Format as:
 INTERNAL_THOUGHT: Your ongoing cognitive process about this topic
@@ -115,33 +202,47 @@ EMOTIONAL_STATE: Your current emotional response (curious/excited/concerned/etc.
 CONFIDENCE: Your confidence level (0.0-1.0) in your response
 SHOULD_INTERRUPT: True/False - whether you should interrupt the user's flow
 RESPONSE: Your actual response to the user"""
-
-        return [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": query}
-        ]
     
-    async def generate_cognitive_response(self, messages, session_id):
-        """Generate response using Groq API with cognitive processing"""
+    async def generate_cognitive_response(self, messages, session_id, classified=None):
+        """Generate response using Groq API, acting on each field as it streams in"""
+        started = time.perf_counter()
+        parser = CognitiveStreamParser()
+        gate = SpeechGate()
         try:
             # Call Groq API
-            completion = await self.client.chat.completions.create(
+            stream = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=0.7,
                 max_tokens=1000,
                 top_p=0.9,
-                stream=False
+                stream=True
             )
             
-            raw_response = completion.choices[0].message.content
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    await self.act_on_events(session_id, parser.feed(delta), parser, gate, classified, started)
+            await self.act_on_events(session_id, parser.close(), parser, gate, classified, started)
             
-            # Parse cognitive response
-            cognitive_data = self.parse_cognitive_response(raw_response)
+            if gate.decision is None:
+                if classified is not None:
+                    await asyncio.wait([classified])  # Bounded by the classifier timeout
+                # If nobody decided, stay quiet
+                decision = self.ready_decision(parser, classified) or {
+                    "should_interrupt": False, "confidence": parser.result["confidence"], "source": "llm"
+                }
+                await self.decide(session_id, gate, decision, started)
+            await self.speak(session_id, gate.close())
+            
+            cognitive_data = parser.result
+            cognitive_data["should_interrupt"] = gate.decision
             
             # Update internal state
-            self.update_conversation_memory(session_id, messages[-1]["content"], cognitive_data)
-            self.update_emotional_state(cognitive_data.get("emotional_state", "neutral"))
+            await self.update_conversation_memory(session_id, messages[-1]["content"], cognitive_data)
+            self.update_emotional_state(
+                session_id, cognitive_data.get("emotional_state", "neutral"), cognitive_data.get("confidence", 0.5)
+            )
             
             return cognitive_data
             
@@ -155,41 +256,92 @@ RESPONSE: Your actual response to the user"""
                 "response": "I'm having trouble processing that right now."
             }
     
+    async def act_on_events(self, session_id, events, parser, gate, classified, started):
+        """Decide whether to speak as soon as possible and speak response sentences as they are parsed"""
+        for kind, value in events:
+            if kind == "response":
+                # Held until the decision; dropped if not interrupting
+                await self.speak(session_id, gate.add(value))
+        
+        if gate.decision is None:
+            decision = self.ready_decision(parser, classified)
+            if decision is not None:
+                await self.decide(session_id, gate, decision, started)
+    
+    @staticmethod
+    def ready_decision(parser, classified):
+        """The classifier's decision once it is in, or the model's own SHOULD_INTERRUPT without one"""
+        if classified is not None:
+            if not classified.done():
+                return None
+            if classified.result() is not None:
+                return classified.result()
+        if parser.decided:
+            return {
+                "should_interrupt": parser.result["should_interrupt"],
+                "confidence": parser.result["confidence"],
+                "source": "llm"
+            }
+        return None
+    
+    async def classify_interrupt(self, text, session_id, pause_ms):
+        """Ask the interrupt classifier whether to speak; None if it can't say in time"""
+        try:
+            state = await self.states.get(session_id)
+            reply = await self.rpc.call(self.interrupt_request_stream, {
+                "session_id": session_id,
+                "text": text,
+                "pause_ms": pause_ms,
+                "mood": state.mood,
+                "confidence": state.confidence
+            }, timeout=self.interrupt_timeout)
+            return {
+                "should_interrupt": reply.get(b"should_interrupt", b"false") == b"true",
+                "confidence": float(reply.get(b"probability", b"0").decode()),
+                "source": "classifier",
+                "decision_id": reply.get(b"decision_id", b"").decode()
+            }
+        except asyncio.TimeoutError:
+            print(f"No interrupt decision within {self.interrupt_timeout}s for session {session_id}")
+            return None
+        except Exception as e:
+            print(f"Error classifying interrupt: {e}")
+            return None
+    
+    async def decide(self, session_id, gate, decision, started):
+        """Act on the interrupt decision and publish it as soon as it is known, ahead of the full response"""
+        await self.speak(session_id, gate.decide(decision["should_interrupt"]))
+        await self.redis_client.xadd(self.interrupt_decision_stream, {
+            "session_id": session_id,
+            "should_interrupt": str(decision["should_interrupt"]).lower(),
+            "confidence": decision["confidence"],
+            "source": decision["source"],
+            # Feedback on the interruption goes to the classifier under this ID
+            "decision_id": decision.get("decision_id", ""),
+            "decision_ms": f"{(time.perf_counter() - started) * 1000:.0f}",
+            "timestamp": datetime.utcnow().isoformat()
+        }, maxlen=10000, approximate=True)
+    
+    async def speak(self, session_id, sentences):
+        for sentence in sentences:
+            await self.request_tts(session_id, sentence)
+    
+    async def request_tts(self, session_id, text):
+        """Speak one sentence of an interrupting response; TTS plays a session's requests in order"""
+        await self.redis_client.xadd(self.tts_request_stream, {
+            "session_id": session_id,
+            "text": text,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    
     def parse_cognitive_response(self, raw_response):
         """Parse the structured cognitive response from LLM"""
-        lines = raw_response.split('\n')
-        result = {
-            "internal_thought": "",
-            "emotional_state": "neutral", 
-            "confidence": 0.5,
-            "should_interrupt": False,
-            "response": ""
-        }
-        
-        current_field = None
-        for line in lines:
-            if line.startswith("INTERNAL_THOUGHT:"):
-                current_field = "internal_thought"
-                result[current_field] = line.replace("INTERNAL_THOUGHT:", "").strip()
-            elif line.startswith("EMOTIONAL_STATE:"):
-                current_field = "emotional_state"
-                result[current_field] = line.replace("EMOTIONAL_STATE:", "").strip()
-            elif line.startswith("CONFIDENCE:"):
-                try:
-                    result["confidence"] = float(line.replace("CONFIDENCE:", "").strip())
-                except:
-                    result["confidence"] = 0.5
-            elif line.startswith("SHOULD_INTERRUPT:"):
-                result["should_interrupt"] = line.replace("SHOULD_INTERRUPT:", "").strip().lower() == "true"
-            elif line.startswith("RESPONSE:"):
-                current_field = "response"
-                result[current_field] = line.replace("RESPONSE:", "").strip()
-            elif current_field and line.strip():
-                result[current_field] += " " + line.strip()
-        
-        return result
+        parser = CognitiveStreamParser()
+        parser.feed(raw_response)
+        parser.close()
+        return parser.result
     
-    def update_conversation_memory(self, session_id, query, response_data):
+    async def update_conversation_memory(self, session_id, query, response_data):
         """Update conversation memory with new interaction"""
         memory_entry = {
             "timestamp": datetime.utcnow().isoformat(),
@@ -201,38 +353,30 @@ RESPONSE: Your actual response to the user"""
             "response": response_data.get("response", "")
         }
         
-        # Store in Redis with expiration
-        key = f"conversation:{session_id}"
-        self.redis_client.lpush(key, json.dumps(memory_entry))
-        self.redis_client.ltrim(key, 0, 99)  # Keep last 100 entries
-        self.redis_client.expire(key, 86400)  # Expire after 24 hours
-    
-    def get_conversation_history(self, session_id, limit=10):
-        """Get recent conversation history"""
-        key = f"conversation:{session_id}"
-        history = self.redis_client.lrange(key, 0, limit-1)
-        return [json.loads(item) for item in history]
-    
-    def update_emotional_state(self, new_emotion):
-        """Update AI's emotional state"""
-        self.emotional_state = {
-            "mood": new_emotion,
-            "confidence": self.emotional_state.get("confidence", 0.5),
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        # In the prompt context now; stored in Redis by the next flush (last 100 entries, 24 hours)
+        self.states.add_history(session_id, memory_entry)
     
-    async def publish_response(self, response_data, session_id):
+    @staticmethod
+    def format_memory_entry(entry):
+        """Render a memory entry as prompt history"""
+        return f"User: {entry.get('query', '')}{chr(10)}You ({entry.get('emotional_state', 'neutral')}): {entry.get('response', '')}"
+    
+    def update_emotional_state(self, session_id, new_emotion, confidence):
+        """Update AI's emotional state in this session"""
+        self.states.set_mood(session_id, new_emotion, confidence)
+    
+    async def publish_response(self, response_data, session_id, thought_id=""):
         """Publish response to response stream"""
         response_message = {
             "content": response_data.get("response", ""),
             "internal_thought": response_data.get("internal_thought", ""),
             "session_id": session_id,
             "timestamp": datetime.utcnow().isoformat(),
-            "should_interrupt": response_data.get("should_interrupt", False)
+            "should_interrupt": str(response_data.get("should_interrupt", False)).lower()
         }
-        
-        # Publish to response stream
-        self.redis_client.xadd(self.response_stream, response_message)
+        if thought_id:
+            # The user thought this cognition answers
+            response_message["thought_id"] = thought_id
         
         # Publish emotional state update
         emotional_update = {
@@ -242,13 +386,52 @@ RESPONSE: Your actual response to the user"""
             "timestamp": datetime.utcnow().isoformat()
         }
         
-        self.redis_client.xadd(self.emotional_state_stream, emotional_update)
+        # Response and emotional state go out in one round trip
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.xadd(self.response_stream, response_message)
+        pipe.xadd(self.emotional_state_stream, emotional_update)
+        await pipe.execute()
+
+    async def listen_for_user_emotion(self):
+        """Keep the user's emotion, estimated from their voice, current for prompts"""
+        last_id = await self._latest_id(self.user_emotion_stream)
+        while True:
+            try:
+                messages = await self.redis_client.xread({self.user_emotion_stream: last_id}, block=1000)
+                
+                for stream, msgs in messages:
+                    for msg_id, fields in msgs:
+                        last_id = msg_id
+                        self.states.set_user_emotion(
+                            fields.get(b'session_id', b'').decode('utf-8'),
+                            fields.get(b'emotion', b'').decode('utf-8'),
+                            float(fields.get(b'arousal', b'0').decode('utf-8')),
+                            float(fields.get(b'confidence', b'0').decode('utf-8'))
+                        )
+                        
+            except Exception as e:
+                print(f"Error processing user emotion: {e}")
+                await asyncio.sleep(1)
+
+    async def report_stats(self):
+        """Print session state stats periodically"""
+        while True:
+            await asyncio.sleep(int(os.getenv("STATS_INTERVAL", "300")))
+            print(f"Session state stats: {self.states.get_stats()}")
 
 # Main execution
 async def main():
     llm_service = ExtendedCognitionLLM()
+    await llm_service.init_redis()
+    asyncio.create_task(llm_service.states.run())
+    asyncio.create_task(llm_service.listen_for_user_emotion())
+    asyncio.create_task(llm_service.report_stats())
     print(f"Starting Extended Cognition LLM Service with {llm_service.model}")
-    await llm_service.listen_for_queries()
+    try:
+        await llm_service.listen_for_queries()
+    finally:
+        # Don't lose history still waiting to be written
+        await llm_service.states.flush()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,336 @@
+# session_state.py
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from common.context_assembler import SessionContext, TokenCounter
+
+logger = logging.getLogger(__name__)
+
+# Rough costs beyond the history text itself, per segment (the str header, the
+# segment object and its deque slot) and per session (the state, its context
+# and the history deque's first block); see benchmark_session_memory.py
+SEGMENT_OVERHEAD_BYTES = 130
+SESSION_OVERHEAD_BYTES = 1200
+
+
+class SessionState:
+    """One session's cognitive state: prompt-ready history, the AI's current mood
+    and the user's emotion as heard in their voice"""
+
+    __slots__ = ("context", "mood", "confidence", "mood_at", "user_emotion", "user_arousal",
+                 "user_confidence", "last_active", "size")
+
+    def __init__(self, context: SessionContext, mood: str = "neutral", confidence: float = 0.5, mood_at: float = 0.0):
+        self.context = context
+        # Moods come from a small vocabulary; one shared string per mood across sessions
+        self.mood = sys.intern(mood)
+        self.confidence = confidence
+        self.mood_at = mood_at
+        self.user_emotion = ""  # Unknown until the emotional analyzer has heard them
+        self.user_arousal = 0.0
+        self.user_confidence = 0.0
+        self.last_active = time.monotonic()
+        self.size = 0
+
+    def emotional_state(self) -> dict:
+        """The mood as the prompt shows it"""
+        state = {"mood": self.mood, "confidence": self.confidence}
+        if self.mood_at:
+            state["timestamp"] = datetime.utcfromtimestamp(self.mood_at).isoformat()
+        return state
+
+    def set_user_emotion(self, emotion: str, arousal: float, confidence: float):
+        self.user_emotion = sys.intern(emotion)
+        self.user_arousal = arousal
+        self.user_confidence = confidence
+
+    def user_emotional_state(self) -> dict:
+        """The user's emotion as the prompt shows it, or {} if not yet known"""
+        if not self.user_emotion:
+            return {}
+        return {"emotion": self.user_emotion, "arousal": self.user_arousal, "confidence": self.user_confidence}
+
+
+class SessionStateStore:
+    """Per-session cognitive state held in process, with write-behind to Redis.
+
+    States are loaded lazily on a session's first query, one pipeline for its
+    history and mood, and kept in an LRU bounded by session count and
+    approximate bytes; sessions idle past idle_seconds are dropped. Updates
+    apply to the state at once and are queued; a background task writes the
+    queue out in batches, one pipeline per flush. A session that misses the
+    store waits for its queued writes to land before loading, so it never
+    reads stale state.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        token_counter: TokenCounter,
+        format_entry,
+        max_sessions: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        idle_seconds: float = 1800,
+        load_limit: int = 10,
+        max_entries: int = 100,
+        ttl_seconds: int = 86400,
+        flush_interval: float = 0.05,
+        max_pending: int = 10000,
+        key_prefix: str = "conversation",
+        state_key_prefix: str = "cognitive_state",
+        user_emotion_key_prefix: str = "user_emotion"
+    ):
+        self.redis_client = redis_client
+        self.token_counter = token_counter
+        self.format_entry = format_entry
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.load_limit = load_limit
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.key_prefix = key_prefix
+        self.state_key_prefix = state_key_prefix
+        self.user_emotion_key_prefix = user_emotion_key_prefix
+
+        # Least recently used first
+        self.sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self.bytes = 0
+        self.loading: Dict[str, asyncio.Future] = {}
+
+        # (session_id, serialized entry) not yet written, oldest first
+        self.pending: List[Tuple[str, str]] = []
+        # session_id -> latest mood fields not yet written
+        self.pending_moods: Dict[str, dict] = {}
+        self.flush_lock = asyncio.Lock()
+        self.flush_wanted = asyncio.Event()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "idle_evictions": 0,
+            "evicted_bytes": 0,
+            "writes_queued": 0,
+            "writes_flushed": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "writes_dropped": 0
+        }
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.key_prefix}:{session_id}"
+
+    def _state_key(self, session_id: str) -> str:
+        return f"{self.state_key_prefix}:{session_id}"
+
+    def _user_emotion_key(self, session_id: str) -> str:
+        return f"{self.user_emotion_key_prefix}:{session_id}"
+
+    @staticmethod
+    def _size(state: SessionState) -> int:
+        return SESSION_OVERHEAD_BYTES + sum(len(segment.text) + SEGMENT_OVERHEAD_BYTES for segment in state.context.history)
+
+    def _evict(self, session_id: str, counter: str):
+        state = self.sessions.pop(session_id)
+        self.bytes -= state.size
+        self.stats[counter] += 1
+        self.stats["evicted_bytes"] += state.size
+
+    def _resize(self, session_id: str, state: SessionState):
+        self.bytes -= state.size
+        state.size = self._size(state)
+        self.bytes += state.size
+
+        # Never evict the session just touched
+        while len(self.sessions) > 1 and (len(self.sessions) > self.max_sessions or self.bytes > self.max_bytes):
+            oldest = next(iter(self.sessions))
+            if oldest == session_id:
+                break
+            self._evict(oldest, "evictions")
+
+    def evict_idle(self):
+        """Drop states of sessions idle for longer than idle_seconds"""
+        cutoff = time.monotonic() - self.idle_seconds
+        while self.sessions:
+            oldest = next(iter(self.sessions))
+            if self.sessions[oldest].last_active > cutoff:
+                break
+            self._evict(oldest, "idle_evictions")
+
+    async def get(self, session_id: str) -> SessionState:
+        """The session's state, loaded from Redis on a miss"""
+        state = self.sessions.get(session_id)
+        if state is not None:
+            self.sessions.move_to_end(session_id)
+            state.last_active = time.monotonic()
+            self.stats["hits"] += 1
+            return state
+
+        # Concurrent misses for one session share a single load
+        loading = self.loading.get(session_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.loading[session_id] = future
+        try:
+            state = await self._load(session_id)
+            self.sessions[session_id] = state
+            self._resize(session_id, state)
+            future.set_result(state)
+            return state
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Marks it retrieved for when nobody else was waiting
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            del self.loading[session_id]
+
+    async def _load(self, session_id: str) -> SessionState:
+        if session_id in self.pending_moods or any(pending_id == session_id for pending_id, _ in self.pending):
+            await self.flush()
+        else:
+            # A flush in progress may hold this session's writes
+            async with self.flush_lock:
+                pass
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.lrange(self._key(session_id), 0, self.load_limit - 1)
+        pipe.hgetall(self._state_key(session_id))
+        # Written by the emotional analyzer, not by this store
+        pipe.hgetall(self._user_emotion_key(session_id))
+        items, saved, user_emotion = await pipe.execute()
+
+        # History is stored newest first
+        context = SessionContext(self.token_counter)
+        for item in reversed(items):
+            context.add_history(self.format_entry(json.loads(item)))
+        if not saved:
+            state = SessionState(context)
+        else:
+            state = SessionState(
+                context,
+                mood=saved.get(b"mood", b"neutral").decode(),
+                confidence=float(saved.get(b"confidence", b"0.5")),
+                mood_at=float(saved.get(b"updated_at", b"0"))
+            )
+        if user_emotion:
+            state.set_user_emotion(
+                user_emotion.get(b"emotion", b"").decode(),
+                float(user_emotion.get(b"arousal", b"0")),
+                float(user_emotion.get(b"confidence", b"0"))
+            )
+        return state
+
+    def _queue(self):
+        queued = len(self.pending) + len(self.pending_moods)
+        if queued >= self.max_pending and self.pending:
+            # Redis is behind or down; keep memory bounded by dropping the oldest writes
+            dropped = min(queued - self.max_pending + 1, len(self.pending))
+            del self.pending[:dropped]
+            self.stats["writes_dropped"] += dropped
+            logger.warning(f"Session state write queue full; dropped {dropped} entries")
+        self.stats["writes_queued"] += 1
+        self.flush_wanted.set()
+
+    def add_history(self, session_id: str, entry: dict):
+        """Add an entry to the session's history now and queue it for Redis"""
+        state = self.sessions.get(session_id)
+        if state is not None:
+            state.context.add_history(self.format_entry(entry))
+            self._resize(session_id, state)
+        self._queue()
+        self.pending.append((session_id, json.dumps(entry)))
+
+    def set_mood(self, session_id: str, mood: str, confidence: float = 0.5):
+        """Update the session's mood now and queue it for Redis"""
+        now = time.time()
+        state = self.sessions.get(session_id)
+        if state is not None:
+            state.mood = sys.intern(mood)
+            state.confidence = confidence
+            state.mood_at = now
+        self._queue()
+        self.pending_moods[session_id] = {"mood": mood, "confidence": confidence, "updated_at": now}
+
+    def set_user_emotion(self, session_id: str, emotion: str, arousal: float, confidence: float):
+        """Update the user's emotion if the session is in memory; a later load reads it from Redis"""
+        state = self.sessions.get(session_id)
+        if state is not None:
+            state.set_user_emotion(emotion, arousal, confidence)
+
+    async def flush(self):
+        """Write all queued updates in one pipeline"""
+        async with self.flush_lock:
+            if not self.pending and not self.pending_moods:
+                return
+            batch, self.pending = self.pending, []
+            moods, self.pending_moods = self.pending_moods, {}
+
+            by_session: "OrderedDict[str, List[str]]" = OrderedDict()
+            for session_id, item in batch:
+                by_session.setdefault(session_id, []).append(item)
+
+            pipe = self.redis_client.pipeline(transaction=False)
+            for session_id, items in by_session.items():
+                key = self._key(session_id)
+                # LPUSH of several values leaves the last one at the head, as separate pushes would
+                pipe.lpush(key, *items)
+                pipe.ltrim(key, 0, self.max_entries - 1)
+                pipe.expire(key, self.ttl_seconds)
+            for session_id, fields in moods.items():
+                key = self._state_key(session_id)
+                pipe.hset(key, mapping=fields)
+                pipe.expire(key, self.ttl_seconds)
+            try:
+                await pipe.execute()
+            except Exception:
+                # Retried on the next flush, ahead of anything queued since
+                self.pending = batch + self.pending
+                self.pending_moods = {**moods, **self.pending_moods}
+                self.stats["flush_errors"] += 1
+                raise
+            self.stats["flushes"] += 1
+            self.stats["writes_flushed"] += len(batch) + len(moods)
+
+    async def run(self, sweep_interval: float = 60):
+        """Flush queued writes in the background, batching those that arrive close together,
+        and drop idle sessions"""
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_wanted.wait(), timeout=sweep_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            if self.flush_wanted.is_set():
+                await asyncio.sleep(self.flush_interval)
+                self.flush_wanted.clear()
+                try:
+                    await self.flush()
+                except Exception as e:
+                    logger.error(f"Error flushing session state: {e}")
+                    self.flush_wanted.set()
+                    await asyncio.sleep(1)
+            self.evict_idle()
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "sessions": len(self.sessions),
+            "bytes": self.bytes,
+            "pending": len(self.pending) + len(self.pending_moods),
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+        }
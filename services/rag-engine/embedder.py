@@ -0,0 +1,103 @@
+# embedder.py
+import hashlib
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class Embedder(ABC):
+    """Maps texts to L2-normalized float32 vectors of size dim"""
+
+    name = "base"
+    dim = 0
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """One row per text"""
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """A sentence-transformers model on the CPU"""
+
+    def __init__(self, model_name: str, batch_size: int = 64, cache_size: int = 4096):
+        from sentence_transformers import SentenceTransformer
+
+        # Downloaded once into SENTENCE_TRANSFORMERS_HOME and loaded from there afterwards
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = f"st:{model_name}"
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+        # Repeated queries (the same utterance retried, common phrases) skip the model
+        self._embed_query = lru_cache(maxsize=cache_size)(self._embed_one)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return vectors.astype(np.float32, copy=False)
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vector = self.embed([text])[0]
+        vector.setflags(write=False)
+        return vector
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._embed_query(text)
+
+
+class HashingEmbedder(Embedder):
+    """Hashed word and word-pair counts; no model, for tests and machines without one"""
+
+    def __init__(self, dim: int = 384):
+        self.name = f"hashing:{dim}"
+        self.dim = dim
+
+    def _features(self, text: str):
+        words = _WORD_RE.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                # The top bit picks a sign so collisions tend to cancel out
+                vectors[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def embedder_name() -> str:
+    """Name create_embedder's embedder will have, without loading a model"""
+    embedder = os.getenv("RAG_EMBEDDER", "sentence-transformers").lower()
+    if embedder == "hashing":
+        return f"hashing:{int(os.getenv('RAG_HASHING_DIM', '384'))}"
+    return f"st:{os.getenv('RAG_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')}"
+
+
+def create_embedder() -> Embedder:
+    """Embedder selected by RAG_EMBEDDER: sentence-transformers (default) or hashing"""
+    embedder = os.getenv("RAG_EMBEDDER", "sentence-transformers").lower()
+    if embedder == "hashing":
+        logger.info("Using hashing embedder")
+        return HashingEmbedder(int(os.getenv("RAG_HASHING_DIM", "384")))
+    if embedder == "sentence-transformers":
+        return SentenceTransformerEmbedder(os.getenv("RAG_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"))
+    raise ValueError(f"Unknown embedder: {embedder}")
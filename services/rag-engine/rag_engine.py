@@ -0,0 +1,138 @@
+# rag_engine.py
+import asyncio
+import redis.asyncio as redis
+import json
+import os
+import logging
+import time
+from typing import Dict, List
+from common.stream_rpc import StreamRpcServer
+from embedder import create_embedder
+from vault_ingester import VaultIngester
+from vector_store import VectorStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class RagEngine:
+    def __init__(self):
+        self.redis_client = None
+
+        # Stream names
+        self.rag_request_stream = "rag_request_stream"
+
+        self.embedder = create_embedder()
+        self.store = VectorStore(
+            os.getenv("RAG_DATA_DIR", "/data/rag"),
+            ivf_min_vectors=int(os.getenv("RAG_IVF_MIN_VECTORS", "50000")),
+            nprobe=int(os.getenv("RAG_IVF_NPROBE", "8"))
+        )
+        self.top_k = int(os.getenv("RAG_TOP_K", "5"))
+        self.min_score = float(os.getenv("RAG_MIN_SCORE", "0.25"))
+        self.max_concurrency = int(os.getenv("RAG_MAX_CONCURRENCY", "8"))
+        self.refresh_seconds = 2
+
+        # Notes from the Obsidian vault, re-ingested as they change
+        self.vault_dir = os.getenv("VAULT_DIR", "/vault")
+        self.vault_poll_seconds = float(os.getenv("VAULT_POLL_SECONDS", "5"))
+        self.ingester = VaultIngester(
+            self.vault_dir,
+            self.store,
+            embedder=self.embedder.name,
+            workers=int(os.getenv("RAG_INGEST_WORKERS", "2"))
+        )
+
+    async def init_redis(self):
+        """Initialize the pooled Redis connection, from REDIS_URL as given"""
+        pool = redis.BlockingConnectionPool.from_url(
+            os.getenv("REDIS_URL", "redis://localhost:6379"),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+        )
+        self.redis_client = redis.Redis(connection_pool=pool)
+
+    def lookup(self, query: str, k: int) -> List[Dict]:
+        """The k chunks most relevant to a query"""
+        if self.store.embedder and self.store.embedder != self.embedder.name:
+            # Vectors from another model aren't comparable; the store needs re-ingesting
+            logger.warning(f"Store was built with {self.store.embedder}, queries use {self.embedder.name}")
+            return []
+
+        hits = self.store.search(self.embedder.embed_query(query), k, self.min_score)
+        if not hits:
+            # Nothing semantically close; exact words may still find a note
+            hits = self.store.search_text(query, k)
+        chunks = self.store.chunks([chunk_id for chunk_id, _ in hits])
+        results = []
+        for chunk_id, score in hits:
+            if chunk_id not in chunks:
+                continue  # Removed by an update committed mid-lookup
+            doc_id, heading, text = chunks[chunk_id]
+            results.append({"doc_id": doc_id, "heading": heading, "relevance": round(score, 3), "excerpt": text})
+        return results
+
+    @staticmethod
+    def format_chunk(result: Dict) -> str:
+        """A chunk as prompt text, with an Obsidian-style link to where it came from"""
+        source = f"{result['doc_id']}#{result['heading']}" if result["heading"] else result["doc_id"]
+        return f"[[{source}]] {result['excerpt']}"
+
+    async def handle_request(self, fields: dict) -> dict:
+        query = fields.get(b"query", b"").decode()
+        k = int(fields.get(b"top_k", b"0").decode() or 0) or self.top_k
+
+        started = time.perf_counter()
+        results = await asyncio.to_thread(self.lookup, query, k) if query.strip() else []
+        took_ms = (time.perf_counter() - started) * 1000
+        if took_ms > 100:
+            logger.warning(f"Context lookup took {took_ms:.0f}ms for {self.store.count} chunks")
+
+        return {
+            # What get_context feeds to the context assembler
+            "relevant_chunks": json.dumps([self.format_chunk(r) for r in results]),
+            "sources": json.dumps(results),
+            "took_ms": f"{took_ms:.1f}"
+        }
+
+    async def refresh_store(self):
+        """Switch to new store versions as the ingester commits them"""
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await asyncio.to_thread(self.store.load)
+            except Exception as e:
+                logger.error(f"Error loading vector store: {e}")
+
+    async def ingest_vault(self):
+        """Keep the store in step with the vault"""
+        while True:
+            try:
+                await asyncio.to_thread(self.ingester.ingest_once)
+            except Exception as e:
+                logger.error(f"Error ingesting vault: {e}")
+            await asyncio.sleep(self.vault_poll_seconds)
+
+    async def start(self):
+        """Start the RAG engine"""
+        await self.init_redis()
+        await asyncio.to_thread(self.store.load)
+
+        # Load the model's weights before the first real query needs them
+        await asyncio.to_thread(self.embedder.embed_query, "warm up")
+
+        # Start background tasks
+        asyncio.create_task(self.refresh_store())
+        if os.path.isdir(self.vault_dir):
+            asyncio.create_task(self.ingest_vault())
+        else:
+            logger.warning(f"No vault at {self.vault_dir}; serving the store as it is")
+
+        logger.info(f"Starting RAG engine with {self.embedder.name} ({self.store.count} chunks)...")
+        server = StreamRpcServer(self.redis_client, self.rag_request_stream, self.handle_request, self.max_concurrency)
+        await server.serve()
+
+async def main():
+    engine = RagEngine()
+    await engine.start()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,233 @@
+# vault_ingester.py
+"""Keeps the vector store in step with an Obsidian vault.
+
+The vault is polled: files whose size and mtime are unchanged are skipped
+without being read, and the rest are compared by content hash. Changed notes
+are split into chunks at their headings, and only chunks whose text is new
+are embedded, in batches across a process pool. Each pass is committed to
+the store as one new version.
+
+    python vault_ingester.py --vault /vault --data-dir /data/rag --once
+"""
+import argparse
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embedder import create_embedder, embedder_name
+from vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+
+def strip_frontmatter(text: str) -> str:
+    """Drop the YAML properties block Obsidian keeps at the top of a note"""
+    if text.startswith("---\n"):
+        end = text.find("\n---\n", 3)
+        if end != -1:
+            return text[end + len("\n---\n"):]
+    return text
+
+
+def split_long(text: str, max_chars: int) -> List[str]:
+    """Split at paragraph breaks so no piece is much over max_chars"""
+    if len(text) <= max_chars:
+        return [text]
+    pieces, current = [], ""
+    for paragraph in _PARAGRAPH_RE.split(text):
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_markdown(text: str, max_chars: int = 1500) -> List[Tuple[str, str]]:
+    """(heading path, text) per section; headings inside code blocks don't count"""
+    sections: List[Tuple[str, List[str]]] = [("", [])]
+    headings: List[Tuple[int, str]] = []
+    in_fence = False
+
+    for line in strip_frontmatter(text).splitlines():
+        if _FENCE_RE.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else _HEADING_RE.match(line)
+        if match:
+            level = len(match.group(1))
+            headings = [h for h in headings if h[0] < level] + [(level, match.group(2))]
+            sections.append((" > ".join(h[1] for h in headings), []))
+        else:
+            sections[-1][1].append(line)
+
+    chunks = []
+    for heading, lines in sections:
+        body = "\n".join(lines).strip()
+        if body:
+            chunks.extend((heading, piece) for piece in split_long(body, max_chars))
+    return chunks
+
+
+def chunk_hash(heading: str, text: str) -> str:
+    return hashlib.sha1(f"{heading}\n{text}".encode()).hexdigest()
+
+
+# Each worker process loads the embedding model once, so every worker holds its own
+# copy: a few hundred MB for a sentence-transformers model, next to the one in the engine
+_worker_embedder = None
+
+
+def _init_worker():
+    global _worker_embedder
+    _worker_embedder = create_embedder()
+
+
+def _embed_batch(texts: List[str]) -> np.ndarray:
+    return _worker_embedder.embed(texts)
+
+
+class VaultIngester:
+    def __init__(
+        self,
+        vault_dir: str,
+        store: VectorStore,
+        embedder: Optional[str] = None,
+        workers: int = 2,
+        batch_size: int = 64,
+        max_chunk_chars: int = 1500
+    ):
+        self.vault_dir = vault_dir
+        self.store = store
+        self.embedder = embedder or embedder_name()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_chunk_chars = max_chunk_chars
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def scan(self) -> Dict[str, Tuple[str, float, int]]:
+        """doc_id -> (path, mtime, size) for every note; doc_id is the path without .md, like an Obsidian link"""
+        files = {}
+        for root, dirs, names in os.walk(self.vault_dir):
+            # .obsidian holds settings, .trash deleted notes
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in names:
+                if not name.endswith(".md"):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                doc_id = os.path.relpath(path, self.vault_dir)[:-len(".md")].replace(os.sep, "/")
+                files[doc_id] = (path, stat.st_mtime, stat.st_size)
+        return files
+
+    def changes(self):
+        """Changed notes with their content, notes only touched, and removed notes"""
+        known = self.store.documents()
+        files = self.scan()
+        changed, touched = {}, {}
+        for doc_id, (path, mtime, size) in files.items():
+            previous = known.get(doc_id)
+            if previous and previous[1] == mtime and previous[2] == size:
+                continue
+            with open(path, encoding="utf-8", errors="replace") as f:
+                content = f.read()
+            document = {
+                "content_hash": hashlib.sha256(content.encode()).hexdigest(),
+                "mtime": mtime,
+                "size": size,
+                "content": content
+            }
+            if previous and previous[0] == document["content_hash"]:
+                touched[doc_id] = document  # Saved without edits, or synced
+            else:
+                changed[doc_id] = document
+        removed = [doc_id for doc_id in known if doc_id not in files]
+        return changed, touched, removed
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if self.executor is None:
+            # Spawned, not forked: the engine's event loop and model threads don't survive a fork
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        return np.concatenate(list(self.executor.map(_embed_batch, batches)))
+
+    def ingest_once(self) -> bool:
+        """One pass over the vault; True if the store changed"""
+        started = time.monotonic()
+        self.store.load()
+        changed, touched, removed = self.changes()
+        if touched:
+            self.store.touch_documents({doc_id: (d["mtime"], d["size"]) for doc_id, d in touched.items()})
+        if not changed and not removed:
+            return False
+
+        # Chunks whose text didn't change keep their vectors
+        existing = self.store.vectors_by_hash(list(changed))
+        pending: Dict[str, str] = {}
+        for doc_id, document in changed.items():
+            document["chunks"] = [
+                (heading, text, chunk_hash(heading, text))
+                for heading, text in chunk_markdown(document.pop("content"), self.max_chunk_chars)
+            ]
+            for heading, text, key in document["chunks"]:
+                if key not in existing:
+                    pending[key] = f"{heading}\n{text}" if heading else text
+
+        vectors = dict(existing)
+        if pending:
+            vectors.update(zip(pending, self.embed(list(pending.values()))))
+        for document in changed.values():
+            document["chunks"] = [(heading, text, key, vectors[key]) for heading, text, key in document["chunks"]]
+
+        self.store.update_documents(changed, removed, self.embedder)
+        logger.info(
+            f"Ingested {len(changed)} changed and {len(removed)} removed notes "
+            f"({len(pending)} chunks embedded, {sum(len(d['chunks']) for d in changed.values()) - len(pending)} reused) "
+            f"in {time.monotonic() - started:.1f}s; {self.store.count} chunks in store"
+        )
+        return True
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Ingest an Obsidian vault into the RAG vector store")
+    parser.add_argument("--vault", default=os.getenv("VAULT_DIR", "/vault"))
+    parser.add_argument("--data-dir", default=os.getenv("RAG_DATA_DIR", "/data/rag"))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("RAG_INGEST_WORKERS", "2")))
+    parser.add_argument("--interval", type=float, default=float(os.getenv("VAULT_POLL_SECONDS", "5")))
+    parser.add_argument("--once", action="store_true", help="ingest once and exit")
+    args = parser.parse_args()
+
+    store = VectorStore(args.data_dir, ivf_min_vectors=int(os.getenv("RAG_IVF_MIN_VECTORS", "50000")))
+    ingester = VaultIngester(args.vault, store, workers=args.workers)
+    try:
+        while True:
+            ingester.ingest_once()
+            if args.once:
+                break
+            time.sleep(args.interval)
+    finally:
+        ingester.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+# vector_store.py
+"""Knowledge-base chunks and their embeddings.
+
+Vectors live in a float32 matrix file that is memory-mapped, so the page
+cache holds it once however many processes read it; a companion array maps
+matrix rows to chunk IDs. Chunk text and the current matrix version live in
+SQLite, and committing a new version there is the single step that switches
+readers over. Chunk IDs are never reused, so a reader still on the previous
+matrix finds its chunks or nothing, never another chunk's text.
+"""
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id TEXT NOT NULL,
+    heading TEXT,
+    text TEXT NOT NULL,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS chunks_doc ON chunks(doc_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    heading, text, content='chunks', content_rowid='id', tokenize='porter unicode61'
+);
+
+-- Source files as last ingested, to skip unchanged ones cheaply
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    mtime REAL,
+    size INTEGER,
+    indexed_at REAL
+);
+"""
+
+
+class IvfIndex:
+    """Inverted file index: vectors grouped by nearest centroid, searched a few groups at a time"""
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray):
+        self.centroids = centroids
+        self.order = order      # Matrix rows sorted by list
+        self.offsets = offsets  # List i is order[offsets[i]:offsets[i + 1]]
+
+    @classmethod
+    def build(
+        cls,
+        matrix: np.ndarray,
+        n_lists: int,
+        iterations: int = 10,
+        seed: int = 0,
+        centroids: Optional[np.ndarray] = None
+    ) -> "IvfIndex":
+        """Spherical k-means on a sample, then every row assigned to its nearest centroid.
+        Given centroids (from the previous version) skip the training."""
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(matrix), n_lists * 256)
+        sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))])
+        if centroids is None:
+            centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        else:
+            iterations = 0
+            n_lists = len(centroids)
+
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for i in range(n_lists):
+                members = sample[assignment == i]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[i] = centroid / max(np.linalg.norm(centroid), 1e-12)
+
+        # Assign in blocks so the score matrix stays small
+        assignment = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), 65536):
+            block = np.asarray(matrix[start:start + 65536])
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+        order = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1)).astype(np.int64)
+        return cls(centroids, order, offsets)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        nearest = np.argsort(self.centroids @ query)[::-1][:nprobe]
+        return np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in nearest])
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, centroids=self.centroids, order=self.order, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path: str) -> "IvfIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["order"], data["offsets"])
+
+
+class VectorStore:
+    def __init__(self, directory: str, ivf_min_vectors: int = 50000, nprobe: int = 8):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = os.path.join(directory, "store.db")
+        # Below this size a full scan is already within budget and exact
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+        self.version = 0
+        self.dim = 0
+        self.embedder = None
+        # Swapped as one tuple so a search never mixes versions: (matrix, row -> chunk id, index)
+        self.mapped: Tuple[np.ndarray, np.ndarray, Optional[IvfIndex]] = (
+            np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=np.int64), None
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers run while the ingester writes
+        if not hasattr(self._local, "connection"):
+            connection = sqlite3.connect(self.db_path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return self._local.connection
+
+    def _path(self, kind: str, version: int) -> str:
+        extension = {"vectors": "f32", "ids": "npy", "ivf": "npz"}[kind]
+        return os.path.join(self.directory, f"{kind}-{version}.{extension}")
+
+    def _meta(self) -> Dict[str, str]:
+        return dict(self._connection().execute("SELECT key, value FROM meta"))
+
+    @property
+    def count(self) -> int:
+        return len(self.mapped[1])
+
+    def load(self) -> bool:
+        """Map the current version if it changed; True when it did"""
+        meta = self._meta()
+        version = int(meta.get("version", 0))
+        if version == self.version:
+            return False
+
+        count, dim = int(meta["count"]), int(meta["dim"])
+        if count:
+            matrix = np.memmap(self._path("vectors", version), dtype=np.float32, mode="r", shape=(count, dim))
+            ids = np.load(self._path("ids", version))
+        else:
+            matrix, ids = np.zeros((0, dim), dtype=np.float32), np.zeros(0, dtype=np.int64)
+        ivf_path = self._path("ivf", version)
+        ivf = IvfIndex.load(ivf_path) if os.path.exists(ivf_path) else None
+
+        self.mapped = (matrix, ids, ivf)
+        self.dim, self.version = dim, version
+        self.embedder = meta.get("embedder")
+        logger.info(f"Vector store version {version}: {count} chunks, {'ivf' if ivf else 'flat'} index")
+        return True
+
+    def search(self, query: np.ndarray, k: int, min_score: float = -1.0) -> List[Tuple[int, float]]:
+        """IDs of the k chunks most similar to an L2-normalized query, best first"""
+        matrix, ids, ivf = self.mapped
+        if not len(ids) or k <= 0:
+            return []
+
+        if ivf is not None:
+            rows = ivf.candidates(query, self.nprobe)
+            scores = matrix[rows] @ query
+        else:
+            rows = np.arange(len(ids))
+            scores = matrix @ query
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[rows[i]]), float(scores[i])) for i in top if scores[i] >= min_score]
+
+    def chunks(self, chunk_ids: Sequence[int]) -> Dict[int, Tuple[str, str, str]]:
+        """doc_id, heading and text of the given chunks"""
+        if not chunk_ids:
+            return {}
+        placeholders = ",".join("?" * len(chunk_ids))
+        return {
+            chunk_id: (doc_id, heading, text)
+            for chunk_id, doc_id, heading, text in self._connection().execute(
+                f"SELECT id, doc_id, heading, text FROM chunks WHERE id IN ({placeholders})", list(chunk_ids)
+            )
+        }
+
+    def search_text(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """IDs of the chunks best matching the query's words, best first"""
+        match = " ".join('"{}"'.format(word.replace('"', '""')) for word in query.split())
+        if not match:
+            return []
+        rows = self._connection().execute(
+            "SELECT rowid, bm25(chunks_fts) FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY bm25(chunks_fts) LIMIT ?",
+            (match, limit)
+        )
+        return [(chunk_id, -rank) for chunk_id, rank in rows]
+
+    def documents(self) -> Dict[str, Tuple[str, float, int]]:
+        """doc_id -> (content_hash, mtime, size) of every ingested document"""
+        return {
+            doc_id: (content_hash, mtime, size)
+            for doc_id, content_hash, mtime, size in self._connection().execute(
+                "SELECT doc_id, content_hash, mtime, size FROM documents"
+            )
+        }
+
+    def touch_documents(self, documents: Dict[str, Tuple[float, int]]):
+        """Record new mtime and size for documents whose content didn't change"""
+        with self._connection() as connection:
+            connection.executemany(
+                "UPDATE documents SET mtime = ?, size = ? WHERE doc_id = ?",
+                ((mtime, size, doc_id) for doc_id, (mtime, size) in documents.items())
+            )
+
+    def vectors_by_hash(self, doc_ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Current vectors of these documents' chunks, keyed by chunk content hash"""
+        matrix, ids, _ = self.mapped
+        if not doc_ids or not len(ids):
+            return {}
+        connection = self._connection()
+        hashes = {}
+        for doc_id in doc_ids:
+            hashes.update(connection.execute("SELECT id, content_hash FROM chunks WHERE doc_id = ?", (doc_id,)))
+        rows = np.nonzero(np.isin(ids, np.fromiter(hashes, dtype=np.int64, count=len(hashes))))[0]
+        return {hashes[int(ids[row])]: np.array(matrix[row]) for row in rows}
+
+    def _write_version(self, version: int, vectors: np.ndarray, ids: np.ndarray,
+                       centroids: Optional[np.ndarray] = None):
+        """Files for a version; readers can't see them until its meta row is committed"""
+        path = self._path("vectors", version)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+        with open(self._path("ids", version), "wb") as f:
+            np.save(f, ids.astype(np.int64))
+
+        if len(vectors) >= self.ivf_min_vectors:
+            n_lists = max(int(np.sqrt(len(vectors))), 1)
+            IvfIndex.build(vectors, n_lists, centroids=centroids).save(self._path("ivf", version))
+
+    def _set_meta(self, connection: sqlite3.Connection, version: int, shape: Tuple[int, int], embedder: str):
+        connection.executemany(
+            "INSERT INTO meta(key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            [("version", str(version)), ("count", str(shape[0])), ("dim", str(shape[1])), ("embedder", embedder)]
+        )
+
+    def _next_chunk_id(self, connection: sqlite3.Connection) -> int:
+        # AUTOINCREMENT keeps this above every ID ever handed out, even deleted ones
+        row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'chunks'").fetchone()
+        return (row[0] if row else 0) + 1
+
+    def write(self, vectors: np.ndarray, chunks: List[Tuple[str, str, str]], embedder: str):
+        """Replace the whole store: row i of vectors embeds chunks[i] (doc_id, heading, text)"""
+        connection = self._connection()
+        version = int(self._meta().get("version", 0)) + 1
+        first_id = self._next_chunk_id(connection)
+        ids = np.arange(first_id, first_id + len(chunks), dtype=np.int64)
+        self._write_version(version, vectors, ids)
+
+        with connection:
+            connection.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('delete-all')")
+            connection.execute("DELETE FROM chunks")
+            self._insert_chunks(connection, [
+                (int(chunk_id), doc_id, heading, text, None)
+                for chunk_id, (doc_id, heading, text) in zip(ids, chunks)
+            ])
+            self._set_meta(connection, version, vectors.shape, embedder)
+
+        self._remove_old_versions(version)
+
+    def _insert_chunks(self, connection: sqlite3.Connection, rows: List[Tuple[int, str, str, str, Optional[str]]]):
+        connection.executemany(
+            "INSERT INTO chunks(id, doc_id, heading, text, content_hash) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        connection.executemany(
+            "INSERT INTO chunks_fts(rowid, heading, text) VALUES (?, ?, ?)",
+            ((chunk_id, heading or "", text) for chunk_id, _, heading, text, _ in rows)
+        )
+
+    def update_documents(self, documents: Dict[str, Dict], removed: Sequence[str], embedder: str):
+        """Replace some documents' chunks and drop others, as one new version.
+
+        documents maps doc_id to {"content_hash", "mtime", "size", "chunks"}, where
+        chunks is a list of (heading, text, content_hash, vector). Vectors of every
+        other document are carried over from the current version unchanged.
+        """
+        connection = self._connection()
+        meta = self._meta()
+        current = int(meta.get("version", 0))
+        self.load()
+        matrix, ids, ivf = self.mapped
+        if meta.get("embedder") not in (None, embedder) and len(ids):
+            raise ValueError(f"Store was built with {meta.get('embedder')}; rebuild it to switch to {embedder}")
+
+        # Both may hold thousands of documents on a first ingest, too many for an IN list
+        replaced = set(documents) | set(removed)
+        dropped = [chunk_id for chunk_id, doc_id in connection.execute("SELECT id, doc_id FROM chunks")
+                   if doc_id in replaced]
+
+        new_chunks = [
+            (doc_id, heading, text, chunk_hash, vector)
+            for doc_id, document in documents.items()
+            for heading, text, chunk_hash, vector in document["chunks"]
+        ]
+        first_id = self._next_chunk_id(connection)
+        new_ids = np.arange(first_id, first_id + len(new_chunks), dtype=np.int64)
+
+        # Unchanged documents keep their rows; only the changed ones are appended
+        keep = ~np.isin(ids, np.array(dropped, dtype=np.int64))
+        dim = len(new_chunks[0][4]) if new_chunks else (matrix.shape[1] if len(ids) else 0)
+        new_vectors = np.array([chunk[4] for chunk in new_chunks], dtype=np.float32).reshape(-1, dim)
+        vectors = np.concatenate([np.asarray(matrix[keep]).reshape(-1, dim), new_vectors])
+        all_ids = np.concatenate([ids[keep], new_ids])
+
+        version = current + 1
+        # Small edits don't move the clusters; reuse them instead of retraining
+        centroids = ivf.centroids if ivf is not None and abs(len(all_ids) - len(ids)) < 0.1 * len(ids) else None
+        self._write_version(version, vectors, all_ids, centroids)
+
+        now = time.time()
+        with connection:
+            connection.executemany(
+                "INSERT INTO chunks_fts(chunks_fts, rowid, heading, text) "
+                "SELECT 'delete', id, COALESCE(heading, ''), text FROM chunks WHERE id = ?",
+                ((chunk_id,) for chunk_id in dropped)
+            )
+            connection.executemany("DELETE FROM chunks WHERE id = ?", ((chunk_id,) for chunk_id in dropped))
+            self._insert_chunks(connection, [
+                (int(chunk_id), doc_id, heading, text, chunk_hash)
+                for chunk_id, (doc_id, heading, text, chunk_hash, _) in zip(new_ids, new_chunks)
+            ])
+            if removed:
+                connection.executemany("DELETE FROM documents WHERE doc_id = ?", ((doc_id,) for doc_id in removed))
+            connection.executemany(
+                """INSERT INTO documents(doc_id, content_hash, mtime, size, indexed_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(doc_id) DO UPDATE SET content_hash = excluded.content_hash,
+                       mtime = excluded.mtime, size = excluded.size, indexed_at = excluded.indexed_at""",
+                (
+                    (doc_id, d["content_hash"], d["mtime"], d["size"], now)
+                    for doc_id, d in documents.items()
+                )
+            )
+            self._set_meta(connection, version, vectors.shape, embedder)
+
+        self._remove_old_versions(version)
+        self.load()
+
+    def _remove_old_versions(self, version: int):
+        # The previous version stays for readers that have not switched yet
+        for path in glob.glob(os.path.join(self.directory, "*-*.*")):
+            name = os.path.basename(path)
+            kind, _, rest = name.partition("-")
+            file_version = rest.split(".")[0]
+            if kind in ("vectors", "ids", "ivf") and file_version.isdigit() and int(file_version) < version - 1:
+                os.unlink(path)
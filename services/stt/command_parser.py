@@ -0,0 +1,84 @@
+# command_parser.py
+import re
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# Spoken forms for each command. Alternatives are compiled into a single
+# regex so one pass over a partial transcript finds every command.
+COMMAND_GRAMMAR = {
+    "start_recording": [r"(?:start|begin|resume) (?:the )?recording"],
+    "stop_recording": [r"(?:stop|end|finish) (?:the )?recording"],
+    "save_thought": [r"save (?:that|this|the) (?:thought|idea)"],
+}
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def compile_grammar(grammar: Dict[str, List[str]]) -> "re.Pattern":
+    alternatives = []
+    for command, patterns in grammar.items():
+        body = "|".join(f"(?:{p})" for p in patterns)
+        alternatives.append(f"(?P<{command}>{body})")
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+
+
+class CommandParser:
+    """Matches spoken commands in partial transcripts, once per utterance"""
+
+    def __init__(self, grammar: Optional[Dict[str, List[str]]] = None):
+        self.pattern = compile_grammar(grammar or COMMAND_GRAMMAR)
+        # Overlapping partial windows, the full window and the final flush all hear
+        # the same utterance; (session, command) -> span of audio it was heard in
+        self.heard: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+    def parse(self, text: str) -> List[Tuple[str, str]]:
+        """All (command, matched phrase) pairs in text"""
+        normalized = " ".join(_WORD_RE.findall(text.lower()))
+        return [(match.lastgroup, match.group(0)) for match in self.pattern.finditer(normalized)]
+
+    def remainder(self, text: str, command: str) -> str:
+        """Words spoken after a command phrase, e.g. the topic of a saved thought"""
+        normalized = " ".join(_WORD_RE.findall(text.lower()))
+        for match in self.pattern.finditer(normalized):
+            if match.lastgroup == command:
+                return normalized[match.end():].strip()
+        return ""
+
+    def feed(self, session_id: str, text: str, audio_start: float, audio_end: float) -> List[str]:
+        """Commands in text, heard in audio_start..audio_end, not already reported from that audio"""
+        # Audio positions rather than detection times, so a slow window still matches an earlier report
+        commands = []
+        for command, _ in self.parse(text):
+            key = (session_id, command)
+            heard = self.heard.get(key)
+            if heard and audio_start <= heard[1] and audio_end >= heard[0]:
+                # Same utterance again; later windows may reach further into it
+                self.heard[key] = (min(audio_start, heard[0]), max(audio_end, heard[1]))
+                continue
+            self.heard[key] = (audio_start, audio_end)
+            commands.append(command)
+        return commands
+
+    def forget(self, session_id: str):
+        for key in [key for key in self.heard if key[0] == session_id]:
+            del self.heard[key]
+
+
+class LatencyTracker:
+    """Rolling latency samples with percentile summaries"""
+
+    def __init__(self, size: int = 1000):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def summary(self) -> Dict:
+        if not self.samples:
+            return {"count": 0}
+        ordered = sorted(self.samples)
+
+        def pct(p):
+            return round(ordered[min(int(p * (len(ordered) - 1)), len(ordered) - 1)] * 1000, 1)
+
+        return {"count": len(ordered), "p50_ms": pct(0.5), "p95_ms": pct(0.95), "max_ms": pct(1.0)}
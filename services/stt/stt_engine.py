@@ -4,42 +4,79 @@ import json
 import base64
 import os
 from datetime import datetime
-from groq import AsyncGroq
 from typing import Dict, List, Optional
 import logging
 from collections import defaultdict
 import io
+import re
+import time
+import uuid
+import wave
+import numpy as np
 from pydub import AudioSegment
+from common.providers import create_groq_client
+from common.session_streams import publish_session_event
+from command_parser import CommandParser, LatencyTracker
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+def normalize_words(text: str) -> List[str]:
+    """Lowercase words with punctuation stripped, for phrase matching"""
+    return _WORD_RE.findall(text.lower())
+
 class AudioProcessor:
     def __init__(self):
-        self.groq_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+        self.groq_client = create_groq_client()
         self.redis_client = None
         
         # Stream names
         self.audio_stream = "audio_stream"
         self.transcript_stream = "transcript_stream"
+        self.llm_interaction_stream = "llm_interaction_stream"
         self.trigger_stream = "trigger_stream"
+        self.command_stream = "command_stream"
+        self.recording_command_stream = "recording_command_stream"
         
         # Session management
         self.sessions: Dict[str, dict] = defaultdict(lambda: {
             "audio_buffer": [],
+            "recent_audio": [],  # Sliding window for partial (command) transcription
+            "chunks_since_partial": 0,
+            "partial_in_flight": False,
+            "window_lock": asyncio.Lock(),  # Keeps full windows in order per session
             "transcript_buffer": "",
+            "recent_words": [],  # Tail of the previous window, for phrases split across windows
+            "speculation": None,  # Pending speculative trigger
+            "silence_ms": 0.0,  # Quiet audio since the last voiced chunk
             "last_activity": datetime.utcnow(),
             "is_recording": True
         })
         
-        # Trigger phrases and their associated prompts
+        # Trigger phrases and their associated prompts. Recording control and
+        # "save that thought" are commands, handled by the command parser.
         self.trigger_phrases = {
             "what do you think": "Analyze this thought and provide insights",
-            "stop recording": None,  # Special case - ends recording
             "interesting": "Explore what makes this interesting and related implications",
-            "summarize that": "Create a concise summary of the key points",
-            "save that thought": "Mark this as important and create a formatted highlight"
+            "summarize that": "Create a concise summary of the key points"
         }
+        self.max_trigger_words = max(len(trigger.split()) for trigger in self.trigger_phrases)
+        
+        # Start LLM calls early when a window ends partway through a trigger phrase
+        self.speculative_triggers = os.getenv("SPECULATIVE_TRIGGERS", "true").lower() == "true"
+        self.min_speculation_chars = 8
+        
+        # Fast command path: short partial windows transcribed only for commands
+        self.window_chunks = 20  # Assuming ~100ms chunks
+        self.partial_interval_chunks = int(os.getenv("COMMAND_PARTIAL_INTERVAL_CHUNKS", "5"))
+        self.partial_window_chunks = int(os.getenv("COMMAND_PARTIAL_WINDOW_CHUNKS", "10"))
+        self.command_parser = CommandParser()
+        self.command_latency = LatencyTracker()
+        
+        # Energy-based voice activity: chunks quieter than this RMS (16-bit PCM) count as pause
+        self.vad_rms_threshold = float(os.getenv("VAD_RMS_THRESHOLD", "500"))
         
     async def init_redis(self):
         """Initialize Redis connection"""
@@ -53,161 +90,341 @@ class AudioProcessor:
     
     async def process_audio_stream(self):
         """Main processing loop for audio chunks"""
+        # Start from the newest entry; "$" would skip chunks added between reads
+        latest = await self.redis_client.xrevrange(self.audio_stream, count=1)
+        last_id = latest[0][0] if latest else "0-0"
+        
         while True:
             try:
                 # Read from audio stream
                 messages = await self.redis_client.xread(
-                    {self.audio_stream: "$"},
+                    {self.audio_stream: last_id},
                     block=100
                 )
                 
                 for stream, msgs in messages:
                     for msg_id, fields in msgs:
-                        await self.process_audio_chunk(fields)
+                        last_id = msg_id
+                        self.process_audio_chunk(fields)
                         
             except Exception as e:
                 logger.error(f"Error in audio processing: {e}")
                 await asyncio.sleep(1)
     
-    async def process_audio_chunk(self, chunk_data: dict):
-        """Process individual audio chunk"""
+    def process_audio_chunk(self, chunk_data: dict):
+        """Buffer an audio chunk; transcription runs off the read loop"""
         session_id = chunk_data.get(b"session_id", b"").decode()
         audio_base64 = chunk_data.get(b"chunk", b"").decode()
         timestamp = chunk_data.get(b"timestamp", b"").decode()
         
         # Add to session buffer
         session = self.sessions[session_id]
-        session["audio_buffer"].append({
+        duration_ms, voiced = self.measure_chunk(audio_base64)
+        session["silence_ms"] = 0.0 if voiced else session["silence_ms"] + duration_ms
+        chunk_info = {
             "audio": audio_base64,
-            "timestamp": timestamp
-        })
+            "timestamp": timestamp,
+            "received_at": time.time(),
+            "silence_ms": session["silence_ms"]
+        }
+        session["audio_buffer"].append(chunk_info)
         session["last_activity"] = datetime.utcnow()
         
+        session["recent_audio"].append(chunk_info)
+        del session["recent_audio"][:-self.partial_window_chunks]
+        session["chunks_since_partial"] += 1
+        
+        # Short partial windows feed the command parser without waiting for a full window
+        if (self.partial_interval_chunks
+                and session["chunks_since_partial"] >= self.partial_interval_chunks
+                and not session["partial_in_flight"]):
+            session["chunks_since_partial"] = 0
+            session["partial_in_flight"] = True
+            asyncio.create_task(self.transcribe_partial(session_id, list(session["recent_audio"])))
+        
         # Process buffer if we have enough audio (e.g., 2 seconds worth)
-        # For Phase 1, we'll use a simple chunk-based approach
-        if len(session["audio_buffer"]) >= 20:  # Assuming ~100ms chunks
-            await self.transcribe_buffer(session_id)
+        if len(session["audio_buffer"]) >= self.window_chunks:
+            chunks = session["audio_buffer"]
+            session["audio_buffer"] = []
+            asyncio.create_task(self.transcribe_buffer(session_id, chunks))
     
-    async def transcribe_buffer(self, session_id: str):
-        """Transcribe accumulated audio buffer using Groq - FIXED VERSION"""
-        session = self.sessions[session_id]
+    def measure_chunk(self, audio_base64: str):
+        """Duration in ms of a 16kHz 16-bit PCM chunk, and whether it holds speech"""
+        pcm = base64.b64decode(audio_base64)
+        if pcm.startswith(b'RIFF'):
+            pcm = pcm[44:]
+        samples = np.frombuffer(pcm[:len(pcm) & ~1], dtype=np.int16)
+        if not samples.size:
+            return 0.0, False
+        rms = np.sqrt(np.mean(samples.astype(np.float32) ** 2))
+        return samples.size / 16, bool(rms >= self.vad_rms_threshold)
+    
+    async def transcribe_audio(self, chunks: List[dict]) -> str:
+        """Transcribe base64 audio chunks using Groq"""
+        # Concatenate all audio chunks properly
+        audio_data = b"".join(base64.b64decode(chunk_info["audio"]) for chunk_info in chunks)
         
-        if not session["audio_buffer"]:
-            return
+        # If the audio data is raw PCM, we need to add WAV headers
+        # Assuming 16kHz, mono, 16-bit PCM
+        if not audio_data.startswith(b'RIFF'):
+            wav_buffer = io.BytesIO()
+            with wave.open(wav_buffer, 'wb') as wav_file:
+                wav_file.setnchannels(1)  # Mono
+                wav_file.setsampwidth(2)  # 16-bit
+                wav_file.setframerate(16000)  # 16kHz
+                wav_file.writeframes(audio_data)
+            file_data = wav_buffer.getvalue()
+        else:
+            # Already a WAV file
+            file_data = audio_data
         
+        transcription = await self.groq_client.audio.transcriptions.create(
+            file=("audio.wav", file_data),
+            model="whisper-large-v3",
+            response_format="json",
+            language="en"
+        )
+        return transcription.text.strip()
+    
+    async def transcribe_partial(self, session_id: str, chunks: List[dict]):
+        """Transcribe the latest short window for commands only"""
         try:
-            # Concatenate all audio chunks properly
-            combined_audio_data = bytearray()
-            
-            logger.info(f"Concatenating {len(session['audio_buffer'])} chunks for session {session_id}")
-            
-            for chunk_info in session["audio_buffer"]:
-                # Decode base64 chunk
-                chunk_bytes = base64.b64decode(chunk_info["audio"])
-                combined_audio_data.extend(chunk_bytes)
-            
-            # Convert to bytes
-            audio_data = bytes(combined_audio_data)
-            
-            # Create temporary file for Groq API (it requires file upload)
-            temp_filename = f"/tmp/audio_{session_id}_{datetime.utcnow().timestamp()}.wav"
-            
-            # If the audio data is raw PCM, we need to add WAV headers
-            # Assuming 16kHz, mono, 16-bit PCM
-            if not audio_data.startswith(b'RIFF'):
-                # Create WAV file with proper headers
-                import wave
-                with wave.open(temp_filename, 'wb') as wav_file:
-                    wav_file.setnchannels(1)  # Mono
-                    wav_file.setsampwidth(2)  # 16-bit
-                    wav_file.setframerate(16000)  # 16kHz
-                    wav_file.writeframes(audio_data)
-            else:
-                # Already a WAV file, just write it
-                with open(temp_filename, "wb") as f:
-                    f.write(audio_data)
-            
-            # Transcribe using Groq
-            with open(temp_filename, "rb") as audio_file:
-                file_data = audio_file.read()
-                logger.info(f"Sending {len(file_data)} bytes to Groq for transcription")
-                
-                transcription = await self.groq_client.audio.transcriptions.create(
-                    file=("audio.wav", file_data),
-                    model="whisper-large-v3",
-                    response_format="json",
-                    language="en"
-                )
-            
-            # Clean up temp file
-            os.unlink(temp_filename)
-            
-            # Process transcription
-            text = transcription.text.strip()
+            text = await self.transcribe_audio(chunks)
             if text:
-                logger.info(f"Transcribed: {text[:100]}...")
-                await self.process_transcription(session_id, text)
-            else:
-                logger.warning(f"Empty transcription for session {session_id}")
-            
-            # Clear processed buffer
-            session["audio_buffer"] = []
-            
+                await self.dispatch_commands(session_id, text, "partial", chunks)
         except Exception as e:
-            logger.error(f"Transcription error for session {session_id}: {e}")
-            # Don't clear buffer on error - might want to retry
+            logger.error(f"Partial transcription error for session {session_id}: {e}")
+        finally:
+            if session_id in self.sessions:
+                self.sessions[session_id]["partial_in_flight"] = False
+    
+    async def transcribe_buffer(self, session_id: str, chunks: List[dict]):
+        """Transcribe a full window of audio"""
+        session = self.sessions[session_id]
+        
+        async with session["window_lock"]:
+            try:
+                logger.info(f"Transcribing {len(chunks)} chunks for session {session_id}")
+                text = await self.transcribe_audio(chunks)
+                
+                # Process transcription
+                if text:
+                    logger.info(f"Transcribed: {text[:100]}...")
+                    await self.dispatch_commands(session_id, text, "window", chunks)
+                    # Trailing pause at the end of the window, for thought boundaries
+                    await self.process_transcription(session_id, text, chunks[-1]["silence_ms"], chunks[-1]["received_at"])
+                else:
+                    logger.warning(f"Empty transcription for session {session_id}")
+                
+            except Exception as e:
+                logger.error(f"Transcription error for session {session_id}: {e}")
+                # Keep the audio for the next window - might want to retry
+                session["audio_buffer"][:0] = chunks
+    
+    async def dispatch_commands(self, session_id: str, text: str, source: str, chunks: List[dict]):
+        """Publish spoken commands to the high-priority command stream"""
+        audio_received_at = chunks[-1]["received_at"]
+        for command in self.command_parser.feed(session_id, text, chunks[0]["received_at"], audio_received_at):
+            logger.info(f"Command detected in session {session_id} ({source}): {command}")
+            await self.redis_client.xadd(self.command_stream, {
+                "session_id": session_id,
+                "command": command,
+                "source": source,
+                "text": text,
+                "audio_received_at": str(audio_received_at),
+                "detected_at": str(time.time()),
+                "timestamp": datetime.utcnow().isoformat()
+            })
+    
+    async def process_commands(self):
+        """Execute commands as soon as they arrive, independent of transcription"""
+        latest = await self.redis_client.xrevrange(self.command_stream, count=1)
+        last_id = latest[0][0] if latest else "0-0"
+        
+        while True:
+            try:
+                messages = await self.redis_client.xread({self.command_stream: last_id}, block=1000)
+                
+                for stream, msgs in messages:
+                    for msg_id, fields in msgs:
+                        last_id = msg_id
+                        await self.execute_command(fields)
+                        
+            except Exception as e:
+                logger.error(f"Error processing commands: {e}")
+                await asyncio.sleep(1)
     
-    async def process_transcription(self, session_id: str, text: str):
+    async def execute_command(self, command_data: dict):
+        """Run a single command without going through triggers or the LLM"""
+        session_id = command_data.get(b"session_id", b"").decode()
+        command = command_data.get(b"command", b"").decode()
+        source = command_data.get(b"source", b"").decode()
+        
+        if command == "start_recording":
+            self.sessions[session_id]["is_recording"] = True
+            await self.redis_client.xadd(self.recording_command_stream, {
+                "session_id": session_id,
+                "command": "recording_started",
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        elif command == "stop_recording":
+            # The last of the speech is transcribed first; don't hold up other sessions' commands meanwhile
+            asyncio.create_task(self.end_recording(session_id))
+        elif command == "save_thought":
+            await self.save_thought(session_id, command_data.get(b"text", b"").decode())
+        else:
+            logger.warning(f"Unknown command: {command}")
+            return
+        
+        # Latency from the audio that carried the command to execution
+        received_at = command_data.get(b"audio_received_at")
+        if received_at:
+            latency = time.time() - float(received_at)
+            self.command_latency.add(latency)
+            logger.info(f"Executed {command} ({source}) for session {session_id} in {latency * 1000:.0f}ms")
+    
+    async def save_thought(self, session_id: str, command_text: str):
+        """Save the most recent speech as a highlighted thought"""
+        session = self.sessions[session_id]
+        
+        # Recent speech, starting on a word boundary
+        thought = session["transcript_buffer"][-300:]
+        if len(session["transcript_buffer"]) > 300:
+            thought = thought.split(" ", 1)[-1]
+        thought = thought.strip()
+        
+        # "save that thought about X" qualifies what is being saved
+        remainder = self.command_parser.remainder(command_text, "save_thought")
+        if len(remainder.split()) >= 2:
+            thought = f"{thought} ({remainder})" if thought else remainder
+        
+        await publish_session_event(self.redis_client, self.llm_interaction_stream, session_id, {
+            "session_id": session_id,
+            "trigger": "save that thought",
+            "user_text": command_text,
+            "ai_response": thought,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    
+    async def process_transcription(self, session_id: str, text: str, pause_ms: float = 0.0, audio_end: Optional[float] = None):
         """Process transcribed text for triggers and save to stream"""
         session = self.sessions[session_id]
         
         # Add to transcript buffer
         session["transcript_buffer"] += " " + text
         
-        # Publish to transcript stream
-        await self.redis_client.xadd(
+        # Publish to transcript stream, and to the session's own copy
+        await publish_session_event(
+            self.redis_client,
             self.transcript_stream,
+            session_id,
             {
                 "session_id": session_id,
                 "text": text,
+                "pause_ms": f"{pause_ms:.0f}",
+                "audio_end": str(audio_end or time.time()),
                 "timestamp": datetime.utcnow().isoformat()
             }
         )
         
-        # Check for trigger phrases
-        text_lower = text.lower()
+        # Check for trigger phrases, including ones split across windows
+        words = session["recent_words"] + normalize_words(text)
+        session["recent_words"] = words[-(self.max_trigger_words - 1):] if self.max_trigger_words > 1 else []
+        search_text = f" {' '.join(words)} "
+        
+        speculation = session["speculation"]
+        session["speculation"] = None
+        
         for trigger, prompt in self.trigger_phrases.items():
-            if trigger in text_lower:
-                await self.handle_trigger(session_id, trigger, prompt, text)
-                break
+            if f" {trigger} " in search_text:
+                speculation_id = None
+                if speculation and speculation["trigger"] == trigger:
+                    speculation_id = speculation["id"]
+                elif speculation:
+                    await self.cancel_speculation(session_id, speculation)
+                # Don't match this phrase again from the carried-over tail
+                session["recent_words"] = []
+                await self.handle_trigger(session_id, trigger, prompt, text, speculation_id)
+                return
+        
+        if speculation:
+            # The phrase was not completed
+            await self.cancel_speculation(session_id, speculation)
+        
+        if self.speculative_triggers:
+            await self.check_trigger_prefix(session_id, words)
     
-    async def handle_trigger(self, session_id: str, trigger: str, prompt: Optional[str], full_text: str):
+    async def check_trigger_prefix(self, session_id: str, words: List[str]):
+        """Speculatively start a trigger whose phrase the window ends partway through"""
+        for trigger, prompt in self.trigger_phrases.items():
+            trigger_words = trigger.split()
+            # Longest proper prefix first
+            for length in range(len(trigger_words) - 1, 0, -1):
+                prefix = trigger_words[:length]
+                if words[-length:] != prefix:
+                    continue
+                if length < 2 and len(prefix[0]) < self.min_speculation_chars:
+                    break
+                
+                speculation = {"id": str(uuid.uuid4()), "trigger": trigger}
+                self.sessions[session_id]["speculation"] = speculation
+                await self.redis_client.xadd(self.trigger_stream, {
+                    "session_id": session_id,
+                    "trigger": trigger,
+                    "action": "speculate",
+                    "speculation_id": speculation["id"],
+                    "context": self.sessions[session_id]["transcript_buffer"][-1000:],
+                    "timestamp": datetime.utcnow().isoformat()
+                })
+                return
+    
+    async def cancel_speculation(self, session_id: str, speculation: dict):
+        """Tell the trigger handler to drop a speculative call"""
+        await self.redis_client.xadd(self.trigger_stream, {
+            "session_id": session_id,
+            "trigger": speculation["trigger"],
+            "action": "cancel",
+            "speculation_id": speculation["id"],
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    
+    async def handle_trigger(self, session_id: str, trigger: str, prompt: Optional[str], full_text: str, speculation_id: Optional[str] = None):
         """Handle detected trigger phrase"""
         logger.info(f"Trigger detected in session {session_id}: {trigger}")
         
-        if trigger == "stop recording":
-            # Special case - end recording
-            await self.end_recording(session_id)
-        else:
-            # Send to LLM for processing
-            trigger_data = {
-                "session_id": session_id,
-                "trigger": trigger,
-                "prompt": prompt,
-                "context": self.sessions[session_id]["transcript_buffer"][-1000:],  # Last 1000 chars
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-            await self.redis_client.xadd(self.trigger_stream, trigger_data)
+        # Send to LLM for processing
+        trigger_data = {
+            "session_id": session_id,
+            "trigger": trigger,
+            "prompt": prompt,
+            "context": self.sessions[session_id]["transcript_buffer"][-1000:],  # Last 1000 chars
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        if speculation_id:
+            # Confirms the speculative call started for this phrase
+            trigger_data["speculation_id"] = speculation_id
+        
+        await self.redis_client.xadd(self.trigger_stream, trigger_data)
     
     async def end_recording(self, session_id: str):
         """Handle end of recording"""
         session = self.sessions[session_id]
         session["is_recording"] = False
         
+        # The command comes from a short partial window, ahead of the full windows;
+        # publish the rest of the speech before anything treats the recording as over
+        chunks = session["audio_buffer"]
+        session["audio_buffer"] = []
+        if chunks:
+            await self.transcribe_buffer(session_id, chunks)
+        else:
+            # Wait for a window still being transcribed
+            async with session["window_lock"]:
+                pass
+        
         # Notify other services
         await self.redis_client.xadd(
-            "recording_command_stream",
+            self.recording_command_stream,
             {
                 "session_id": session_id,
                 "command": "recording_stopped",
@@ -240,6 +457,7 @@ class AudioProcessor:
                 for session_id in inactive_sessions:
                     logger.info(f"Cleaning up inactive session: {session_id}")
                     del self.sessions[session_id]
+                    self.command_parser.forget(session_id)
                 
                 await asyncio.sleep(300)  # Check every 5 minutes
                 
@@ -247,12 +465,20 @@ class AudioProcessor:
                 logger.error(f"Error in session cleanup: {e}")
                 await asyncio.sleep(60)
     
+    async def report_command_latency(self):
+        """Log command latency percentiles periodically"""
+        while True:
+            await asyncio.sleep(int(os.getenv("STATS_INTERVAL", "300")))
+            logger.info(f"Command latency: {self.command_latency.summary()}")
+    
     async def start(self):
         """Start the audio processor"""
         await self.init_redis()
         
         # Start background tasks
         asyncio.create_task(self.cleanup_inactive_sessions())
+        asyncio.create_task(self.process_commands())
+        asyncio.create_task(self.report_command_latency())
         
         # Start main processing loop
         logger.info("Starting audio processor...")
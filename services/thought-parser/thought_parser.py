@@ -0,0 +1,138 @@
+# thought_parser.py
+import asyncio
+import redis.asyncio as redis
+import os
+import logging
+from collections import Counter
+from datetime import datetime
+from common.session_streams import publish_session_event
+from thought_segmenter import Thought, ThoughtSegmenter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ThoughtParser:
+    def __init__(self):
+        self.redis_client = None
+
+        # Stream names
+        self.transcript_stream = "transcript_stream"
+        self.recording_command_stream = "recording_command_stream"
+        self.thought_stream = "thought_stream"
+
+        self.segmenter = ThoughtSegmenter(
+            pause_ms=float(os.getenv("THOUGHT_PAUSE_MS", "600")),
+            long_pause_ms=float(os.getenv("THOUGHT_LONG_PAUSE_MS", "1500")),
+            idle_ms=float(os.getenv("THOUGHT_IDLE_MS", "3000")),
+            max_words=int(os.getenv("THOUGHT_MAX_WORDS", "150"))
+        )
+        self.stats = {"segments": 0, "thoughts": 0}
+        self.reasons = Counter()
+
+    async def init_redis(self):
+        """Initialize the pooled Redis connection, from REDIS_URL as given"""
+        pool = redis.BlockingConnectionPool.from_url(
+            os.getenv("REDIS_URL", "redis://localhost:6379"),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+        )
+        self.redis_client = redis.Redis(connection_pool=pool)
+
+    async def _latest_id(self, stream):
+        """ID of the newest entry in a stream; "$" would skip entries added between reads"""
+        latest = await self.redis_client.xrevrange(stream, count=1)
+        return latest[0][0] if latest else "0-0"
+
+    @staticmethod
+    def _stream_name(stream) -> str:
+        return stream.decode() if isinstance(stream, bytes) else stream
+
+    async def process_transcripts(self):
+        """Group transcript segments into thoughts as they arrive"""
+        last_ids = {}
+        for stream in (self.transcript_stream, self.recording_command_stream):
+            last_ids[stream] = await self._latest_id(stream)
+
+        while True:
+            try:
+                # Short block so quiet sessions are closed on time
+                messages = await self.redis_client.xread(last_ids, block=100)
+
+                for stream, msgs in messages:
+                    stream = self._stream_name(stream)
+                    for msg_id, fields in msgs:
+                        last_ids[stream] = msg_id
+                        if stream == self.transcript_stream:
+                            await self.handle_transcript(fields)
+                        else:
+                            await self.handle_recording_command(fields)
+
+                for thought in self.segmenter.expire():
+                    await self.publish_thought(thought)
+
+            except Exception as e:
+                logger.error(f"Error parsing thoughts: {e}")
+                await asyncio.sleep(1)
+
+    async def handle_transcript(self, fields: dict):
+        """Add a transcript segment to its session's thought"""
+        session_id = fields.get(b"session_id", b"").decode()
+        audio_end = fields.get(b"audio_end", b"").decode()
+        thought = self.segmenter.add(
+            session_id,
+            fields.get(b"text", b"").decode(),
+            pause_ms=float(fields.get(b"pause_ms", b"0").decode() or 0),
+            audio_end=float(audio_end) if audio_end else datetime.utcnow().timestamp()
+        )
+        self.stats["segments"] += 1
+        if thought:
+            await self.publish_thought(thought)
+
+    async def handle_recording_command(self, fields: dict):
+        """Finish a session's thought when recording stops"""
+        command = fields.get(b"command", b"").decode()
+        if command in ("recording_stopped", "session_ended"):
+            thought = self.segmenter.flush(fields.get(b"session_id", b"").decode())
+            if thought:
+                await self.publish_thought(thought)
+
+    async def publish_thought(self, thought: Thought):
+        """Publish a complete thought for the cognition services"""
+        await publish_session_event(self.redis_client, self.thought_stream, thought.session_id, {
+            **thought.to_fields(),
+            "timestamp": datetime.utcnow().isoformat()
+        })
+        self.stats["thoughts"] += 1
+        self.reasons[thought.reason] += 1
+        logger.info(f"Thought in session {thought.session_id} ({thought.reason}, {len(thought.texts)} segments): "
+                    f"{thought.text[:100]}")
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "segments_per_thought": round(self.stats["segments"] / self.stats["thoughts"], 2) if self.stats["thoughts"] else 0.0,
+            "pending": len(self.segmenter.pending),
+            "reasons": dict(self.reasons)
+        }
+
+    async def report_stats(self):
+        """Log thought stats periodically"""
+        while True:
+            await asyncio.sleep(int(os.getenv("STATS_INTERVAL", "300")))
+            logger.info(f"Thought parser stats: {self.get_stats()}")
+
+    async def start(self):
+        """Start the thought parser"""
+        await self.init_redis()
+
+        # Start background tasks
+        asyncio.create_task(self.report_stats())
+
+        logger.info("Starting thought parser...")
+        await self.process_transcripts()
+
+async def main():
+    parser = ThoughtParser()
+    await parser.start()
+
+if __name__ == "__main__":
+    asyncio.run(main())
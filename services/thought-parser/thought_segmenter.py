@@ -0,0 +1,134 @@
+# thought_segmenter.py
+import re
+import time
+import uuid
+from typing import Dict, List, Optional
+
+# A sentence ends on . ? or !, possibly followed by closing quotes or brackets
+_SENTENCE_END_RE = re.compile(r"[.?!][\"')\]]*$")
+_SENTENCE_BREAK_RE = re.compile(r"[.?!][\"')\]]*\s+")
+
+
+def ends_sentence(text: str) -> bool:
+    return bool(_SENTENCE_END_RE.search(text.rstrip()))
+
+
+class Thought:
+    """A user thought, built up from transcript segments until a boundary"""
+
+    __slots__ = ("thought_id", "session_id", "texts", "words", "pause_ms", "audio_end", "arrived", "reason")
+
+    def __init__(self, session_id: str):
+        self.thought_id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.texts: List[str] = []
+        self.words = 0
+        self.pause_ms = 0.0  # Quiet after the last segment
+        self.audio_end = 0.0  # When the last segment's audio ended (epoch seconds)
+        self.arrived = 0.0  # When the last segment arrived (monotonic)
+        self.reason = ""  # What ended it: punctuation, pause, idle, length or end
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.texts)
+
+    def to_fields(self) -> dict:
+        return {
+            "thought_id": self.thought_id,
+            "session_id": self.session_id,
+            "text": self.text,
+            "pause_ms": f"{self.pause_ms:.0f}",
+            "segments": str(len(self.texts)),
+            "reason": self.reason,
+            "audio_end": str(self.audio_end)
+        }
+
+
+class ThoughtSegmenter:
+    """Groups transcript segments into thoughts using pause timing and punctuation.
+
+    STT punctuates every window as if it were a sentence, so punctuation alone
+    can't mark a boundary. A thought ends when a segment ends a sentence and
+    the speaker then paused for at least pause_ms, or after any pause of
+    long_pause_ms. When no segment arrives for idle_ms the speaker has gone
+    quiet (silent windows transcribe to nothing) and the thought ends there.
+    Runaway monologues are cut at the last sentence end once they reach
+    max_words.
+    """
+
+    def __init__(self, pause_ms: float = 600, long_pause_ms: float = 1500,
+                 idle_ms: float = 3000, max_words: int = 150):
+        self.pause_ms = pause_ms
+        self.long_pause_ms = long_pause_ms
+        self.idle_ms = idle_ms
+        self.max_words = max_words
+        self.pending: Dict[str, Thought] = {}
+
+    def add(self, session_id: str, text: str, pause_ms: float, audio_end: float) -> Optional[Thought]:
+        """Add a transcript segment; returns the thought it completes, if any"""
+        text = text.strip()
+        if not text:
+            return None
+        thought = self.pending.get(session_id)
+        if thought is None:
+            thought = self.pending[session_id] = Thought(session_id)
+        thought.texts.append(text)
+        thought.words += len(text.split())
+        thought.pause_ms = pause_ms
+        thought.audio_end = audio_end
+        thought.arrived = time.monotonic()
+
+        if pause_ms >= self.long_pause_ms:
+            return self._emit(session_id, "pause")
+        if pause_ms >= self.pause_ms and ends_sentence(text):
+            return self._emit(session_id, "punctuation")
+        if thought.words >= self.max_words:
+            return self._split(session_id)
+        return None
+
+    def expire(self) -> List[Thought]:
+        """Thoughts of sessions that have gone quiet for idle_ms"""
+        now = time.monotonic()
+        thoughts = []
+        for session_id, thought in list(self.pending.items()):
+            idle_ms = (now - thought.arrived) * 1000
+            if idle_ms >= self.idle_ms:
+                thought.pause_ms += idle_ms
+                thoughts.append(self._emit(session_id, "idle"))
+        return thoughts
+
+    def flush(self, session_id: str) -> Optional[Thought]:
+        """Whatever the session has said so far, e.g. when recording stops"""
+        if session_id not in self.pending:
+            return None
+        return self._emit(session_id, "end")
+
+    def forget(self, session_id: str):
+        self.pending.pop(session_id, None)
+
+    def _emit(self, session_id: str, reason: str) -> Thought:
+        thought = self.pending.pop(session_id)
+        thought.reason = reason
+        return thought
+
+    def _split(self, session_id: str) -> Thought:
+        """Emit up to the last sentence end and keep the rest pending"""
+        thought = self.pending[session_id]
+        text = thought.text
+        breaks = list(_SENTENCE_BREAK_RE.finditer(text))
+        if not breaks:
+            return self._emit(session_id, "length")
+
+        cut = breaks[-1].end()
+        rest = Thought(session_id)
+        rest.texts = [text[cut:]]
+        rest.words = len(rest.texts[0].split())
+        rest.pause_ms = thought.pause_ms
+        rest.audio_end = thought.audio_end
+        rest.arrived = thought.arrived
+
+        thought.texts = [text[:cut].rstrip()]
+        thought.pause_ms = 0.0  # Cut mid-speech
+        self.pending[session_id] = rest
+        thought.reason = "length"
+        return thought
@@ -0,0 +1,211 @@
+# response_cache.py
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def normalize_context(context: str) -> str:
+    """Normalize context so trivial differences map to the same fingerprint"""
+    return " ".join(_WORD_RE.findall(context.lower()))
+
+
+def context_fingerprint(trigger: str, context: str) -> str:
+    """Exact-match fingerprint for a (trigger, normalized context) pair"""
+    normalized = normalize_context(context)
+    digest = hashlib.sha256(f"{trigger}\x00{normalized}".encode()).hexdigest()
+    return digest
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """64-bit SimHash over word shingles, used for near-duplicate matching"""
+    words = text.split()
+    if len(words) < shingle_size:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [
+            " ".join(words[i:i + shingle_size])
+            for i in range(len(words) - shingle_size + 1)
+        ]
+
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    value = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            value |= 1 << bit
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class ResponseCache:
+    """Two-tier LLM response cache: in-process LRU+TTL in front of Redis"""
+
+    def __init__(
+        self,
+        redis_client=None,
+        max_entries: int = 512,
+        ttl_seconds: int = 900,
+        near_duplicate_distance: int = 0,
+        near_duplicate_candidates: int = 256,
+        key_prefix: str = "response_cache"
+    ):
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # 0 disables near-duplicate matching (exact fingerprints only)
+        self.near_duplicate_distance = near_duplicate_distance
+        self.near_duplicate_candidates = near_duplicate_candidates
+        self.key_prefix = key_prefix
+
+        # fingerprint -> (expires_at, trigger, simhash, response)
+        self.local: "OrderedDict[str, Tuple[float, str, int, str]]" = OrderedDict()
+
+        self.stats = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "near_duplicate_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "errors": 0
+        }
+
+    def _redis_key(self, fingerprint: str) -> str:
+        return f"{self.key_prefix}:{fingerprint}"
+
+    def _simhash_key(self, trigger: str) -> str:
+        return f"{self.key_prefix}:simhash:{trigger}"
+
+    def _local_get(self, fingerprint: str) -> Optional[str]:
+        entry = self.local.get(fingerprint)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.local[fingerprint]
+            return None
+        self.local.move_to_end(fingerprint)
+        return entry[3]
+
+    def _local_put(self, fingerprint: str, trigger: str, signature: int, response: str):
+        self.local[fingerprint] = (time.monotonic() + self.ttl_seconds, trigger, signature, response)
+        self.local.move_to_end(fingerprint)
+        while len(self.local) > self.max_entries:
+            self.local.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _local_near_duplicate(self, trigger: str, signature: int) -> Optional[Tuple[str, str]]:
+        now = time.monotonic()
+        for fingerprint, (expires_at, entry_trigger, entry_signature, response) in reversed(self.local.items()):
+            if entry_trigger != trigger or expires_at < now:
+                continue
+            if hamming_distance(signature, entry_signature) <= self.near_duplicate_distance:
+                return fingerprint, response
+        return None
+
+    async def get(self, trigger: str, context: str) -> Optional[str]:
+        """Look up a cached response, checking the local tier before Redis"""
+        fingerprint = context_fingerprint(trigger, context)
+
+        response = self._local_get(fingerprint)
+        if response is not None:
+            self.stats["local_hits"] += 1
+            return response
+
+        signature = simhash(normalize_context(context)) if self.near_duplicate_distance else 0
+
+        try:
+            if self.redis_client is not None:
+                cached = await self.redis_client.get(self._redis_key(fingerprint))
+                if cached is not None:
+                    response = cached.decode() if isinstance(cached, bytes) else cached
+                    self._local_put(fingerprint, trigger, signature, response)
+                    self.stats["redis_hits"] += 1
+                    return response
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Response cache Redis lookup failed: {e}")
+
+        if self.near_duplicate_distance:
+            response = await self._get_near_duplicate(trigger, signature)
+            if response is not None:
+                self.stats["near_duplicate_hits"] += 1
+                return response
+
+        self.stats["misses"] += 1
+        return None
+
+    async def _get_near_duplicate(self, trigger: str, signature: int) -> Optional[str]:
+        match = self._local_near_duplicate(trigger, signature)
+        if match is not None:
+            self.local.move_to_end(match[0])
+            return match[1]
+
+        if self.redis_client is None:
+            return None
+
+        try:
+            candidates = await self.redis_client.lrange(
+                self._simhash_key(trigger), 0, self.near_duplicate_candidates - 1
+            )
+            for candidate in candidates:
+                entry = json.loads(candidate)
+                if hamming_distance(signature, entry["simhash"]) > self.near_duplicate_distance:
+                    continue
+                cached = await self.redis_client.get(self._redis_key(entry["fingerprint"]))
+                if cached is not None:
+                    response = cached.decode() if isinstance(cached, bytes) else cached
+                    self._local_put(entry["fingerprint"], trigger, entry["simhash"], response)
+                    return response
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Response cache near-duplicate lookup failed: {e}")
+
+        return None
+
+    async def set(self, trigger: str, context: str, response: str):
+        """Store a response in both tiers"""
+        fingerprint = context_fingerprint(trigger, context)
+        signature = simhash(normalize_context(context)) if self.near_duplicate_distance else 0
+
+        self._local_put(fingerprint, trigger, signature, response)
+        self.stats["stores"] += 1
+
+        if self.redis_client is None:
+            return
+
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.set(self._redis_key(fingerprint), response, ex=self.ttl_seconds)
+            if self.near_duplicate_distance:
+                simhash_key = self._simhash_key(trigger)
+                pipe.lpush(simhash_key, json.dumps({"fingerprint": fingerprint, "simhash": signature}))
+                pipe.ltrim(simhash_key, 0, self.near_duplicate_candidates - 1)
+                pipe.expire(simhash_key, self.ttl_seconds)
+            await pipe.execute()
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Response cache Redis store failed: {e}")
+
+    def hit_rate(self) -> float:
+        hits = self.stats["local_hits"] + self.stats["redis_hits"] + self.stats["near_duplicate_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def get_stats(self) -> Dict:
+        """Snapshot of hit/miss counters"""
+        return {**self.stats, "local_entries": len(self.local), "hit_rate": round(self.hit_rate(), 3)}
@@ -0,0 +1,124 @@
+# speculation.py
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Speculation:
+    __slots__ = ("speculation_id", "session_id", "trigger", "task", "started_at", "finished_at")
+
+    def __init__(self, speculation_id: str, session_id: str, trigger: str, task: asyncio.Task):
+        self.speculation_id = speculation_id
+        self.session_id = session_id
+        self.trigger = trigger
+        self.task = task
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+
+class SpeculationManager:
+    """Runs LLM calls ahead of trigger confirmation, within a waste budget"""
+
+    def __init__(self, max_inflight: int = 4, max_wasted_per_minute: int = 6, ttl_seconds: float = 10.0):
+        self.max_inflight = max_inflight
+        self.max_wasted_per_minute = max_wasted_per_minute
+        self.ttl_seconds = ttl_seconds
+
+        self.pending: Dict[str, Speculation] = {}
+        self.wasted_at = deque()
+
+        self.stats = {
+            "started": 0,
+            "committed": 0,
+            "cancelled": 0,
+            "expired": 0,
+            "skipped_budget": 0,
+            "latency_saved_ms": 0.0
+        }
+
+    def _record_waste(self, speculation: Speculation):
+        speculation.task.cancel()
+        self.wasted_at.append(time.monotonic())
+
+    def _within_budget(self) -> bool:
+        now = time.monotonic()
+        while self.wasted_at and now - self.wasted_at[0] > 60:
+            self.wasted_at.popleft()
+        return len(self.wasted_at) < self.max_wasted_per_minute and len(self.pending) < self.max_inflight
+
+    def expire(self):
+        """Drop speculations that were never confirmed or cancelled"""
+        now = time.monotonic()
+        for speculation_id, speculation in list(self.pending.items()):
+            if now - speculation.started_at > self.ttl_seconds:
+                del self.pending[speculation_id]
+                self._record_waste(speculation)
+                self.stats["expired"] += 1
+
+    def start(self, speculation_id: str, session_id: str, trigger: str, call: Awaitable[str]) -> bool:
+        """Start a speculative call unless the waste budget is exhausted"""
+        self.expire()
+
+        if speculation_id in self.pending or not self._within_budget():
+            self.stats["skipped_budget"] += 1
+            call.close()
+            return False
+
+        task = asyncio.create_task(call)
+        speculation = Speculation(speculation_id, session_id, trigger, task)
+
+        def _finished(_):
+            speculation.finished_at = time.monotonic()
+        task.add_done_callback(_finished)
+
+        self.pending[speculation_id] = speculation
+        self.stats["started"] += 1
+        logger.info(f"Speculating on '{trigger}' for session {session_id}")
+        return True
+
+    def cancel(self, speculation_id: str):
+        """Abandon a speculation whose trigger phrase was not completed"""
+        speculation = self.pending.pop(speculation_id, None)
+        if speculation is not None:
+            self._record_waste(speculation)
+            self.stats["cancelled"] += 1
+
+    async def commit(self, speculation_id: str, trigger: str) -> Optional[str]:
+        """Return the speculative response for a confirmed trigger, if one is usable"""
+        speculation = self.pending.pop(speculation_id, None)
+        if speculation is None:
+            return None
+        if speculation.trigger != trigger:
+            self._record_waste(speculation)
+            self.stats["cancelled"] += 1
+            return None
+
+        confirmed_at = time.monotonic()
+        try:
+            response = await speculation.task
+        except Exception as e:
+            logger.warning(f"Speculative call failed, falling back: {e}")
+            self.stats["cancelled"] += 1
+            return None
+
+        # Time the speculation spent working before the trigger was confirmed
+        finished_at = speculation.finished_at or time.monotonic()
+        saved = min(finished_at, confirmed_at) - speculation.started_at
+        self.stats["committed"] += 1
+        self.stats["latency_saved_ms"] += saved * 1000
+        return response
+
+    def get_stats(self) -> Dict:
+        resolved = self.stats["committed"] + self.stats["cancelled"] + self.stats["expired"]
+        committed = self.stats["committed"]
+        return {
+            **self.stats,
+            "latency_saved_ms": round(self.stats["latency_saved_ms"], 1),
+            "pending": len(self.pending),
+            "hit_rate": round(committed / resolved, 3) if resolved else 0.0,
+            "avg_latency_saved_ms": round(self.stats["latency_saved_ms"] / committed, 1) if committed else 0.0
+        }
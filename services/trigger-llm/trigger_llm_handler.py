@@ -3,22 +3,43 @@ import asyncio
 import redis.asyncio as redis
 import json
 from datetime import datetime
-from groq import AsyncGroq
 import os
 import logging
 from typing import Dict
+from common.providers import create_groq_client
+from common.context_assembler import SessionContext, get_token_counter, token_budget_for
+from common.session_streams import publish_session_event
+from response_cache import ResponseCache
+from speculation import SpeculationManager
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class TriggerLLMHandler:
     def __init__(self):
-        self.groq_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+        self.groq_client = create_groq_client()
         self.redis_client = None
         self.model = os.getenv("GROQ_MODEL", "llama-3.1-70b-versatile")
+        self.response_cache = None
+        
+        # Speculative calls started while a trigger phrase is still forming
+        self.speculation_enabled = os.getenv("SPECULATION_ENABLED", "true").lower() == "true"
+        self.speculation = SpeculationManager(
+            max_inflight=int(os.getenv("SPECULATION_MAX_INFLIGHT", "4")),
+            max_wasted_per_minute=int(os.getenv("SPECULATION_MAX_WASTED_PER_MINUTE", "6")),
+            ttl_seconds=float(os.getenv("SPECULATION_TTL", "10"))
+        )
+        
+        # Per-session context, built incrementally from the transcript stream
+        self.session_contexts: Dict[str, SessionContext] = {}
+        self.session_activity: Dict[str, datetime] = {}
+        self.context_budget = token_budget_for(self.model)
+        self.token_counter = get_token_counter()
         
         # Stream names
         self.trigger_stream = "trigger_stream"
+        self.transcript_stream = "transcript_stream"
+        self.recording_command_stream = "recording_command_stream"
         self.llm_interaction_stream = "llm_interaction_stream"
         self.tts_request_stream = "tts_request_stream"
         
@@ -35,10 +56,6 @@ Be curious and help them discover what's compelling about this thought.""",
             "summarize that": """You are creating a concise summary of the key points discussed.
 Extract the main ideas and present them in a clear, bulleted format.
 Focus on actionable insights and important takeaways.""",
-            
-            "save that thought": """You are highlighting an important insight from the conversation.
-Reframe the key thought in a clear, memorable way that captures its essence.
-Make it suitable for future reference in their second brain."""
         }
     
     async def init_redis(self):
@@ -50,39 +67,126 @@ Make it suitable for future reference in their second brain."""
             db=0,
             decode_responses=False
         )
+        
+        # Response cache shares the Redis connection for its second tier
+        self.response_cache = ResponseCache(
+            redis_client=self.redis_client,
+            max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+            ttl_seconds=int(os.getenv("RESPONSE_CACHE_TTL", "900")),
+            near_duplicate_distance=int(os.getenv("RESPONSE_CACHE_NEAR_DUPLICATE", "0"))
+        )
     
     async def process_triggers(self):
         """Process trigger events from the audio processor"""
+        # Transcripts are read alongside triggers so a trigger always sees
+        # the speech that was published before it
+        last_ids = {}
+        for stream in (self.transcript_stream, self.recording_command_stream,
+                       self.llm_interaction_stream, self.trigger_stream):
+            last_ids[stream] = await self._latest_id(stream)
+        
         while True:
             try:
-                messages = await self.redis_client.xread(
-                    {self.trigger_stream: "$"},
-                    block=1000
-                )
+                messages = await self.redis_client.xread(last_ids, block=1000)
+                
+                # Apply transcripts and commands before triggers in the same batch
+                order = list(last_ids)
+                messages.sort(key=lambda item: order.index(self._stream_name(item[0])))
                 
                 for stream, msgs in messages:
+                    stream = self._stream_name(stream)
                     for msg_id, fields in msgs:
-                        await self.handle_trigger(fields)
+                        last_ids[stream] = msg_id
+                        if stream == self.transcript_stream:
+                            self.handle_transcript(fields)
+                        elif stream == self.recording_command_stream:
+                            self.handle_recording_command(fields)
+                        elif stream == self.llm_interaction_stream:
+                            self.handle_interaction(fields)
+                        else:
+                            await self.handle_trigger(fields)
                         
             except Exception as e:
                 logger.error(f"Error processing triggers: {e}")
                 await asyncio.sleep(1)
     
+    async def _latest_id(self, stream: str):
+        """ID of the newest entry, so reads start from now without losing later entries"""
+        latest = await self.redis_client.xrevrange(stream, count=1)
+        return latest[0][0] if latest else "0-0"
+    
+    @staticmethod
+    def _stream_name(stream) -> str:
+        return stream.decode() if isinstance(stream, bytes) else stream
+    
+    def get_session_context(self, session_id: str) -> SessionContext:
+        """Get or create the incremental context for a session"""
+        context = self.session_contexts.get(session_id)
+        if context is None:
+            context = SessionContext(self.token_counter)
+            self.session_contexts[session_id] = context
+        self.session_activity[session_id] = datetime.utcnow()
+        return context
+    
+    def handle_transcript(self, fields: dict):
+        """Append a transcript segment to its session context"""
+        session_id = fields.get(b"session_id", b"").decode()
+        text = fields.get(b"text", b"").decode()
+        if session_id and text:
+            self.get_session_context(session_id).add_speech(text)
+    
+    def handle_recording_command(self, fields: dict):
+        """Drop session context once the session has ended"""
+        if fields.get(b"command", b"").decode() == "session_ended":
+            session_id = fields.get(b"session_id", b"").decode()
+            self.session_contexts.pop(session_id, None)
+            self.session_activity.pop(session_id, None)
+    
+    def handle_interaction(self, fields: dict):
+        """Carry saved thoughts (from the command path) into later trigger contexts"""
+        if fields.get(b"trigger", b"").decode() == "save that thought":
+            session_id = fields.get(b"session_id", b"").decode()
+            self.get_session_context(session_id).add_saved_thought(fields.get(b"ai_response", b"").decode())
+    
+    def assemble_context(self, session_id: str, fallback: str) -> str:
+        """Build token-budgeted context for a trigger"""
+        session_context = self.session_contexts.get(session_id)
+        if session_context is None or not session_context.speech:
+            # No transcripts seen for this session (e.g. handler restarted)
+            return self.token_counter.truncate_tail(fallback, self.context_budget)
+        return session_context.assemble(self.context_budget).render()
+    
     async def handle_trigger(self, trigger_data: dict):
         """Process a single trigger and generate LLM response"""
         session_id = trigger_data.get(b"session_id", b"").decode()
         trigger = trigger_data.get(b"trigger", b"").decode()
-        context = trigger_data.get(b"context", b"").decode()
+        action = trigger_data.get(b"action", b"").decode()
+        speculation_id = trigger_data.get(b"speculation_id", b"").decode()
         timestamp = trigger_data.get(b"timestamp", b"").decode()
         
-        logger.info(f"Processing trigger '{trigger}' for session {session_id}")
+        if action == "cancel":
+            self.speculation.cancel(speculation_id)
+            return
         
-        # Get the appropriate system prompt
-        system_prompt = self.system_prompts.get(trigger, "You are a helpful AI assistant.")
+        context = self.assemble_context(session_id, trigger_data.get(b"context", b"").decode())
+        
+        if action == "speculate":
+            # Trigger phrase is only partially spoken - start the call early
+            if self.speculation_enabled:
+                self.speculation.start(
+                    speculation_id, session_id, trigger,
+                    self.get_response(session_id, trigger, context)
+                )
+            return
+        
+        logger.info(f"Processing trigger '{trigger}' for session {session_id}")
         
         try:
-            # Generate LLM response
-            response = await self.generate_response(system_prompt, context)
+            response = None
+            if speculation_id:
+                response = await self.speculation.commit(speculation_id, trigger)
+            if response is None:
+                response = await self.get_response(session_id, trigger, context)
             
             # Save interaction to stream
             interaction_data = {
@@ -93,8 +197,10 @@ Make it suitable for future reference in their second brain."""
                 "timestamp": datetime.utcnow().isoformat()
             }
             
-            await self.redis_client.xadd(
+            await publish_session_event(
+                self.redis_client,
                 self.llm_interaction_stream,
+                session_id,
                 interaction_data
             )
             
@@ -104,6 +210,19 @@ Make it suitable for future reference in their second brain."""
         except Exception as e:
             logger.error(f"Error generating LLM response: {e}")
     
+    async def get_response(self, session_id: str, trigger: str, context: str) -> str:
+        """Get the response for a trigger, reusing a cached one when the context repeats"""
+        response = await self.response_cache.get(trigger, context)
+        if response is not None:
+            logger.info(f"Response cache hit for trigger '{trigger}' in session {session_id}")
+            return response
+        
+        # Get the appropriate system prompt
+        system_prompt = self.system_prompts.get(trigger, "You are a helpful AI assistant.")
+        response = await self.generate_response(system_prompt, context)
+        await self.response_cache.set(trigger, context, response)
+        return response
+    
     async def generate_response(self, system_prompt: str, context: str) -> str:
         """Generate response using Groq LLM"""
         messages = [
@@ -133,10 +252,35 @@ Make it suitable for future reference in their second brain."""
         await self.redis_client.xadd(self.tts_request_stream, tts_request)
         logger.info(f"TTS requested for session {session_id}")
     
+    async def cleanup_inactive_sessions(self):
+        """Drop contexts for sessions idle for more than an hour"""
+        while True:
+            await asyncio.sleep(300)
+            current_time = datetime.utcnow()
+            inactive_sessions = [
+                session_id for session_id, last_activity in self.session_activity.items()
+                if (current_time - last_activity).total_seconds() > 3600
+            ]
+            for session_id in inactive_sessions:
+                self.session_contexts.pop(session_id, None)
+                self.session_activity.pop(session_id, None)
+    
+    async def report_stats(self):
+        """Log response cache and speculation stats periodically"""
+        while True:
+            await asyncio.sleep(int(os.getenv("STATS_INTERVAL", "300")))
+            self.speculation.expire()
+            logger.info(f"Response cache stats: {self.response_cache.get_stats()}")
+            logger.info(f"Speculation stats: {self.speculation.get_stats()}")
+    
     async def start(self):
         """Start the trigger handler"""
         await self.init_redis()
         
+        # Start background tasks
+        asyncio.create_task(self.report_stats())
+        asyncio.create_task(self.cleanup_inactive_sessions())
+        
         logger.info("Starting trigger-based LLM handler...")
         await self.process_triggers()
 
@@ -0,0 +1,152 @@
+# audio_cache.py
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def audio_key(text: str, voice: str, codec: str) -> str:
+    """Content address for synthesized audio"""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(f"{voice}\0{codec}\0{normalized}".encode()).hexdigest()
+
+
+class AudioCache:
+    """Synthesized audio on disk, with recently used files kept memory-mapped.
+
+    Only file writes run in a worker thread; the index and the memory maps are
+    touched on the event loop alone, so they need no lock.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024, max_mapped: int = 64):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_mapped = max_mapped
+
+        # Memory tier: key -> mmap of the cached file
+        self.mapped: "OrderedDict[str, mmap.mmap]" = OrderedDict()
+        # Disk tier index: key -> (size, last used)
+        self.entries: Dict[str, Tuple[int, float]] = {}
+        self.total_bytes = 0
+        # Keys whose file is being written
+        self.writing: Set[str] = set()
+
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pcm")
+
+    def _load_index(self):
+        """Rebuild the disk index from a previous run"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith(".tmp"):
+                    os.unlink(path)
+                    continue
+                if name.endswith(".pcm"):
+                    stat = os.stat(path)
+                    self.entries[name[:-4]] = (stat.st_size, stat.st_mtime)
+                    self.total_bytes += stat.st_size
+        if self.entries:
+            logger.info(f"Audio cache: {len(self.entries)} entries, {self.total_bytes / 1e6:.1f} MB on disk")
+
+    def _unmap(self, key: str):
+        mapped = self.mapped.pop(key, None)
+        if mapped is not None:
+            mapped.close()
+
+    def get(self, key: str) -> Optional[mmap.mmap]:
+        """Cached audio as a read-only memory map, or None"""
+        if key in self.mapped:
+            self.mapped.move_to_end(key)
+            self.entries[key] = (self.entries[key][0], time.time())
+            self.stats["hits"] += 1
+            return self.mapped[key]
+
+        if key not in self.entries:
+            self.stats["misses"] += 1
+            return None
+
+        try:
+            with open(self._path(key), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Removed behind our back, or empty
+            self._drop(key)
+            self.stats["misses"] += 1
+            return None
+
+        self.mapped[key] = mapped
+        if len(self.mapped) > self.max_mapped:
+            self._unmap(next(iter(self.mapped)))
+
+        self.entries[key] = (self.entries[key][0], time.time())
+        self.stats["hits"] += 1
+        return mapped
+
+    async def put(self, key: str, audio: bytes):
+        """Store audio under key, evicting least recently used files past max_bytes"""
+        if not audio or key in self.entries or key in self.writing or len(audio) > self.max_bytes:
+            return
+
+        self.writing.add(key)
+        try:
+            await asyncio.to_thread(self._write, key, audio)
+        finally:
+            self.writing.discard(key)
+
+        self.entries[key] = (len(audio), time.time())
+        self.total_bytes += len(audio)
+        self.stats["writes"] += 1
+        self._evict()
+
+    def _write(self, key: str, audio: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+    def _drop(self, key: str):
+        self._unmap(key)
+        size, _ = self.entries.pop(key, (0, 0))
+        self.total_bytes -= size
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self.entries.items(), key=lambda item: item[1][1]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._drop(key)
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.entries),
+            "mapped": len(self.mapped),
+            "disk_mb": round(self.total_bytes / 1e6, 1),
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+        }
+
+    def close(self):
+        for key in list(self.mapped):
+            self._unmap(key)
@@ -0,0 +1,67 @@
+# transcoder.py
+import asyncio
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Tuple
+
+from pydub import AudioSegment
+
+logger = logging.getLogger(__name__)
+
+# Output codecs: ffmpeg container, encoder, and the sample rates the encoder accepts
+CODECS = {
+    "opus": {"format": "ogg", "codec": "libopus", "bitrate": "24k", "sample_rates": (48000, 24000, 16000, 12000, 8000)},
+    "aac": {"format": "adts", "codec": "aac", "bitrate": "48k", "sample_rates": (48000, 44100, 32000, 24000, 22050, 16000)},
+}
+
+# Server preference when the client supports several
+CODEC_PREFERENCE = ("opus", "aac", "pcm")
+
+
+def negotiate(capabilities: Dict[str, str], source_rate: int) -> Tuple[str, int]:
+    """Pick (codec, sample_rate) from a session's advertised capabilities"""
+    offered = [c.strip().lower() for c in capabilities.get("codecs", "").split(",") if c.strip()]
+    max_rate = int(capabilities.get("max_sample_rate") or 0) or source_rate
+
+    for codec in CODEC_PREFERENCE:
+        if codec not in offered:
+            continue
+        if codec == "pcm":
+            return "pcm", min(source_rate, max_rate)
+        # Closest supported rate that neither upsamples nor exceeds the client's limit
+        rates = [r for r in CODECS[codec]["sample_rates"] if r <= min(source_rate, max_rate)]
+        if rates:
+            return codec, rates[0]
+
+    # Clients that never sent capabilities get what they always got, within any rate limit they did send
+    return "pcm", min(source_rate, max_rate)
+
+
+def _transcode(pcm: bytes, source_rate: int, codec: str, target_rate: int) -> bytes:
+    segment = AudioSegment(data=pcm, sample_width=2, frame_rate=source_rate, channels=1)
+    if target_rate != source_rate:
+        segment = segment.set_frame_rate(target_rate)
+    if codec == "pcm":
+        return segment.raw_data
+
+    settings = CODECS[codec]
+    output = io.BytesIO()
+    segment.export(output, format=settings["format"], codec=settings["codec"], bitrate=settings["bitrate"])
+    return output.getvalue()
+
+
+class Transcoder:
+    """Resampling and encoding in worker processes, off the event loop"""
+
+    def __init__(self, workers: int = 2):
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    async def transcode(self, pcm: bytes, source_rate: int, codec: str, target_rate: int) -> bytes:
+        if not pcm or (codec == "pcm" and target_rate == source_rate):
+            return pcm
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _transcode, pcm, source_rate, codec, target_rate)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
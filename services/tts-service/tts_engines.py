@@ -0,0 +1,126 @@
+# tts_engines.py
+import array
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, List
+
+logger = logging.getLogger(__name__)
+
+# Sentence ends followed by whitespace; keeps the punctuation with its sentence
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_END_RE.split(text) if sentence.strip()]
+
+
+class TTSEngine(ABC):
+    """Produces 16-bit mono PCM at sample_rate for a piece of text"""
+
+    name = "base"
+    sample_rate = 22050
+
+    @abstractmethod
+    def synthesize(self, text: str, voice: str) -> AsyncIterator[bytes]:
+        """Audio for text, yielded as it is produced"""
+
+    def close(self):
+        pass
+
+
+# Piper voices are loaded once per worker process
+_piper_voice = None
+
+
+def _load_piper_voice(model_path: str):
+    global _piper_voice
+    from piper.voice import PiperVoice
+    _piper_voice = PiperVoice.load(model_path)
+
+
+def _piper_synthesize(sentence: str) -> bytes:
+    return b"".join(_piper_voice.synthesize_stream_raw(sentence))
+
+
+class PiperEngine(TTSEngine):
+    """Local Piper synthesis, one sentence per worker process"""
+
+    def __init__(self, model_path: str, workers: int = 2):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Piper voice model not found: {model_path}")
+
+        self.name = f"piper:{os.path.basename(model_path)}"
+        with open(f"{model_path}.json") as f:
+            self.sample_rate = json.load(f)["audio"]["sample_rate"]
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_load_piper_voice,
+            initargs=(model_path,)
+        )
+        logger.info(f"Piper engine ready: {os.path.basename(model_path)}, {workers} workers")
+
+    async def synthesize(self, text: str, voice: str) -> AsyncIterator[bytes]:
+        """Synthesize all sentences in parallel and yield them in order"""
+        # The voice is fixed by the loaded model
+        loop = asyncio.get_running_loop()
+        futures = [
+            loop.run_in_executor(self.executor, _piper_synthesize, sentence)
+            for sentence in split_sentences(text)
+        ]
+        try:
+            # The first sentence is yielded as soon as it is ready, while later ones keep going
+            for future in futures:
+                yield await future
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class FakeEngine(TTSEngine):
+    """Deterministic tones for benchmarks: one tone per sentence, length from its word count"""
+
+    name = "fake"
+
+    def __init__(self, sample_rate: int = 22050, seconds_per_word: float = 0.3, realtime_factor: float = 0.05):
+        self.sample_rate = sample_rate
+        self.seconds_per_word = seconds_per_word
+        # Synthesis time as a fraction of the audio produced
+        self.realtime_factor = realtime_factor
+
+    def tone(self, sentence: str) -> bytes:
+        digest = hashlib.sha256(sentence.encode()).digest()
+        frequency = 200 + int.from_bytes(digest[:2], "big") % 400
+        samples = int(self.sample_rate * self.seconds_per_word * max(len(sentence.split()), 1))
+        step = 2 * math.pi * frequency / self.sample_rate
+        return array.array("h", (int(8000 * math.sin(step * i)) for i in range(samples))).tobytes()
+
+    async def synthesize(self, text: str, voice: str) -> AsyncIterator[bytes]:
+        for sentence in split_sentences(text):
+            audio = self.tone(sentence)
+            await asyncio.sleep(len(audio) / (2 * self.sample_rate) * self.realtime_factor)
+            yield audio
+
+
+def create_engine() -> TTSEngine:
+    """Engine selected by TTS_ENGINE: piper (default) or fake"""
+    engine = os.getenv("TTS_ENGINE", "piper").lower()
+    if engine == "fake":
+        logger.info("Using fake TTS engine")
+        return FakeEngine(sample_rate=int(os.getenv("TTS_SAMPLE_RATE", "22050")))
+    if engine == "piper":
+        return PiperEngine(
+            model_path=os.getenv("PIPER_MODEL", "/voices/en_US-lessac-medium.onnx"),
+            workers=int(os.getenv("TTS_WORKERS", "2"))
+        )
+    raise ValueError(f"Unknown TTS engine: {engine}")
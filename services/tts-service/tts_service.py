@@ -2,28 +2,62 @@
 import asyncio
 import redis.asyncio as redis
 import json
-import base64
 from datetime import datetime
-from groq import AsyncGroq
 import os
 import logging
-import io
-from pydub import AudioSegment
+import time
+from typing import AsyncIterator, List
+from tts_engines import create_engine
+from audio_cache import AudioCache, audio_key
+from transcoder import Transcoder, negotiate
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Recurring status phrases synthesized at startup (override with TTS_PREWARM_PHRASES, "|"-separated)
+DEFAULT_PREWARM_PHRASES = [
+    "Recording started.",
+    "Recording stopped.",
+    "Still recording.",
+    "Thought saved."
+]
+
 class TTSService:
     def __init__(self):
-        self.groq_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+        self.engine = create_engine()
         self.redis_client = None
         
         # Stream names
         self.tts_request_stream = "tts_request_stream"
         self.audio_response_stream = "audio_response_stream"
         
-        # Audio settings
-        self.chunk_size = 4096  # Size of audio chunks to stream
+        # Audio settings: engines produce 16-bit mono PCM
+        self.sample_rate = self.engine.sample_rate
+        self.sample_width = 2
+        self.frame_ms = 100  # Audio per audio_response_stream entry
+        self.frame_bytes = self.sample_rate * self.sample_width * self.frame_ms // 1000
+        
+        # Encoded audio goes out in self-contained segments, so the container
+        # overhead is paid once per segment rather than once per frame
+        self.segment_ms = int(os.getenv("TTS_SEGMENT_MS", "1000"))
+        self.segment_bytes = self.sample_rate * self.sample_width * self.segment_ms // 1000
+        self.transcoder = Transcoder(workers=int(os.getenv("TTS_TRANSCODE_WORKERS", "2")))
+        
+        # Delivery runs this far ahead of real-time playback
+        self.pacing_lead_seconds = float(os.getenv("TTS_PACING_LEAD", "0.5"))
+        
+        # One response at a time per session, so audio never interleaves
+        # session_id -> [lock, requests holding or waiting for it]
+        self.session_locks = {}
+        
+        # Content-addressed cache of synthesized audio for short, recurring phrases
+        self.default_voice = "nova"
+        self.audio_codec = f"{self.engine.name}:pcm_s16le:{self.sample_rate}"
+        self.cache_max_chars = int(os.getenv("TTS_CACHE_MAX_CHARS", "200"))
+        self.audio_cache = AudioCache(
+            cache_dir=os.getenv("TTS_CACHE_DIR", "/tmp/tts_cache"),
+            max_bytes=int(os.getenv("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024
+        )
         
     async def init_redis(self):
         """Initialize Redis connection"""
@@ -37,121 +71,186 @@ class TTSService:
     
     async def process_tts_requests(self):
         """Process TTS generation requests"""
+        # Start from the newest entry; "$" would skip requests added between reads
+        latest = await self.redis_client.xrevrange(self.tts_request_stream, count=1)
+        last_id = latest[0][0] if latest else "0-0"
+        
         while True:
             try:
                 messages = await self.redis_client.xread(
-                    {self.tts_request_stream: "$"},
+                    {self.tts_request_stream: last_id},
                     block=1000
                 )
                 
                 for stream, msgs in messages:
                     for msg_id, fields in msgs:
-                        await self.generate_tts(fields)
+                        last_id = msg_id
+                        # Paced streaming takes as long as playback, so don't block other sessions
+                        asyncio.create_task(self.generate_tts(fields))
                         
             except Exception as e:
                 logger.error(f"Error processing TTS requests: {e}")
                 await asyncio.sleep(1)
     
     async def generate_tts(self, request_data: dict):
-        """Generate TTS audio using Groq API"""
+        """Generate TTS audio with the configured engine"""
         session_id = request_data.get(b"session_id", b"").decode()
         text = request_data.get(b"text", b"").decode()
-        voice = request_data.get(b"voice", b"nova").decode()
+        voice = request_data.get(b"voice", self.default_voice.encode()).decode()
         
         logger.info(f"Generating TTS for session {session_id}: {text[:50]}...")
         
+        entry = self.session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
         try:
-            # Generate audio using Groq TTS
-            # Note: As of the implementation date, Groq might not have TTS yet
-            # This is a placeholder for when it's available, or you can use another service
-            
-            # For Phase 1, we'll simulate with a simple approach
-            # In production, you'd use actual TTS API
-            audio_data = await self.generate_audio_placeholder(text, voice)
-            
-            # Stream audio chunks back to client
-            await self.stream_audio_response(session_id, audio_data)
-            
-        except Exception as e:
-            logger.error(f"Error generating TTS: {e}")
+            async with entry[0]:
+                try:
+                    codec, sample_rate = await self.output_format(session_id)
+                    
+                    # Audio is streamed back as the engine produces it
+                    await self.stream_audio_response(session_id, self.synthesize(text, voice), codec, sample_rate)
+                    
+                except Exception as e:
+                    logger.error(f"Error generating TTS: {e}")
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.session_locks[session_id]
     
-    async def generate_audio_placeholder(self, text: str, voice: str) -> bytes:
-        """Placeholder for actual TTS generation"""
-        # In production, this would call Groq TTS or another service like:
-        # - OpenAI TTS
-        # - ElevenLabs
-        # - Azure Speech Services
-        # - Local TTS like Coqui TTS
-        
-        # For now, return empty audio to complete the pipeline
-        # You can integrate with your preferred TTS service here
-        
-        # Example with OpenAI TTS (if you want to use it):
-        """
-        from openai import AsyncOpenAI
-        openai_client = AsyncOpenAI()
-        
-        response = await openai_client.audio.speech.create(
-            model="tts-1",
-            voice=voice,
-            input=text
-        )
-        
-        audio_data = response.content
-        """
+    async def synthesize(self, text: str, voice: str) -> AsyncIterator[bytes]:
+        """Yield PCM audio for text, from the cache when it has been synthesized before"""
+        key = audio_key(text, voice, self.audio_codec) if len(text) <= self.cache_max_chars else None
         
-        # Return empty audio for now
-        return b""
-    
-    async def stream_audio_response(self, session_id: str, audio_data: bytes):
-        """Stream audio response in chunks"""
-        if not audio_data:
-            # Send empty response to indicate completion
-            await self.redis_client.xadd(
-                self.audio_response_stream,
-                {
-                    "session_id": session_id,
-                    "chunk": "",
-                    "is_final": "true",
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-            )
+        cached = self.audio_cache.get(key) if key else None
+        if cached is not None:
+            # Copied out so a concurrent eviction can't unmap it mid-stream
+            audio = cached[:]
+            block = self.frame_bytes * 5
+            for offset in range(0, len(audio), block):
+                yield audio[offset:offset + block]
             return
         
-        # Convert audio to base64 chunks
-        audio_base64 = base64.b64encode(audio_data).decode()
+        produced = []
+        async for audio in self.engine.synthesize(text, voice):
+            if key:
+                produced.append(audio)
+            yield audio
+        
+        if key and produced:
+            await self.audio_cache.put(key, b"".join(produced))
+    
+    async def prewarm(self):
+        """Synthesize recurring phrases ahead of their first use"""
+        phrases = os.getenv("TTS_PREWARM_PHRASES")
+        phrases = DEFAULT_PREWARM_PHRASES if phrases is None else [p.strip() for p in phrases.split("|") if p.strip()]
         
-        # Split into chunks for streaming
-        chunks = [
-            audio_base64[i:i + self.chunk_size] 
-            for i in range(0, len(audio_base64), self.chunk_size)
+        for phrase in phrases:
+            try:
+                async for _ in self.synthesize(phrase, self.default_voice):
+                    pass
+            except Exception as e:
+                logger.error(f"Error prewarming '{phrase}': {e}")
+        logger.info(f"Audio cache prewarmed: {self.audio_cache.get_stats()}")
+    
+    async def report_stats(self):
+        """Log audio cache stats periodically"""
+        while True:
+            await asyncio.sleep(int(os.getenv("STATS_INTERVAL", "300")))
+            logger.info(f"Audio cache: {self.audio_cache.get_stats()}")
+    
+    async def output_format(self, session_id: str):
+        """Codec and sample rate negotiated from the phone's advertised capabilities"""
+        capabilities = await self.redis_client.hgetall(f"session_capabilities:{session_id}")
+        capabilities = {k.decode(): v.decode() for k, v in capabilities.items()}
+        return negotiate(capabilities, self.sample_rate)
+    
+    def audio_frame(self, session_id: str, sequence: int, chunk: bytes, codec: str,
+                    sample_rate: int, duration_ms: int, is_final: bool) -> dict:
+        return {
+            "session_id": session_id,
+            "sequence": sequence,
+            "chunk": chunk,
+            "format": "pcm_s16le" if codec == "pcm" else codec,
+            "sample_rate": sample_rate,
+            "duration_ms": duration_ms,
+            "is_final": str(is_final).lower(),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    async def publish_frames(self, frames: List[dict]):
+        """Write a batch of frames in one round trip"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for frame in frames:
+            pipe.xadd(self.audio_response_stream, frame)
+        await pipe.execute()
+    
+    async def encode_frames(self, session_id: str, sequence: int, units: List[bytes], codec: str,
+                            sample_rate: int, is_final: bool = False) -> List[dict]:
+        """Transcode PCM units in parallel and wrap them as stream entries"""
+        chunks = await asyncio.gather(*(
+            self.transcoder.transcode(pcm, self.sample_rate, codec, sample_rate) for pcm in units
+        ))
+        bytes_per_ms = self.sample_rate * self.sample_width / 1000
+        return [
+            self.audio_frame(session_id, sequence + i, chunk, codec, sample_rate,
+                             round(len(pcm) / bytes_per_ms), is_final and i == len(units) - 1)
+            for i, (pcm, chunk) in enumerate(zip(units, chunks))
         ]
+    
+    async def stream_audio_response(self, session_id: str, audio: AsyncIterator[bytes],
+                                    codec: str = "pcm", sample_rate: int = None):
+        """Stream audio as it is produced, paced just ahead of playback"""
+        sample_rate = sample_rate or self.sample_rate
+        # Raw PCM goes out in short frames, encoded audio in longer segments
+        unit_bytes = self.frame_bytes if codec == "pcm" else self.segment_bytes
         
-        # Stream each chunk
-        for i, chunk in enumerate(chunks):
-            is_final = (i == len(chunks) - 1)
+        pending = bytearray()
+        sequence = 0
+        sent_seconds = 0.0
+        started = None
+        
+        async for block in audio:
+            pending.extend(block)
+            
+            # Everything that fills a whole unit goes out in one pipeline
+            count = len(pending) // unit_bytes
+            if not count:
+                continue
+            units = [bytes(pending[i * unit_bytes:(i + 1) * unit_bytes]) for i in range(count)]
+            del pending[:count * unit_bytes]
             
-            await self.redis_client.xadd(
-                self.audio_response_stream,
-                {
-                    "session_id": session_id,
-                    "chunk": chunk,
-                    "is_final": str(is_final).lower(),
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-            )
+            await self.publish_frames(await self.encode_frames(session_id, sequence, units, codec, sample_rate))
+            sequence += count
+            sent_seconds += count * unit_bytes / (self.sample_rate * self.sample_width)
+            if started is None:
+                started = time.monotonic()
+                logger.info(f"First audio for session {session_id} published ({codec}, {sample_rate}Hz)")
             
-            # Small delay between chunks to simulate streaming
-            await asyncio.sleep(0.01)
+            # Don't get further ahead of the phone's playback than the lead
+            ahead = sent_seconds - (time.monotonic() - started) - self.pacing_lead_seconds
+            if ahead > 0:
+                await asyncio.sleep(ahead)
         
-        logger.info(f"Streamed {len(chunks)} audio chunks for session {session_id}")
+        # The final entry carries any remainder, or is empty to mark completion
+        await self.publish_frames(
+            await self.encode_frames(session_id, sequence, [bytes(pending)], codec, sample_rate, is_final=True)
+        )
+        
+        logger.info(f"Streamed {sequence + 1} audio frames for session {session_id}")
     
     async def start(self):
         """Start the TTS service"""
         await self.init_redis()
+        await self.prewarm()
+        asyncio.create_task(self.report_stats())
         
         logger.info("Starting TTS service...")
-        await self.process_tts_requests()
+        try:
+            await self.process_tts_requests()
+        finally:
+            self.engine.close()
+            self.transcoder.close()
+            self.audio_cache.close()
 
 async def main():
     service = TTSService()
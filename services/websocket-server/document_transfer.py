@@ -0,0 +1,100 @@
+# document_transfer.py
+import asyncio
+import base64
+import logging
+import math
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentTransfer:
+    """Sends one compressed blob as acknowledged chunks over a sliding window.
+
+    The client acknowledges with the number of leading chunks it holds, so
+    a reconnecting client can resume from that index. Unacknowledged chunks
+    are resent (go-back-N) when no acknowledgement arrives in time.
+    """
+
+    def __init__(
+        self,
+        blob_id: str,
+        filename: str,
+        data: bytes,
+        size: int,
+        send: Callable[[dict], Awaitable[None]],
+        start_index: int = 0,
+        chunk_size: int = 64 * 1024,
+        window: int = 4,
+        ack_timeout: float = 5.0,
+        max_retries: int = 5
+    ):
+        self.blob_id = blob_id
+        self.filename = filename
+        self.data = data
+        self.size = size
+        self.send = send
+        self.chunk_size = chunk_size
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+
+        self.chunk_count = max(math.ceil(len(data) / chunk_size), 1)
+        self.acked = min(start_index, self.chunk_count)
+        self.next_index = self.acked
+        self.ack_event = asyncio.Event()
+
+    def acknowledge(self, received: int):
+        """Client holds chunks [0, received)"""
+        if received > self.acked:
+            self.acked = min(received, self.chunk_count)
+            self.ack_event.set()
+
+    async def send_chunk(self, index: int):
+        chunk = self.data[index * self.chunk_size:(index + 1) * self.chunk_size]
+        await self.send({
+            "type": "conversation_document_chunk",
+            "blob_id": self.blob_id,
+            "index": index,
+            "data": base64.b64encode(chunk).decode()
+        })
+
+    async def run(self) -> bool:
+        """Deliver the blob; False if the client stopped acknowledging"""
+        await self.send({
+            "type": "conversation_document_start",
+            "blob_id": self.blob_id,
+            "filename": self.filename,
+            "size": self.size,
+            "compressed_size": len(self.data),
+            "encoding": "zlib",
+            "chunk_size": self.chunk_size,
+            "chunk_count": self.chunk_count,
+            "start_index": self.acked
+        })
+
+        retries = 0
+        while self.acked < self.chunk_count:
+            # Cleared before sending so an acknowledgement that arrives mid-window isn't missed
+            self.ack_event.clear()
+            while self.next_index < self.chunk_count and self.next_index - self.acked < self.window:
+                await self.send_chunk(self.next_index)
+                self.next_index += 1
+
+            try:
+                await asyncio.wait_for(self.ack_event.wait(), timeout=self.ack_timeout)
+                retries = 0
+            except asyncio.TimeoutError:
+                retries += 1
+                if retries > self.max_retries:
+                    logger.warning(f"Document {self.blob_id[:12]} stalled at chunk {self.acked}/{self.chunk_count}")
+                    return False
+                # Go back to the first unacknowledged chunk
+                self.next_index = self.acked
+
+        await self.send({
+            "type": "conversation_document_complete",
+            "blob_id": self.blob_id,
+            "filename": self.filename
+        })
+        return True
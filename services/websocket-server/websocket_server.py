@@ -7,8 +7,11 @@ import redis.asyncio as redis
 from datetime import datetime
 import logging
 import os
+import time
 from typing import Dict, Set
 import uuid
+from common.blob_store import BlobStore
+from document_transfer import DocumentTransfer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,7 +21,11 @@ class AudioStreamingServer:
         self.redis_client = None
         self.active_sessions: Dict[str, dict] = {}
         self.audio_stream = "audio_stream"
-        self.command_stream = "recording_command_stream"
+        self.recording_command_stream = "recording_command_stream"
+        self.command_stream = "command_stream"  # Executed by the audio processor's fast command path
+        self.blob_store = None
+        self.document_chunk_size = int(os.getenv("DOCUMENT_CHUNK_SIZE", str(64 * 1024)))
+        self.document_window = int(os.getenv("DOCUMENT_WINDOW", "4"))
         
     async def init_redis(self):
         """Initialize Redis connection"""
@@ -29,6 +36,7 @@ class AudioStreamingServer:
             db=0,
             decode_responses=False  # We'll handle encoding ourselves
         )
+        self.blob_store = BlobStore(self.redis_client)
         
     async def handle_client(self, websocket, path):
         """Handle WebSocket connection from Android client"""
@@ -37,7 +45,8 @@ class AudioStreamingServer:
             "websocket": websocket,
             "start_time": datetime.utcnow(),
             "status": "connected",
-            "buffer": []  # Local buffer for disconnection handling
+            "buffer": [],  # Local buffer for disconnection handling
+            "transfers": {}  # blob_id -> (DocumentTransfer, task)
         }
         
         self.active_sessions[session_id] = client_info
@@ -72,6 +81,15 @@ class AudioStreamingServer:
                 await self.handle_audio_chunk(session_id, data)
             elif message_type == "recording_status":
                 await self.handle_recording_status(session_id, data)
+            elif message_type == "capabilities":
+                await self.handle_capabilities(session_id, data)
+            elif message_type == "conversation_document_ack":
+                self.handle_document_ack(session_id, data)
+            elif message_type == "conversation_document_resume":
+                await self.start_document_transfer(
+                    session_id, data.get("blob_id", ""), data.get("filename", ""),
+                    data.get("size", 0), data.get("received", 0)
+                )
             elif message_type == "ping":
                 await self.handle_ping(session_id)
             else:
@@ -111,7 +129,9 @@ class AudioStreamingServer:
         
         command_data = {
             "session_id": session_id,
-            "command": f"recording_{status}",
+            "command": "start_recording" if status == "started" else "stop_recording",
+            "source": "client",
+            "audio_received_at": str(time.time()),
             "timestamp": datetime.utcnow().isoformat()
         }
         
@@ -130,6 +150,64 @@ class AudioStreamingServer:
             "timestamp": datetime.utcnow().isoformat()
         }))
     
+    async def handle_capabilities(self, session_id: str, data: dict):
+        """Store the audio formats the phone can play, for TTS output negotiation"""
+        key = f"session_capabilities:{session_id}"
+        await self.redis_client.hset(key, mapping={
+            "codecs": ",".join(data.get("codecs", [])),  # e.g. ["opus", "aac", "pcm"]
+            "max_sample_rate": data.get("max_sample_rate", 0)
+        })
+        await self.redis_client.expire(key, 86400)
+    
+    def handle_document_ack(self, session_id: str, data: dict):
+        """Client confirms it holds the first `received` chunks of a document"""
+        session = self.active_sessions.get(session_id)
+        entry = session["transfers"].get(data.get("blob_id")) if session else None
+        if entry:
+            entry[0].acknowledge(int(data.get("received", 0)))
+    
+    async def start_document_transfer(self, session_id: str, blob_id: str, filename: str,
+                                      size: int, start_index: int = 0):
+        """Send a stored document to the client in chunks, starting at start_index"""
+        session = self.active_sessions.get(session_id)
+        if session is None:
+            return
+        
+        compressed = await self.blob_store.get_compressed(blob_id)
+        if compressed is None:
+            await self.send_to_client(session_id, {
+                "type": "conversation_document_missing",
+                "blob_id": blob_id
+            })
+            return
+        
+        # A resume replaces any transfer of the same document in progress
+        previous = session["transfers"].pop(blob_id, None)
+        if previous:
+            previous[1].cancel()
+        
+        transfer = DocumentTransfer(
+            blob_id,
+            filename,
+            compressed,
+            int(size),
+            lambda message: self.send_to_client(session_id, message),
+            start_index=int(start_index),
+            chunk_size=self.document_chunk_size,
+            window=self.document_window
+        )
+        task = asyncio.create_task(self.run_document_transfer(session_id, transfer))
+        session["transfers"][blob_id] = (transfer, task)
+    
+    async def run_document_transfer(self, session_id: str, transfer: DocumentTransfer):
+        try:
+            if await transfer.run():
+                logger.info(f"Document {transfer.filename} delivered to {session_id}")
+        finally:
+            session = self.active_sessions.get(session_id)
+            if session and session["transfers"].get(transfer.blob_id, (None,))[0] is transfer:
+                del session["transfers"][transfer.blob_id]
+    
     async def handle_ping(self, session_id: str):
         """Handle ping/keepalive"""
         if session_id in self.active_sessions:
@@ -142,15 +220,9 @@ class AudioStreamingServer:
     async def cleanup_session(self, session_id: str):
         """Clean up when client disconnects"""
         if session_id in self.active_sessions:
-            # Save any buffered audio
-            buffer = self.active_sessions[session_id]["buffer"]
-            if buffer:
-                logger.info(f"Saving {len(buffer)} buffered chunks for session {session_id}")
-                # In production, you'd upload these to Google Drive
-                
             # Notify other services that session ended
             await self.redis_client.xadd(
-                self.command_stream,
+                self.recording_command_stream,
                 {
                     "session_id": session_id,
                     "command": "session_ended",
@@ -158,6 +230,9 @@ class AudioStreamingServer:
                 }
             )
             
+            for transfer, task in self.active_sessions[session_id]["transfers"].values():
+                task.cancel()
+            
             del self.active_sessions[session_id]
     
     async def send_to_client(self, session_id: str, message: dict):
@@ -171,23 +246,32 @@ class AudioStreamingServer:
     
     async def response_listener(self):
         """Listen for TTS responses to send back to clients"""
+        # Start from the newest entry; "$" would skip frames added between reads
+        latest = await self.redis_client.xrevrange("audio_response_stream", count=1)
+        last_id = latest[0][0] if latest else "0-0"
+        
         while True:
             try:
                 # Listen for audio responses
                 messages = await self.redis_client.xread(
-                    {"audio_response_stream": "$"},
+                    {"audio_response_stream": last_id},
                     block=100
                 )
                 
                 for stream, msgs in messages:
                     for msg_id, fields in msgs:
+                        last_id = msg_id
                         session_id = fields.get(b"session_id", b"").decode()
-                        audio_chunk = fields.get(b"chunk", b"").decode()
                         is_final = fields.get(b"is_final", b"false").decode() == "true"
                         
+                        # Frames are raw audio inside the pipeline; the JSON client gets base64
                         await self.send_to_client(session_id, {
                             "type": "audio_response",
-                            "audio": audio_chunk,
+                            "audio": base64.b64encode(fields.get(b"chunk", b"")).decode(),
+                            "sequence": int(fields.get(b"sequence", b"0")),
+                            "format": fields.get(b"format", b"pcm_s16le").decode(),
+                            "sample_rate": int(fields.get(b"sample_rate", b"0")),
+                            "duration_ms": int(fields.get(b"duration_ms", b"0")),
                             "is_final": is_final,
                             "timestamp": datetime.utcnow().isoformat()
                         })
@@ -198,25 +282,29 @@ class AudioStreamingServer:
     
     async def conversation_complete_listener(self):
         """Listen for completed conversation documents"""
+        # Start from the newest entry; "$" would skip documents added between reads
+        latest = await self.redis_client.xrevrange("conversation_complete_stream", count=1)
+        last_id = latest[0][0] if latest else "0-0"
+        
         while True:
             try:
                 messages = await self.redis_client.xread(
-                    {"conversation_complete_stream": "$"},
+                    {"conversation_complete_stream": last_id},
                     block=100
                 )
                 
                 for stream, msgs in messages:
                     for msg_id, fields in msgs:
+                        last_id = msg_id
                         session_id = fields.get(b"session_id", b"").decode()
-                        document_content = fields.get(b"content", b"").decode()
-                        filename = fields.get(b"filename", b"").decode()
                         
-                        await self.send_to_client(session_id, {
-                            "type": "conversation_document",
-                            "filename": filename,
-                            "content": document_content,
-                            "timestamp": datetime.utcnow().isoformat()
-                        })
+                        # Only a reference travels through the stream; the document is in the blob store
+                        await self.start_document_transfer(
+                            session_id,
+                            fields.get(b"blob_id", b"").decode(),
+                            fields.get(b"filename", b"").decode(),
+                            int(fields.get(b"size", b"0"))
+                        )
                         
             except Exception as e:
                 logger.error(f"Error in document listener: {e}")